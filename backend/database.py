@@ -1,9 +1,14 @@
 import logging
 import os
+import threading
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import load_env
+from .metricas import registrar_fonte
 
 # Configuração de Logs
 logger = logging.getLogger(__name__)
@@ -14,15 +19,53 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL não configurada")
 
+# Pool de conexões (por worker): tamanho fixo, extras sob pico, reciclagem em
+# segundos (-1 desliga), verificação antes do uso e espera máxima por conexão
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").strip().lower() == "true"
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_espera_checkout = {"checkouts": 0, "total_ms": 0.0, "max_ms": 0.0}
+_trava_espera = threading.Lock()
+
+def _registrar_espera(segundos: float):
+    milissegundos = segundos * 1000
+    with _trava_espera:
+        _espera_checkout["checkouts"] += 1
+        _espera_checkout["total_ms"] += milissegundos
+        _espera_checkout["max_ms"] = max(_espera_checkout["max_ms"], milissegundos)
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """Mede quanto cada checkout esperou por uma conexão (fila do pool + conexão nova)."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _registrar_espera(time.perf_counter() - inicio)
+
+def _opcoes_engine() -> dict:
+    return {
+        "pool_pre_ping": DB_POOL_PRE_PING,  # Verifica conexões antes de usar
+        "pool_size": DB_POOL_SIZE,  # Número de conexões mantidas no pool
+        "max_overflow": DB_MAX_OVERFLOW,  # Conexões extras permitidas além do pool_size
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": {"connect_timeout": 5},  # Timeout de conexão em segundos
+    }
+
 # Inicialização do Engine 
 # (Engine é a interface de comunicação com o banco de dados)
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Verifica conexões antes de usar
-    connect_args={"connect_timeout": 5}, # Timeout de conexão em segundos
-    pool_size=5,  # Número de conexões mantidas no pool
-    max_overflow=10  # Conexões extras permitidas além do pool_size
-)
+# Assíncrono (psycopg async) para as rotas da API
+async_engine = create_async_engine(DATABASE_URL, poolclass=PoolMedido, **_opcoes_engine())
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Síncrono para o que roda fora das requisições: Alembic, aquecimento,
+# reconstrução do índice e ferramentas de linha de comando
+engine = create_engine(DATABASE_URL, **_opcoes_engine())
 
 # Criação da Sessão Local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -30,13 +73,27 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base para Models
 Base = declarative_base()
 
-def get_db():
-    """Dependency para FastAPI fornecer a sessão do banco."""
-    db = SessionLocal()
-    try:
+def _estado_pool() -> dict:
+    pool = async_engine.sync_engine.pool
+    capacidade = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    with _trava_espera:
+        espera = dict(_espera_checkout)
+    return {
+        "em_uso": pool.checkedout(),
+        "ociosas": pool.checkedin(),
+        "capacidade": capacidade,
+        "utilizacao": round(pool.checkedout() / capacidade, 3) if capacidade else 0.0,
+        "checkouts": espera["checkouts"],
+        "espera_media_ms": round(espera["total_ms"] / espera["checkouts"], 2) if espera["checkouts"] else 0.0,
+        "espera_max_ms": round(espera["max_ms"], 2),
+    }
+
+registrar_fonte("banco.pool", _estado_pool)
+
+async def get_db():
+    """Dependency para FastAPI fornecer a sessão assíncrona do banco."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def create_tables():
     """Cria as tabelas no PostgreSQL."""
@@ -1,10 +1,20 @@
+import time
+_inicio_importacao = time.perf_counter()
+
+import asyncio
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from .config import load_env, get_cors_origins
-from .database import create_tables
-from .routers import auth_router, documentos_router, rag_router, conversas_router
+from .database import async_engine, create_tables
+from .routers import auth_router, documentos_router, rag_router, conversas_router, monitoramento_router, indice_router
+from .services.aquecimento import WARMUP_ON_STARTUP, aquecer, marcar_pronto, registrar_importacao
+from .services.clientes_http import aquecedor
+from .services.escrita_adiada import ESCRITA_ADIADA, fila_mensagens
+from .services.base_vetorial import reservar_chroma_local
+from .services.geracoes import coletar_geracoes_pendentes, diretorio_ativo
+from .services.perfilamento import PERFIL_ATIVO, MiddlewarePerfil
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
@@ -13,11 +23,39 @@ load_env()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # As tabelas agora são gerenciadas via Alembic migrations
-    yield   
+    # Chroma local só com um processo: um segundo worker falha aqui, antes de atender
+    reservar_chroma_local(diretorio_ativo())
+    aquecimento = None
+    if WARMUP_ON_STARTUP:
+        # Roda em segundo plano: o worker já aceita conexões e /ready responde 503 até terminar
+        aquecimento = asyncio.create_task(asyncio.to_thread(aquecer, asyncio.get_running_loop()))
+    else:
+        marcar_pronto()
+    if ESCRITA_ADIADA:
+        fila_mensagens.iniciar()
+    # HTTP_AQUECER_S > 0: mantém quentes as conexões com a Groq e o Google
+    aquecedor.iniciar()
+    # Gerações substituídas que o processo da reconstrução não chegou a apagar
+    await asyncio.to_thread(coletar_geracoes_pendentes)
+    yield
+    aquecedor.parar()
+    if ESCRITA_ADIADA:
+        # Grava o que ainda está na fila antes de fechar o pool
+        await fila_mensagens.parar()
+    if aquecimento and not aquecimento.done():
+        await aquecimento
+    await async_engine.dispose()
 
 app = FastAPI(title="Projeto RAG", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=get_cors_origins(), allow_methods=["*"], allow_headers=["*"])
+if PERFIL_ATIVO:
+    # Desligado, nem o middleware nem o gancho nas etapas existem
+    app.add_middleware(MiddlewarePerfil)
 app.include_router(auth_router)
 app.include_router(documentos_router)
 app.include_router(rag_router)
 app.include_router(conversas_router)
+app.include_router(monitoramento_router)
+app.include_router(indice_router)
+
+registrar_importacao(time.perf_counter() - _inicio_importacao)
@@ -0,0 +1,74 @@
+"""
+Contadores do processo, expostos em GET /metricas.
+
+Cada worker tem os seus: com vários workers, somar as respostas de cada um.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Latências guardadas por etapa para calcular os percentis (janela móvel)
+AMOSTRAS_LATENCIA = 1000
+
+_contadores = defaultdict(int)
+_latencias = defaultdict(lambda: deque(maxlen=AMOSTRAS_LATENCIA))
+_fontes = {}
+_trava = threading.Lock()
+# Contexto extra em volta de cada etapa (o perfilamento instala o seu); None não custa nada
+_gancho_etapa = None
+
+def incrementar(nome: str, valor: int = 1):
+    with _trava:
+        _contadores[nome] += valor
+
+def registrar_latencia(nome: str, segundos: float):
+    with _trava:
+        _latencias[nome].append(segundos)
+        _contadores[f"latencia.{nome}.contagem"] += 1
+
+def instalar_gancho_etapa(gancho):
+    """`gancho(nome)` devolve um context manager que envolve cada medir_etapa."""
+    global _gancho_etapa
+    _gancho_etapa = gancho
+
+@contextmanager
+def medir_etapa(nome: str):
+    """Registra quanto o bloco levou em `latencia.<nome>.*` (média, p50, p95 e máximo)."""
+    inicio = time.perf_counter()
+    try:
+        if _gancho_etapa is None:
+            yield
+        else:
+            with _gancho_etapa(nome):
+                yield
+    finally:
+        registrar_latencia(nome, time.perf_counter() - inicio)
+
+def _resumir_latencias(amostras) -> dict:
+    ordenadas = sorted(amostras)
+    percentil = lambda p: ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+    return {
+        "media_ms": round(1000 * sum(ordenadas) / len(ordenadas), 2),
+        "p50_ms": round(1000 * percentil(0.5), 2),
+        "p95_ms": round(1000 * percentil(0.95), 2),
+        "max_ms": round(1000 * ordenadas[-1], 2),
+    }
+
+def registrar_fonte(nome: str, funcao):
+    """Valores calculados na hora da leitura (ex.: estado de um pool), sob o prefixo `nome`."""
+    _fontes[nome] = funcao
+
+def instantaneo() -> dict:
+    with _trava:
+        dados = dict(sorted(_contadores.items()))
+        latencias = {nome: list(amostras) for nome, amostras in _latencias.items() if amostras}
+    for nome, amostras in sorted(latencias.items()):
+        dados.update({f"latencia.{nome}.{chave}": valor for chave, valor in _resumir_latencias(amostras).items()})
+    for nome, funcao in _fontes.items():
+        try:
+            valores = funcao()
+        except Exception as e:
+            valores = {"erro": str(e)}
+        dados.update({f"{nome}.{chave}": valor for chave, valor in valores.items()})
+    return dados
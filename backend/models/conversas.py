@@ -8,7 +8,7 @@ class Conversa(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     titulo = Column(String, nullable=False)
-    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True, index=True)
     criado_em = Column(DateTime, default=datetime.utcnow)
 
     mensagens = relationship("Mensagem", back_populates="conversa", cascade="all, delete-orphan")
@@ -18,7 +18,7 @@ class Mensagem(Base):
     __tablename__ = "mensagens"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversa_id = Column(Integer, ForeignKey("conversas.id"), nullable=False)
+    conversa_id = Column(Integer, ForeignKey("conversas.id"), nullable=False, index=True)
     conteudo = Column(Text, nullable=False)
     remetente = Column(String, nullable=False)
     criado_em = Column(DateTime, default=datetime.utcnow)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, Integer, LargeBinary, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, LargeBinary, String, Text
 from ..database import Base
 
 class Documento(Base):
@@ -12,4 +12,10 @@ class Documento(Base):
     conteudo_binario = Column(LargeBinary, nullable=True)
     preprocessado = Column(Boolean, default=False)
     numero_chunks = Column("numero_chuncks", Integer, default=0)
+    # Dono da coleção vetorial onde os blocos foram indexados
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
+    # SHA-256 do PDF: a ingestão em lote pula arquivos já indexados com o mesmo conteúdo
+    hash_conteudo = Column(String(64), nullable=True, index=True)
+    # Última falha de processamento (None quando o documento está indexado ou pendente)
+    erro_processamento = Column(Text, nullable=True)
     criado_em = Column(DateTime, default=datetime.utcnow)
@@ -1,7 +1,9 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..deps import get_current_user
 from ..models import Usuario
@@ -11,16 +13,17 @@ from ..security import verify_password, get_password_hash, create_access_token
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(Usuario).filter(Usuario.email == user.email).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = (await db.execute(select(Usuario).where(Usuario.email == user.email))).scalar_one_or_none()
     if db_user:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
 
-    hashed_password = get_password_hash(user.password)
+    # bcrypt é lento de propósito: fora do event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     new_user = Usuario(email=user.email, senha_hash=hashed_password, nome=user.nome)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.get("/users/me", response_model=UserResponse)
@@ -28,9 +31,9 @@ async def read_users_me(current_user: Usuario = Depends(get_current_user)):
     return current_user
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(Usuario).filter(Usuario.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.senha_hash):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = (await db.execute(select(Usuario).where(Usuario.email == form_data.username))).scalar_one_or_none()
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.senha_hash):
         raise HTTPException(
             status_code=401,
             detail="Email ou senha incorretos",
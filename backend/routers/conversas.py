@@ -1,29 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..deps import get_current_user
 from ..models import Conversa, Mensagem, Usuario
 from ..schemas import ConversaResponse, MensagemResponse
+from ..services.escrita_adiada import ESCRITA_ADIADA, fila_mensagens
 
 router = APIRouter()
 
+def _validar_cache(request: Request, response: Response, prefixo: str, total: int, ultimo_id: Optional[int]):
+    """
+    Conversas e mensagens só crescem: quantidade e maior id bastam como versão.
+    Devolve a resposta 304 se o cliente já tem essa versão; senão marca a
+    resposta com ETag e X-Total-Count (para o cliente conferir o delta).
+    """
+    etag = f'W/"{prefixo}-{total}-{ultimo_id or 0}"'
+    cabecalhos = {"ETag": etag, "X-Total-Count": str(total), "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cabecalhos)
+    response.headers.update(cabecalhos)
+    return None
+
 @router.get("/conversas/", response_model=list[ConversaResponse])
 async def listar_conversas(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    since_id: Optional[int] = None,
+    after: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
-    conversas = db.query(Conversa).filter(Conversa.usuario_id == current_user.id).order_by(Conversa.criado_em.desc()).all()
+    """since_id/after devolvem só as conversas criadas depois do id/data informados."""
+    total, ultimo_id = (await db.execute(
+        select(func.count(Conversa.id), func.max(Conversa.id)).where(Conversa.usuario_id == current_user.id)
+    )).one()
+    nao_modificado = _validar_cache(request, response, f"c{current_user.id}", total, ultimo_id)
+    if nao_modificado:
+        return nao_modificado
+
+    consulta = select(Conversa).where(Conversa.usuario_id == current_user.id)
+    if since_id is not None:
+        consulta = consulta.where(Conversa.id > since_id)
+    if after is not None:
+        consulta = consulta.where(Conversa.criado_em > after)
+    conversas = (await db.execute(consulta.order_by(Conversa.criado_em.desc()))).scalars().all()
     return conversas
 
 @router.get("/conversas/{conversa_id}/mensagens/", response_model=list[MensagemResponse])
 async def listar_mensagens(
     conversa_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    since_id: Optional[int] = None,
+    after: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
-    conversa = db.query(Conversa).filter(Conversa.id == conversa_id, Conversa.usuario_id == current_user.id).first()
+    """since_id/after devolvem só as mensagens gravadas depois do id/data informados."""
+    conversa = (await db.execute(
+        select(Conversa).where(Conversa.id == conversa_id, Conversa.usuario_id == current_user.id)
+    )).scalar_one_or_none()
     if not conversa:
         raise HTTPException(status_code=404, detail="Conversa não encontrada ou acesso negado")
+    if ESCRITA_ADIADA:
+        await fila_mensagens.descarregar()
+
+    total, ultimo_id = (await db.execute(
+        select(func.count(Mensagem.id), func.max(Mensagem.id)).where(Mensagem.conversa_id == conversa_id)
+    )).one()
+    nao_modificado = _validar_cache(request, response, f"m{conversa_id}", total, ultimo_id)
+    if nao_modificado:
+        return nao_modificado
 
-    mensagens = db.query(Mensagem).filter(Mensagem.conversa_id == conversa_id).order_by(Mensagem.criado_em.asc()).all()
+    consulta = select(Mensagem).where(Mensagem.conversa_id == conversa_id)
+    if since_id is not None:
+        consulta = consulta.where(Mensagem.id > since_id)
+    if after is not None:
+        consulta = consulta.where(Mensagem.criado_em > after)
+    mensagens = (await db.execute(
+        consulta.order_by(Mensagem.criado_em.asc(), Mensagem.id.asc())
+    )).scalars().all()
     return mensagens
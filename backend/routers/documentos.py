@@ -1,70 +1,135 @@
 import os
+import hashlib
 from fastapi import APIRouter, Depends, UploadFile, HTTPException
-from sqlalchemy.orm import Session
-from ..config import DOCS_DIR, CHROMA_DIR
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import DOCS_DIR, load_env
 from ..database import get_db
-from ..deps import get_current_user
+from ..deps import ADMIN_EMAILS, get_current_user
 from ..models import Documento, Usuario
 from ..schemas import DocumentoResponse
-from ..services.rag_engine import embeddings, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS
+from ..services.rag_engine import obter_embeddings
+from ..services.base_vetorial import nome_colecao
+from ..services.geracoes import indice_ativo, estado_reconstrucao
+from ..services.admissao import admissao
+from ..services.cache_paginas import hash_arquivo
 from ..services.documentos_service import (
     validar_upload_pdf,
     salvar_pdf,
     restaurar_pdf_se_necessario,
-    carregar_paginas_pdf,
-    splitar_paginas,
-    persistir_blocos,
+    indexar_pdf,
     criar_ou_validar_base,
+    apagar_documento_indexado,
+    desvincular_blocos,
+    fontes_documento,
+    hashes_indexados,
+    sobreviventes_na_colecao,
 )
 
+load_env()
+
 router = APIRouter()
 
-MAX_FILE_BYTES = 10 * 1024 * 1024
+# A ingestão em pipeline não carrega o PDF inteiro na memória, então o limite pode subir
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+
+def _exigir_dono(documento: Documento, usuario: Usuario):
+    # Sem dono ainda (enviado mas nunca processado), qualquer usuário pode mexer, como pode reenviar
+    if documento.usuario_id not in (None, usuario.id) and usuario.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Documento pertence a outro usuário.")
+
+async def _sobreviventes(db: AsyncSession, documento: Documento, colecao: str, hashes) -> dict:
+    """Por hash, outro documento processado com esse conteúdo na mesma coleção (dono dos blocos em comum)."""
+    hashes = {h for h in hashes if h}
+    if not hashes:
+        return {}
+    candidatos = (await db.execute(
+        select(Documento).where(Documento.hash_conteudo.in_(hashes), Documento.id != documento.id).order_by(Documento.id)
+    )).scalars().all()
+    return sobreviventes_na_colecao(candidatos, documento, colecao)
+
+async def _desvincular(db: AsyncSession, documento: Documento, base_vetorial, colecao: str,
+                       manter_hash: str = None) -> int:
+    """
+    Tira da coleção os blocos indexados a partir do documento, menos os do
+    conteúdo `manter_hash`; os que outro documento com o mesmo conteúdo usa
+    passam para ele. Devolve quantos blocos saíram.
+    """
+    fontes = fontes_documento(documento, DOCS_DIR)
+    hashes = await run_in_threadpool(hashes_indexados, base_vetorial, fontes)
+    hashes.discard(manter_hash)
+    if not hashes:
+        return 0
+    sobreviventes = await _sobreviventes(db, documento, colecao, hashes)
+    removidos, repassados = await run_in_threadpool(
+        desvincular_blocos, base_vetorial, fontes,
+        {h: outro.caminho_arquivo for h, outro in sobreviventes.items()}, manter_hash
+    )
+    if repassados:
+        for hash_bloco, quantidade in repassados.items():
+            sobreviventes[hash_bloco].numero_chunks = (sobreviventes[hash_bloco].numero_chunks or 0) + quantidade
+        await db.commit()
+    return removidos
 
 @router.post("/carregar/", response_model=DocumentoResponse)
 async def carregar_documentos(
     file: UploadFile,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ) -> DocumentoResponse:
     validar_upload_pdf(file, MAX_FILE_BYTES)
+    documento_existente = (await db.execute(
+        select(Documento).where(Documento.nome_arquivo == file.filename)
+    )).scalar_one_or_none()
+    if documento_existente:
+        # Antes de gravar: o arquivo no disco é o do documento existente
+        _exigir_dono(documento_existente, current_user)
     caminho_arquivo, content = await salvar_pdf(file, DOCS_DIR)
 
-    documento_existente = db.query(Documento).filter(Documento.nome_arquivo == file.filename).first()
     if documento_existente:
         documento_existente.conteudo_binario = content
+        documento_existente.hash_conteudo = hashlib.sha256(content).hexdigest()
         documento_existente.preprocessado = False
         documento_existente.numero_chunks = 0
-        db.commit()
-        db.refresh(documento_existente)
+        await db.commit()
+        await db.refresh(documento_existente)
         return documento_existente
 
     doc = Documento(
         nome_arquivo=file.filename,
         nome_original=file.filename,
         caminho_arquivo=caminho_arquivo,
-        conteudo_binario=content
+        conteudo_binario=content,
+        hash_conteudo=hashlib.sha256(content).hexdigest()
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    await db.commit()
+    await db.refresh(doc)
     return doc
 
 @router.post("/processar/{filename}")
 async def processar_documento(
     filename: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     caminho_pdf = os.path.join(DOCS_DIR, filename)
+    colecao = nome_colecao(current_user.id)
+    diretorio, configuracao = indice_ativo()
+    embeddings = obter_embeddings(configuracao["modelo_embeddings"])
 
-    documento_registro = db.query(Documento).filter(Documento.nome_arquivo == filename).first()
+    documento_registro = (await db.execute(
+        select(Documento).where(Documento.nome_arquivo == filename)
+    )).scalar_one_or_none()
     if not documento_registro:
         raise HTTPException(status_code=404, detail="Documento não registrado no banco de dados.")
+    _exigir_dono(documento_registro, current_user)
 
-    if documento_registro.preprocessado:
+    # Só reaproveita se os blocos estão na coleção de quem está pedindo
+    if documento_registro.preprocessado and documento_registro.usuario_id == current_user.id:
         try:
-            _, total = criar_ou_validar_base(embeddings, CHROMA_DIR)
+            _, total = await run_in_threadpool(criar_ou_validar_base, embeddings, diretorio, colecao)
             if total > 0:
                 return {
                     "message": "Documento já processado e verificado.",
@@ -74,21 +139,40 @@ async def processar_documento(
         except Exception:
             pass
 
-    restaurar_pdf_se_necessario(caminho_pdf, documento_registro, DOCS_DIR)
+    await run_in_threadpool(restaurar_pdf_se_necessario, caminho_pdf, documento_registro, DOCS_DIR)
 
     try:
-        paginas_pdf = carregar_paginas_pdf(caminho_pdf)
-        blocos = splitar_paginas(paginas_pdf, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SEPARATORS)
-        persistir_blocos(blocos, embeddings, CHROMA_DIR)
+        # Conteúdo trocado por /carregar/: os blocos do hash anterior têm o mesmo "source"
+        # e voltariam nas buscas junto com os novos
+        hash_atual = await run_in_threadpool(hash_arquivo, caminho_pdf)
+        base_vetorial, _ = await run_in_threadpool(criar_ou_validar_base, embeddings, diretorio, colecao)
+        await _desvincular(db, documento_registro, base_vetorial, colecao, manter_hash=hash_atual)
+
+        # Leitura do PDF e embeddings são bloqueantes: fora do event loop,
+        # disputando as mesmas vagas das perguntas
+        async with admissao.vaga(current_user.id):
+            numero_blocos = await run_in_threadpool(
+                indexar_pdf, caminho_pdf, embeddings, diretorio, colecao, configuracao
+            )
 
+        # Documentos são globais pelo nome: quando um admin processa o de outro usuário, os
+        # blocos saem da coleção anterior, que depois nem poderia mais apagá-los
+        dono_anterior = documento_registro.usuario_id
+        if dono_anterior is not None and nome_colecao(dono_anterior) != colecao:
+            colecao_anterior = nome_colecao(dono_anterior)
+            base_anterior, _ = await run_in_threadpool(criar_ou_validar_base, embeddings, diretorio, colecao_anterior)
+            await _desvincular(db, documento_registro, base_anterior, colecao_anterior)
+
+        documento_registro.usuario_id = current_user.id
         documento_registro.preprocessado = True
-        documento_registro.numero_chunks = len(blocos)
-        db.commit()
+        documento_registro.numero_chunks = numero_blocos
+        documento_registro.erro_processamento = None
+        await db.commit()
 
         return {
             "message": "Documento processado e armazenado com sucesso.",
             "filename": filename,
-            "numero_chunks": len(blocos)
+            "numero_chunks": numero_blocos
         }
     except HTTPException:
         raise
@@ -104,3 +188,48 @@ async def listar_documentos(current_user: Usuario = Depends(get_current_user)):
         return {"documentos": documentos, "total": len(documentos)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro {str(e)}")
+
+@router.delete("/documentos/{documento_id}")
+async def apagar_documento(
+    documento_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    documento = await db.get(Documento, documento_id)
+    if not documento:
+        raise HTTPException(status_code=404, detail="Documento não encontrado.")
+    _exigir_dono(documento, current_user)
+    # A geração nova pode já ter copiado os blocos: o documento voltaria quando ela fosse ativada
+    if estado_reconstrucao()["em_andamento"]:
+        raise HTTPException(status_code=409, detail="Reconstrução do índice em andamento; tente novamente depois.")
+
+    diretorio, configuracao = indice_ativo()
+    embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+    colecao = nome_colecao(documento.usuario_id)
+    mesmo_conteudo = documento.hash_conteudo and (await db.execute(
+        select(Documento.id).where(Documento.hash_conteudo == documento.hash_conteudo, Documento.id != documento.id)
+    )).first() is not None
+    try:
+        base_vetorial, _ = await run_in_threadpool(criar_ou_validar_base, embeddings, diretorio, colecao)
+        hashes = await run_in_threadpool(hashes_indexados, base_vetorial, fontes_documento(documento, DOCS_DIR))
+        sobreviventes = await _sobreviventes(db, documento, colecao, hashes | {documento.hash_conteudo})
+        blocos_removidos, repassados = await run_in_threadpool(
+            apagar_documento_indexado, documento, base_vetorial, DOCS_DIR,
+            {h: outro.caminho_arquivo for h, outro in sobreviventes.items()}, bool(mesmo_conteudo)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao apagar: {str(e)}")
+
+    # Os blocos em comum agora são do documento que ficou
+    for hash_bloco, quantidade in repassados.items():
+        sobreviventes[hash_bloco].numero_chunks = (sobreviventes[hash_bloco].numero_chunks or 0) + quantidade
+    await db.delete(documento)
+    await db.commit()
+    return {
+        "message": "Documento apagado.",
+        "id": documento_id,
+        "filename": documento.nome_arquivo,
+        "blocos_removidos": blocos_removidos,
+    }
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from ..deps import get_current_admin
+from ..metricas import incrementar
+from ..models import Usuario
+from ..schemas import ReconstrucaoRequest
+from ..services.base_vetorial import compactar_indice
+from ..services.geracoes import agendar_reconstrucao, estado_reconstrucao, indice_ativo
+from ..services.rag_engine import obter_embeddings
+
+router = APIRouter()
+
+@router.post("/indice/reconstruir", status_code=202)
+async def reconstruir_indice(
+    pedido: ReconstrucaoRequest,
+    current_user: Usuario = Depends(get_current_admin)
+):
+    configuracao = pedido.model_dump(exclude_none=True)
+    if not agendar_reconstrucao(configuracao, motivo=f"manual ({current_user.email})"):
+        raise HTTPException(status_code=409, detail="Já existe uma reconstrução em andamento")
+    return estado_reconstrucao()
+
+@router.get("/indice/estado")
+async def obter_estado_indice(current_user: Usuario = Depends(get_current_admin)):
+    return estado_reconstrucao()
+
+@router.post("/indice/compactar")
+async def compactar_indice_ativo(current_user: Usuario = Depends(get_current_admin)):
+    diretorio, configuracao = indice_ativo()
+    embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+    try:
+        relatorio = await run_in_threadpool(compactar_indice, embeddings, diretorio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    incrementar("indice.bytes_recuperados", max(relatorio["bytes_recuperados"], 0))
+    return relatorio
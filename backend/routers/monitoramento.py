@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from ..metricas import instantaneo
+from ..services.aquecimento import estado_prontidao
+
+router = APIRouter()
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    estado = estado_prontidao()
+    return JSONResponse(status_code=200 if estado["pronto"] else 503, content=estado)
+
+@router.get("/metricas")
+async def metricas():
+    return instantaneo()
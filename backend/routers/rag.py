@@ -1,58 +1,175 @@
+import asyncio
+import os
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import load_env
 from ..database import get_db
 from ..deps import get_current_user
 from ..models import Conversa, Mensagem, Usuario
-from ..schemas import QueryRequest, QueryResponse
-from ..services.rag_engine import embeddings, llm
+from ..schemas import QueryRequest, QueryResponse, LoteRequest, LoteResponse
+from ..services.rag_engine import obter_embeddings, obter_llm
+from ..services.base_vetorial import nome_colecao
+from ..services.geracoes import indice_ativo
+from ..services.compressao import comprimir_contexto
+from ..services.admissao import admissao
+from ..services.cache_conversa import conjuntos_conversa
 from ..services.rag_service import (
     carregar_base_vetorial,
     carregar_conversa,
     carregar_historico,
     reformular_pergunta,
-    buscar_documentos,
+    buscar_documentos_conversa,
+    buscar_documentos_lote,
     montar_contexto,
+    montar_fontes,
     gerar_resposta,
     registrar_mensagens,
+    registrar_mensagens_lote,
 )
 
+load_env()
+
+# /perguntas/lote: tamanho máximo do lote e respostas geradas ao mesmo tempo
+LOTE_MAX_PERGUNTAS = int(os.getenv("LOTE_MAX_PERGUNTAS", "100"))
+LOTE_CONCORRENCIA = int(os.getenv("LOTE_CONCORRENCIA", "4"))
+
 router = APIRouter()
 
 @router.post("/pergunta/", response_model=QueryResponse)
 async def responder_pergunta(
     query: QueryRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     try:
-        base_vetorial, _ = carregar_base_vetorial(embeddings)
+        # Modelo pequeno para reescrever a pergunta, o grande só para a resposta
+        llm_reformulacao = obter_llm("reformulacao")
+        llm = obter_llm("resposta")
+        diretorio, configuracao = indice_ativo()
+        embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+        colecao = nome_colecao(current_user.id)
+        base_vetorial, total_vetores = await run_in_threadpool(
+            carregar_base_vetorial, embeddings, colecao, diretorio
+        )
         conversa_atual = None
         historico_msgs = []
 
         if query.conversa_id:
-            conversa_atual = carregar_conversa(db, query.conversa_id, current_user.id)
-            historico_msgs = carregar_historico(conversa_atual, db)
+            conversa_atual = await carregar_conversa(db, query.conversa_id, current_user.id)
+            historico_msgs = await carregar_historico(conversa_atual, db)
+        # Blocos recuperados nas últimas mensagens desta conversa (vazio numa conversa nova)
+        conjunto = conjuntos_conversa.obter((diretorio, colecao, query.conversa_id), total_vetores)
 
-        pergunta_busca = reformular_pergunta(query.pergunta, historico_msgs, llm)
-        documentos = buscar_documentos(base_vetorial, pergunta_busca)
-        context = montar_contexto(documentos)
-        resposta = gerar_resposta(query.pergunta, context, historico_msgs, llm)
+        # LLM e busca bloqueiam: rodam no threadpool, onde requisições idênticas
+        # simultâneas se juntam à mesma chamada em andamento. A vaga limita
+        # quantas rodam por usuário e no worker (429 se a espera passar do prazo)
+        async with admissao.vaga(current_user.id):
+            pergunta_busca = await run_in_threadpool(reformular_pergunta, query.pergunta, historico_msgs, llm_reformulacao)
+            resultados = await run_in_threadpool(buscar_documentos_conversa, base_vetorial, pergunta_busca, conjunto)
+            documentos = [doc for doc, _ in resultados]
+            documentos_contexto, compressao = await run_in_threadpool(
+                comprimir_contexto, pergunta_busca, documentos, embeddings
+            )
+            context = montar_contexto(documentos_contexto)
+            resposta = await run_in_threadpool(gerar_resposta, query.pergunta, context, historico_msgs, llm)
 
         if not conversa_atual:
             conversa_atual = Conversa(titulo=query.pergunta[:50], usuario_id=current_user.id)
+            # Gravada junto com as mensagens, no mesmo commit
             db.add(conversa_atual)
-            db.commit()
-            db.refresh(conversa_atual)
 
-        registrar_mensagens(db, conversa_atual, query.pergunta, resposta)
+        await registrar_mensagens(db, conversa_atual, query.pergunta, resposta)
+        conjuntos_conversa.guardar((diretorio, colecao, conversa_atual.id), conjunto)
 
         return {
             "resposta": resposta.content,
-            "sources": [doc.metadata for doc in documentos],
+            "sources": montar_fontes(resultados),
             "num_docs": len(documentos),
-            "conversa_id": conversa_atual.id
+            "conversa_id": conversa_atual.id,
+            "compressao": compressao,
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+@router.post("/perguntas/lote", response_model=LoteResponse)
+async def responder_lote(
+    lote: LoteRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Perguntas independentes (sem histórico): um embedding em lote, as buscas
+    juntas e as respostas geradas em paralelo até LOTE_CONCORRENCIA. Uma
+    pergunta que falha não derruba as outras.
+    """
+    if len(lote.perguntas) > LOTE_MAX_PERGUNTAS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {LOTE_MAX_PERGUNTAS} perguntas por lote.")
+    # Cada pergunta do lote gasta uma ficha do usuário; as vagas são pegas por geração
+    await admissao.reservar(current_user.id, len(lote.perguntas))
+    try:
+        llm = obter_llm("resposta")
+        diretorio, configuracao = indice_ativo()
+        embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+        base_vetorial, _ = await run_in_threadpool(
+            carregar_base_vetorial, embeddings, nome_colecao(current_user.id), diretorio
+        )
+        resultados_por_pergunta = await run_in_threadpool(buscar_documentos_lote, base_vetorial, lote.perguntas)
+    except Exception as e:
+        # Nenhuma resposta foi gerada: as fichas do lote voltam para o balde
+        admissao.devolver(current_user.id, len(lote.perguntas))
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+    semaforo = asyncio.Semaphore(LOTE_CONCORRENCIA)
+
+    def gerar(pergunta: str, resultados):
+        documentos, compressao = comprimir_contexto(pergunta, [doc for doc, _ in resultados], embeddings)
+        return gerar_resposta(pergunta, montar_contexto(documentos), [], llm), compressao
+
+    async def responder(pergunta: str, resultados):
+        async with semaforo, admissao.vaga(current_user.id, custo=0):
+            return await run_in_threadpool(gerar, pergunta, resultados)
+
+    respostas = await asyncio.gather(
+        *(responder(p, d) for p, d in zip(lote.perguntas, resultados_por_pergunta)),
+        return_exceptions=True,
+    )
+
+    resultados = await _montar_resultados_lote(db, current_user, lote, resultados_por_pergunta, respostas)
+    return {
+        "resultados": resultados,
+        "total": len(resultados),
+        "falhas": sum(1 for r in resultados if "erro" in r),
+    }
+
+async def _montar_resultados_lote(db, current_user, lote, resultados_por_pergunta, respostas):
+    resultados, trocas = [], []
+    for indice, (pergunta, resultados_busca, gerado) in enumerate(zip(lote.perguntas, resultados_por_pergunta, respostas)):
+        if isinstance(gerado, Exception):
+            resultados.append({"indice": indice, "pergunta": pergunta, "erro": str(getattr(gerado, "detail", gerado))})
+            continue
+        resposta, compressao = gerado
+        resultado = {
+            "indice": indice,
+            "pergunta": pergunta,
+            "resposta": resposta.content,
+            "sources": montar_fontes(resultados_busca),
+            "num_docs": len(resultados_busca),
+            "conversa_id": None,
+            "compressao": compressao,
+        }
+        if lote.salvar_conversas:
+            conversa = Conversa(titulo=pergunta[:50], usuario_id=current_user.id)
+            db.add(conversa)
+            trocas.append((resultado, conversa, pergunta, resposta))
+        resultados.append(resultado)
+    if trocas:
+        # Todas as conversas e mensagens do lote numa transação só
+        await registrar_mensagens_lote(db, [(conversa, pergunta, resposta) for _, conversa, pergunta, resposta in trocas])
+        for resultado, conversa, _, _ in trocas:
+            resultado["conversa_id"] = conversa.id
+    return resultados
@@ -1,7 +1,8 @@
 from .auth import UserBase, UserCreate, UserResponse, Token
 from .documentos import DocumentoResponse
 from .conversas import ConversaResponse, MensagemResponse
-from .rag import QueryRequest, QueryResponse
+from .rag import QueryRequest, QueryResponse, LoteRequest, LoteResponse, RespostaLote
+from .indice import ReconstrucaoRequest
 
 __all__ = [
     "UserBase",
@@ -13,4 +14,8 @@ __all__ = [
     "MensagemResponse",
     "QueryRequest",
     "QueryResponse",
+    "LoteRequest",
+    "LoteResponse",
+    "RespostaLote",
+    "ReconstrucaoRequest",
 ]
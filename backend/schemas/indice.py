@@ -0,0 +1,7 @@
+from typing import Optional
+from pydantic import BaseModel
+
+class ReconstrucaoRequest(BaseModel):
+    modelo_embeddings: Optional[str] = None
+    chunk_size: Optional[int] = None
+    chunk_overlap: Optional[int] = None
@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class QueryRequest(BaseModel):
     pergunta: str
@@ -10,3 +10,25 @@ class QueryResponse(BaseModel):
     sources: list[dict]
     num_docs: int
     conversa_id: Optional[int] = None
+    # Tokens estimados do contexto antes/depois da compressão (None se desligada)
+    compressao: Optional[dict] = None
+
+class LoteRequest(BaseModel):
+    perguntas: list[str] = Field(min_length=1)
+    # Por padrão o lote não cria conversas; com True cada pergunta vira uma conversa
+    salvar_conversas: bool = False
+
+class RespostaLote(BaseModel):
+    indice: int
+    pergunta: str
+    resposta: Optional[str] = None
+    sources: list[dict] = []
+    num_docs: int = 0
+    conversa_id: Optional[int] = None
+    compressao: Optional[dict] = None
+    erro: Optional[str] = None
+
+class LoteResponse(BaseModel):
+    resultados: list[RespostaLote]
+    total: int
+    falhas: int
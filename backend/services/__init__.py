@@ -1,4 +1,3 @@
-from .documentos_service import processar_documento_service
 from .rag_service import (
     carregar_base_vetorial,
     carregar_conversa,
@@ -9,9 +8,9 @@ from .rag_service import (
     gerar_resposta,
     registrar_mensagens
 )
+from .base_vetorial import abrir_base_vetorial, adicionar_documentos
 
 __all__ = [
-    "processar_documento_service",
     "carregar_base_vetorial",
     "carregar_conversa",
     "carregar_historico",
@@ -19,5 +18,7 @@ __all__ = [
     "buscar_documentos",
     "montar_contexto",
     "gerar_resposta",
-    "registrar_mensagens"
+    "registrar_mensagens",
+    "abrir_base_vetorial",
+    "adicionar_documentos"
 ]
@@ -0,0 +1,172 @@
+"""
+Controle de admissão das rotas que chamam o LLM ou indexam documentos.
+
+Cada usuário tem um balde de fichas (ADMISSAO_TAXA fichas por segundo, até
+ADMISSAO_RAJADA acumuladas) e o worker tem ADMISSAO_CONCORRENCIA vagas. Quem
+chega sem ficha ou sem vaga espera numa fila limitada (ADMISSAO_FILA) por no
+máximo ADMISSAO_ESPERA_S; passou disso, ou com a fila cheia, recebe 429 com
+Retry-After na hora, em vez de segurar a conexão até o timeout do cliente.
+Os limites valem por worker.
+"""
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from ..config import load_env
+from ..metricas import incrementar, registrar_fonte
+
+load_env()
+
+ADMISSAO_ATIVA = os.getenv("ADMISSAO_ATIVA", "true").strip().lower() == "true"
+ADMISSAO_TAXA = float(os.getenv("ADMISSAO_TAXA", "1"))
+ADMISSAO_RAJADA = float(os.getenv("ADMISSAO_RAJADA", "10"))
+ADMISSAO_CONCORRENCIA = int(os.getenv("ADMISSAO_CONCORRENCIA", "16"))
+ADMISSAO_FILA = int(os.getenv("ADMISSAO_FILA", "64"))
+ADMISSAO_ESPERA_S = float(os.getenv("ADMISSAO_ESPERA_S", "20"))
+
+# Baldes cheios são descartados quando passar disso (usuário inativo = balde cheio)
+_MAX_BALDES = 10000
+
+def _recusar(motivo: str, detalhe: str, espera_s: float):
+    incrementar(f"admissao.recusadas_{motivo}")
+    return HTTPException(
+        status_code=429,
+        detail=detalhe,
+        headers={"Retry-After": str(max(1, math.ceil(espera_s)))},
+    )
+
+class ControleAdmissao:
+    def __init__(self):
+        self._baldes = {}
+        self._vagas = None
+        self._em_uso = 0
+        self._esperando = 0
+        self._espera_total_s = 0.0
+        self._espera_max_s = 0.0
+        self._admitidas = 0
+        # Média móvel de quanto tempo uma vaga fica ocupada, para estimar o Retry-After
+        self._ocupacao_media_s = 1.0
+
+    def _reservar_fichas(self, usuario_id, custo: float) -> float:
+        """Tira as fichas do balde (pode ficar negativo) e devolve quanto esperar por elas."""
+        agora = time.monotonic()
+        fichas, ultimo = self._baldes.get(usuario_id, (ADMISSAO_RAJADA, agora))
+        fichas = min(ADMISSAO_RAJADA, fichas + (agora - ultimo) * ADMISSAO_TAXA)
+        espera = max(0.0, (custo - fichas) / ADMISSAO_TAXA)
+        if espera > ADMISSAO_ESPERA_S:
+            self._baldes[usuario_id] = (fichas, agora)
+            raise _recusar(
+                "usuario", "Muitas perguntas seguidas. Aguarde um pouco e tente de novo.", espera
+            )
+        self._baldes[usuario_id] = (fichas - custo, agora)
+        if len(self._baldes) > _MAX_BALDES:
+            self._descartar_baldes_cheios(agora)
+        return espera
+
+    def _descartar_baldes_cheios(self, agora: float):
+        for usuario_id, (fichas, ultimo) in list(self._baldes.items()):
+            if fichas + (agora - ultimo) * ADMISSAO_TAXA >= ADMISSAO_RAJADA:
+                del self._baldes[usuario_id]
+
+    def _devolver_fichas(self, usuario_id, custo: float):
+        fichas, ultimo = self._baldes.get(usuario_id, (ADMISSAO_RAJADA, time.monotonic()))
+        self._baldes[usuario_id] = (min(ADMISSAO_RAJADA, fichas + custo), ultimo)
+
+    def _entrar_na_fila(self):
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(ADMISSAO_CONCORRENCIA)
+        if self._esperando >= ADMISSAO_FILA:
+            raise _recusar("fila", "Servidor ocupado. Tente de novo em instantes.", self._estimar_espera())
+        self._esperando += 1
+
+    async def reservar(self, usuario_id, custo: float = 1):
+        """
+        Só as fichas do usuário, sem vaga (ex.: cobrar um lote inteiro de uma vez).
+        Um custo que nem o balde cheio mais a espera máxima cobrem recebe 400: esperar não adianta.
+        """
+        if not ADMISSAO_ATIVA or not custo:
+            return
+        maximo = ADMISSAO_RAJADA + ADMISSAO_TAXA * ADMISSAO_ESPERA_S
+        if custo > maximo:
+            incrementar("admissao.recusadas_custo")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Pedido grande demais para o limite por usuário: no máximo {math.floor(maximo)} de uma vez.",
+            )
+        self._entrar_na_fila()
+        try:
+            espera = self._reservar_fichas(usuario_id, custo)
+            if espera:
+                try:
+                    await asyncio.sleep(espera)
+                except asyncio.CancelledError:
+                    # Cliente desistiu: as fichas voltam para o balde
+                    self._devolver_fichas(usuario_id, custo)
+                    raise
+        finally:
+            self._esperando -= 1
+
+    @asynccontextmanager
+    async def vaga(self, usuario_id, custo: float = 1):
+        """
+        Gasta `custo` fichas do usuário e segura uma vaga do worker durante o
+        bloco. Com custo 0, só a vaga (as fichas já foram cobradas em reservar).
+        """
+        if not ADMISSAO_ATIVA:
+            yield
+            return
+        inicio = time.monotonic()
+        await self.reservar(usuario_id, custo)
+        try:
+            self._entrar_na_fila()
+        except HTTPException:
+            self._devolver_fichas(usuario_id, custo)
+            raise
+        try:
+            restante = ADMISSAO_ESPERA_S - (time.monotonic() - inicio)
+            await asyncio.wait_for(self._vagas.acquire(), timeout=max(restante, 0.001))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._devolver_fichas(usuario_id, custo)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise _recusar("prazo", "Servidor ocupado. Tente de novo em instantes.", self._estimar_espera())
+        finally:
+            self._esperando -= 1
+
+        espera = time.monotonic() - inicio
+        self._admitidas += 1
+        self._espera_total_s += espera
+        self._espera_max_s = max(self._espera_max_s, espera)
+        self._em_uso += 1
+        ocupada_em = time.monotonic()
+        try:
+            yield
+        finally:
+            self._em_uso -= 1
+            self._vagas.release()
+            self._ocupacao_media_s = 0.9 * self._ocupacao_media_s + 0.1 * (time.monotonic() - ocupada_em)
+
+    def devolver(self, usuario_id, custo: float):
+        """Fichas de um reservar() cujo trabalho não chegou a ser feito."""
+        if ADMISSAO_ATIVA and custo:
+            self._devolver_fichas(usuario_id, custo)
+
+    def _estimar_espera(self) -> float:
+        # Tempo até a fila atual andar, com as vagas liberando no ritmo médio observado
+        return self._ocupacao_media_s * (self._esperando + 1) / ADMISSAO_CONCORRENCIA
+
+    def estado(self) -> dict:
+        return {
+            "em_uso": self._em_uso,
+            "capacidade": ADMISSAO_CONCORRENCIA,
+            "fila": self._esperando,
+            "fila_max": ADMISSAO_FILA,
+            "admitidas": self._admitidas,
+            "espera_media_ms": round(1000 * self._espera_total_s / self._admitidas, 2) if self._admitidas else 0.0,
+            "espera_max_ms": round(1000 * self._espera_max_s, 2),
+        }
+
+admissao = ControleAdmissao()
+registrar_fonte("admissao", admissao.estado)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+import logging
+from ..config import load_env
+
+logger = logging.getLogger(__name__)
+load_env()
+
+# Aquecimento na subida: "false" deixa tudo para o primeiro request
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").strip().lower() == "true"
+
+_estado = {
+    "pronto": False,
+    "importacao_s": None,
+    "aquecimento_s": None,
+    "etapas": {},
+    "falhas": {},
+}
+_loop_principal = None
+
+def registrar_importacao(segundos: float):
+    _estado["importacao_s"] = round(segundos, 3)
+
+def _aquecer_clientes():
+    from .clientes_http import aquecer_conexoes
+    from .geracoes import configuracao_ativa
+    from .rag_engine import obter_embeddings, obter_llm
+    obter_embeddings(configuracao_ativa()["modelo_embeddings"])
+    for etapa in ("reformulacao", "resposta"):
+        obter_llm(etapa)
+    # TCP e TLS com cada provedor na subida, não na primeira pergunta
+    aquecer_conexoes()
+
+def _aquecer_modulos():
+    # Imports pesados que só aconteceriam no primeiro upload/indexação
+    from langchain_community.document_loaders import PyPDFLoader  # noqa: F401
+    from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: F401
+
+def _aquecer_base_vetorial():
+    from sqlalchemy import func
+    from ..database import SessionLocal
+    from ..models import Documento
+    from .base_vetorial import (
+        COLECAO_PADRAO, VECTOR_CACHE_COLECOES, VECTOR_COLECAO_POR_USUARIO, nome_colecao, obter_base_vetorial,
+    )
+    from .geracoes import indice_ativo
+    from .rag_engine import obter_embeddings
+
+    diretorio, configuracao = indice_ativo()
+    embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+    if not VECTOR_COLECAO_POR_USUARIO:
+        obter_base_vetorial(embeddings, diretorio, COLECAO_PADRAO)
+        return
+    # Coleções de quem processou documentos mais recentemente, até o tamanho do cache
+    db = SessionLocal()
+    try:
+        donos = db.query(Documento.usuario_id).filter(
+            Documento.preprocessado == True, Documento.usuario_id.isnot(None)  # noqa: E712
+        ).group_by(Documento.usuario_id).order_by(func.max(Documento.criado_em).desc()).limit(VECTOR_CACHE_COLECOES).all()
+        sem_dono = db.query(func.count(Documento.id)).filter(
+            Documento.preprocessado == True, Documento.usuario_id.is_(None)  # noqa: E712
+        ).scalar()
+    finally:
+        db.close()
+    if sem_dono:
+        logger.warning(
+            f"⚠️ {sem_dono} documentos processados sem dono estão fora das buscas por usuário; "
+            "migre com python -m backend.tools.migrar_colecao_unica --usuario <email>."
+        )
+    for (usuario_id,) in donos:
+        obter_base_vetorial(embeddings, diretorio, nome_colecao(usuario_id))
+
+def _aquecer_banco():
+    from sqlalchemy import text
+    from ..database import async_engine, engine
+    if _loop_principal is None:
+        with engine.connect() as conexao:
+            conexao.execute(text("SELECT 1"))
+        return
+
+    async def conectar():
+        async with async_engine.connect() as conexao:
+            await conexao.execute(text("SELECT 1"))
+
+    # As conexões do pool assíncrono pertencem ao event loop do worker: abre lá
+    asyncio.run_coroutine_threadsafe(conectar(), _loop_principal).result()
+
+ETAPAS = [
+    ("clientes", _aquecer_clientes),
+    ("modulos", _aquecer_modulos),
+    ("base_vetorial", _aquecer_base_vetorial),
+    ("banco", _aquecer_banco),
+]
+
+def aquecer(loop=None):
+    """
+    Cria clientes, importa módulos pesados, abre o vector store e a primeira
+    conexão do pool. Falhas são registradas mas não impedem a subida: o caminho
+    preguiçoso tenta de novo no primeiro request. `loop` é o event loop do
+    worker, onde o pool assíncrono do banco é aquecido.
+    """
+    global _loop_principal
+    _loop_principal = loop
+    inicio = time.perf_counter()
+    for nome, etapa in ETAPAS:
+        inicio_etapa = time.perf_counter()
+        try:
+            etapa()
+        except Exception as e:
+            logger.warning(f"⚠️ Aquecimento '{nome}' falhou: {e}")
+            _estado["falhas"][nome] = str(e)
+        _estado["etapas"][nome] = round(time.perf_counter() - inicio_etapa, 3)
+    _estado["aquecimento_s"] = round(time.perf_counter() - inicio, 3)
+    _estado["pronto"] = True
+    logger.info(f"Worker pronto (import {_estado['importacao_s']}s, aquecimento {_estado['aquecimento_s']}s)")
+
+def marcar_pronto():
+    _estado["pronto"] = True
+
+def estado_prontidao() -> dict:
+    return dict(_estado)
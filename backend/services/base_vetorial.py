@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import lru_cache
+from ..config import load_env
+from ..utils import reservar_diretorio, trava_arquivo
+
+logger = logging.getLogger(__name__)
+load_env()
+
+# "chroma" (padrão) ou "numpy" (índice plano mapeado em memória)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+# Usado apenas pelo backend numpy: float32, float16 ou int8
+VECTOR_QUANTIZACAO = os.getenv("VECTOR_QUANTIZACAO", "float32").strip().lower()
+# Uma coleção por usuário; "false" volta à coleção única compartilhada
+VECTOR_COLECAO_POR_USUARIO = os.getenv("VECTOR_COLECAO_POR_USUARIO", "true").strip().lower() == "true"
+# Quantas coleções ficam abertas em memória por processo (LRU)
+VECTOR_CACHE_COLECOES = int(os.getenv("VECTOR_CACHE_COLECOES", "16"))
+# Modo cliente/servidor do Chroma: obrigatório para rodar vários workers com Chroma
+CHROMA_HOST = os.getenv("CHROMA_HOST", "").strip()
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+COLECAO_PADRAO = "langchain"
+# Coleção irmã com um vetor por PDF (centroide dos blocos), usada no roteamento
+SUFIXO_DOCUMENTOS = "_documentos"
+# Coleção vazia no servidor cujo metadado guarda o ponteiro da geração ativa
+COLECAO_PONTEIRO = "indice_geracao_ativa"
+# Prefixo que _nome_colecao_servidor põe nas coleções de uma geração (ids de geracoes._criar_geracao)
+_PREFIXO_GERACAO = re.compile(r"^(g\d{14}_[0-9a-f]{6})_")
+
+_bases_abertas = OrderedDict()
+_trava_cache = threading.Lock()
+
+def nome_colecao(usuario_id) -> str:
+    """Coleção vetorial do usuário (ou a padrão, se o particionamento estiver desligado)."""
+    if not VECTOR_COLECAO_POR_USUARIO or usuario_id is None:
+        return COLECAO_PADRAO
+    return f"usuario_{usuario_id}"
+
+def _diretorio_numpy(diretorio: str, colecao: str) -> str:
+    return os.path.join(diretorio, "indice_numpy", colecao)
+
+@lru_cache(maxsize=None)
+def _cliente_chroma_servidor():
+    import chromadb
+    return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+
+def abrir_base_vetorial(embeddings, diretorio: str, colecao: str = COLECAO_PADRAO, backend: str = None):
+    """Abre o vector store configurado, com a mesma interface para Chroma e NumPy."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        from .vetores_numpy import BaseVetorialNumpy
+        return BaseVetorialNumpy(
+            _diretorio_numpy(diretorio, colecao), embeddings, VECTOR_QUANTIZACAO, diretorio_trava=diretorio
+        )
+    if backend != "chroma":
+        raise ValueError(f"VECTOR_BACKEND desconhecido: {backend}")
+    from langchain_community.vectorstores import Chroma
+    if CHROMA_HOST:
+        return Chroma(
+            collection_name=_nome_colecao_servidor(diretorio, colecao),
+            client=_cliente_chroma_servidor(),
+            embedding_function=embeddings,
+            relevance_score_fn=similaridade_de_l2,
+        )
+    reservar_chroma_local(diretorio, backend)
+    # Dois workers criando o SQLite do Chroma ao mesmo tempo corrompem o schema
+    with trava_arquivo(diretorio):
+        return Chroma(
+            collection_name=colecao,
+            persist_directory=diretorio,
+            embedding_function=embeddings,
+            relevance_score_fn=similaridade_de_l2,
+        )
+
+def reservar_chroma_local(diretorio: str, backend: str = None):
+    """
+    O Chroma local não aguenta outro processo gravando enquanto este lê (a busca
+    quebra ao carregar o segmento HNSW), então cada pasta fica com um processo só.
+    Chamado na subida: o segundo worker nem começa a atender.
+    """
+    if (backend or VECTOR_BACKEND) != "chroma" or CHROMA_HOST:
+        return
+    dono = reservar_diretorio(diretorio)
+    if dono:
+        raise RuntimeError(
+            f"O Chroma local em {diretorio} já está aberto por outro processo (pid {dono}). Com vários workers "
+            "ou ferramentas rodando junto com a API, use CHROMA_HOST ou VECTOR_BACKEND=numpy."
+        )
+
+def similaridade_de_l2(distancia: float) -> float:
+    """
+    O Chroma devolve a L2 ao quadrado; com embeddings normalizados ela é
+    2 - 2·cos. Convertida de volta ao cosseno, a relevância fica na mesma
+    escala do backend NumPy e o mesmo limiar serve para os dois.
+    """
+    return 1.0 - distancia / 2.0
+
+def _nome_colecao_servidor(diretorio: str, colecao: str) -> str:
+    """No servidor não há pastas: a geração do índice vira prefixo do nome da coleção."""
+    pai, geracao = os.path.split(os.path.normpath(diretorio))
+    if os.path.basename(pai) == "geracoes":
+        return f"{geracao}_{colecao}"
+    return colecao
+
+def apagar_colecoes_servidor(diretorio_mantido: str):
+    """
+    Apaga do servidor Chroma as coleções de gerações anteriores à mantida e as
+    do layout sem gerações. As mais novas podem estar em construção e ficam.
+    """
+    cliente = _cliente_chroma_servidor()
+    prefixo = _nome_colecao_servidor(diretorio_mantido, "")
+    if not prefixo:
+        return
+    mantida = prefixo[:-1]
+    for colecao in cliente.list_collections():
+        nome = getattr(colecao, "name", colecao)
+        if nome == COLECAO_PONTEIRO:
+            continue
+        geracao = _PREFIXO_GERACAO.match(nome)
+        if geracao and geracao.group(1) >= mantida:
+            continue
+        cliente.delete_collection(nome)
+
+def ler_ponteiro_servidor():
+    """Ponteiro da geração ativa compartilhado pelas réplicas, ou None se nunca foi gravado."""
+    colecao = _cliente_chroma_servidor().get_or_create_collection(COLECAO_PONTEIRO)
+    dados = (colecao.metadata or {}).get("ponteiro")
+    return json.loads(dados) if dados else None
+
+def gravar_ponteiro_servidor(ponteiro: dict):
+    colecao = _cliente_chroma_servidor().get_or_create_collection(COLECAO_PONTEIRO)
+    colecao.modify(metadata={"ponteiro": json.dumps(ponteiro, ensure_ascii=False)})
+
+def _trava_chroma_local(base_vetorial, exclusiva: bool):
+    """
+    Chroma persistente local: flock na pasta. NumPy já trava por dentro e o
+    servidor Chroma serializa sozinho, então nos dois casos não há o que fazer.
+    """
+    diretorio = getattr(base_vetorial, "_persist_directory", None)
+    if not diretorio:
+        return nullcontext()
+    return trava_arquivo(diretorio, exclusiva=exclusiva)
+
+def leitura_segura(base_vetorial):
+    """Trava compartilhada: várias buscas juntas, mas nunca durante uma escrita."""
+    return _trava_chroma_local(base_vetorial, exclusiva=False)
+
+def obter_base_vetorial(embeddings, diretorio: str, colecao: str = COLECAO_PADRAO, backend: str = None):
+    """
+    Retorna a coleção já aberta neste processo ou a abre sob demanda.
+    As menos usadas recentemente são descartadas quando o cache enche.
+    """
+    chave = (backend or VECTOR_BACKEND, diretorio, colecao)
+    with _trava_cache:
+        base_vetorial = _bases_abertas.get(chave)
+        if base_vetorial is not None:
+            _bases_abertas.move_to_end(chave)
+            return base_vetorial
+
+    base_vetorial = abrir_base_vetorial(embeddings, diretorio, colecao, backend)
+    # De onde veio, para achar a coleção de documentos correspondente
+    base_vetorial._origem = (embeddings, *chave)
+
+    with _trava_cache:
+        # Outra thread pode ter aberto a mesma coleção enquanto esta abria
+        base_vetorial = _bases_abertas.setdefault(chave, base_vetorial)
+        _bases_abertas.move_to_end(chave)
+        # Só a referência sai do cache: mmap e conexões são liberados quando a
+        # última requisição que ainda usa a coleção terminar
+        while len(_bases_abertas) > VECTOR_CACHE_COLECOES:
+            chave_antiga, _ = _bases_abertas.popitem(last=False)
+            logger.info(f"Coleção {chave_antiga[2]} descartada do cache (LRU).")
+    return base_vetorial
+
+def obter_base_documentos(base_vetorial):
+    """Coleção com os centroides dos PDFs indexados em `base_vetorial` (None se ela não veio do cache)."""
+    origem = getattr(base_vetorial, "_origem", None)
+    if origem is None:
+        return None
+    embeddings, backend, diretorio, colecao = origem
+    return obter_base_vetorial(embeddings, diretorio, colecao + SUFIXO_DOCUMENTOS, backend)
+
+def listar_metadados(base_vetorial):
+    if hasattr(base_vetorial, "listar_metadados"):
+        return base_vetorial.listar_metadados()
+    return [metadados or {} for metadados in base_vetorial._collection.get(include=["metadatas"])["metadatas"]]
+
+def descartar_bases_em_cache():
+    """Esquece todas as coleções abertas; usado quando a geração ativa do índice muda."""
+    with _trava_cache:
+        _bases_abertas.clear()
+
+def buscar_por_vetores(base_vetorial, vetores, k: int = 4, com_vetores: bool = False, fontes=None):
+    """
+    Várias consultas de uma vez: uma passada pela matriz no NumPy, uma única
+    query no Chroma. Devolve, por consulta e na ordem, pares (documento, relevância),
+    ou trios (documento, relevância, embedding do bloco) com `com_vetores`.
+    `fontes` restringe a busca aos blocos desses PDFs (metadado "source").
+    """
+    relevancia = base_vetorial._select_relevance_score_fn()
+    if hasattr(base_vetorial, "buscar_por_vetores"):
+        return [
+            [(item[0], relevancia(item[1]), *item[2:]) for item in resultado]
+            for resultado in base_vetorial.buscar_por_vetores(vetores, k, com_vetores=com_vetores, fontes=fontes)
+        ]
+    from langchain_core.documents import Document
+    incluir = ["documents", "metadatas", "distances"] + (["embeddings"] if com_vetores else [])
+    filtro = {"where": {"source": {"$in": list(fontes)}}} if fontes is not None else {}
+    resultado = base_vetorial._collection.query(query_embeddings=vetores, n_results=k, include=incluir, **filtro)
+    por_consulta = []
+    for i, ids in enumerate(resultado["ids"]):
+        itens = []
+        for j, id_bloco in enumerate(ids):
+            documento = Document(
+                page_content=resultado["documents"][i][j], metadata=resultado["metadatas"][i][j] or {}, id=id_bloco
+            )
+            item = (documento, relevancia(resultado["distances"][i][j]))
+            itens.append(item + (resultado["embeddings"][i][j],) if com_vetores else item)
+        por_consulta.append(itens)
+    return por_consulta
+
+def _tamanho_lote(base_vetorial, total: int) -> int:
+    # O Chroma recusa inserções acima do max_batch_size do cliente
+    cliente = getattr(base_vetorial, "_client", None)
+    if cliente is not None and hasattr(cliente, "get_max_batch_size"):
+        return cliente.get_max_batch_size()
+    return max(total, 1)
+
+def adicionar_documentos(blocos, embeddings, diretorio: str, colecao: str = COLECAO_PADRAO, backend: str = None):
+    """Embeda e grava os blocos na coleção, reaproveitando a instância em cache."""
+    base_vetorial = obter_base_vetorial(embeddings, diretorio, colecao, backend)
+    if getattr(base_vetorial, "_persist_directory", None):
+        _gravar_chroma_local(base_vetorial, blocos)
+        return base_vetorial
+    lote = _tamanho_lote(base_vetorial, len(blocos))
+    for inicio in range(0, len(blocos), lote):
+        base_vetorial.add_documents(blocos[inicio:inicio + lote])
+    return base_vetorial
+
+def _gravar_chroma_local(base_vetorial, blocos):
+    """
+    Embeda fora da trava: escritores em paralelo só disputam a gravação no
+    SQLite do Chroma, não as chamadas à API de embeddings.
+    """
+    vetores = base_vetorial.embeddings.embed_documents([bloco.page_content for bloco in blocos])
+    gravar_vetores(base_vetorial, blocos, vetores, [str(uuid.uuid4()) for _ in blocos])
+
+def gravar_vetores(base_vetorial, blocos, vetores, ids):
+    """
+    Grava blocos já embedados (a ingestão embeda em paralelo com a leitura do
+    PDF). Ids que já existem são ignorados nos dois backends: o primeiro PDF a
+    gravar um conteúdo continua dono dos blocos.
+    """
+    textos = [bloco.page_content for bloco in blocos]
+    if hasattr(base_vetorial, "adicionar_vetores"):
+        base_vetorial.adicionar_vetores(textos, [bloco.metadata for bloco in blocos], vetores, ids)
+        return
+    colecao = base_vetorial._collection
+    lote = _tamanho_lote(base_vetorial, len(blocos))
+    with _trava_chroma_local(base_vetorial, exclusiva=True):
+        for inicio in range(0, len(blocos), lote):
+            fim = min(inicio + lote, len(blocos))
+            existentes = set(colecao.get(ids=list(ids[inicio:fim]), include=[])["ids"])
+            novos = [i for i in range(inicio, fim) if ids[i] not in existentes]
+            if not novos:
+                continue
+            colecao.add(
+                ids=[ids[i] for i in novos],
+                embeddings=[vetores[i] for i in novos],
+                documents=[textos[i] for i in novos],
+                # O Chroma recusa metadados vazios, mas aceita None
+                metadatas=[blocos[i].metadata or None for i in novos],
+            )
+
+def apagar_blocos(base_vetorial, fontes=(), ids=()) -> int:
+    """Remove da coleção os blocos desses PDFs (metadado "source") e desses ids; devolve quantos saíram."""
+    if hasattr(base_vetorial, "apagar"):
+        return base_vetorial.apagar(fontes, ids)
+    colecao = base_vetorial._collection
+    with _trava_chroma_local(base_vetorial, exclusiva=True):
+        antes = colecao.count()
+        if fontes:
+            colecao.delete(where={"source": {"$in": list(fontes)}})
+        if ids:
+            colecao.delete(ids=list(ids))
+        return antes - colecao.count()
+
+def ids_das_fontes(base_vetorial, fontes) -> list:
+    """Ids dos blocos desses PDFs (metadado "source")."""
+    fontes = [fonte for fonte in fontes if fonte]
+    if not fontes:
+        return []
+    if hasattr(base_vetorial, "ids_das_fontes"):
+        return base_vetorial.ids_das_fontes(fontes)
+    return base_vetorial._collection.get(where={"source": {"$in": fontes}}, include=[])["ids"]
+
+def ids_existentes(base_vetorial, ids) -> set:
+    """Quais destes ids de bloco ainda estão na coleção."""
+    ids = [id_bloco for id_bloco in ids if id_bloco]
+    if not ids:
+        return set()
+    if hasattr(base_vetorial, "ids_existentes"):
+        return base_vetorial.ids_existentes(ids)
+    return set(base_vetorial._collection.get(ids=ids, include=[])["ids"])
+
+def reatribuir_fonte(base_vetorial, ids, fonte: str) -> int:
+    """Aponta o "source" desses blocos para `fonte`; devolve quantos mudaram."""
+    if not ids:
+        return 0
+    if hasattr(base_vetorial, "reatribuir_fonte"):
+        return base_vetorial.reatribuir_fonte(ids, fonte)
+    colecao = base_vetorial._collection
+    with _trava_chroma_local(base_vetorial, exclusiva=True):
+        atuais = colecao.get(ids=list(ids), include=["metadatas"])
+        if atuais["ids"]:
+            colecao.update(
+                ids=atuais["ids"],
+                metadatas=[{**(metadados or {}), "source": fonte} for metadados in atuais["metadatas"]],
+            )
+        return len(atuais["ids"])
+
+def tamanho_em_disco(diretorio: str) -> int:
+    total = 0
+    for raiz, _, arquivos in os.walk(diretorio):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except FileNotFoundError:
+                pass
+    return total
+
+def compactar_indice(embeddings, diretorio: str, backend: str = None) -> dict:
+    """
+    Libera o espaço dos blocos apagados numa geração do índice. No NumPy cada
+    coleção é reescrita só com as linhas vivas; no Chroma local é feito um
+    VACUUM no chroma.sqlite3 (os segmentos HNSW só encolhem numa reconstrução).
+    """
+    backend = backend or VECTOR_BACKEND
+    if backend == "chroma" and CHROMA_HOST:
+        raise ValueError("Com CHROMA_HOST a compactação fica a cargo do servidor Chroma.")
+    antes = tamanho_em_disco(diretorio)
+    linhas_removidas = {}
+    if backend == "numpy":
+        pasta = os.path.dirname(_diretorio_numpy(diretorio, COLECAO_PADRAO))
+        for colecao in sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []:
+            base_vetorial = obter_base_vetorial(embeddings, diretorio, colecao, backend)
+            linhas_removidas[colecao] = base_vetorial.compactar()
+    else:
+        import sqlite3
+        caminho = os.path.join(diretorio, "chroma.sqlite3")
+        if os.path.exists(caminho):
+            reservar_chroma_local(diretorio, backend)
+            with trava_arquivo(diretorio):
+                conexao = sqlite3.connect(caminho, timeout=30)
+                try:
+                    conexao.execute("VACUUM")
+                finally:
+                    conexao.close()
+    depois = tamanho_em_disco(diretorio)
+    return {
+        "backend": backend,
+        "geracao": os.path.basename(os.path.normpath(diretorio)),
+        "bytes_antes": antes,
+        "bytes_depois": depois,
+        "bytes_recuperados": antes - depois,
+        "linhas_removidas": linhas_removidas,
+    }
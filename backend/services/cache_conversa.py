@@ -0,0 +1,111 @@
+"""
+Conjunto de trabalho da recuperação por conversa.
+
+Perguntas de acompanhamento costumam falar dos mesmos blocos que acabaram de
+ser recuperados. Cada conversa guarda os últimos candidatos da busca (id,
+documento e embedding, até CACHE_CONVERSA_BLOCOS) e a próxima pergunta é
+pontuada primeiro contra eles: se o melhor passar de CACHE_CONVERSA_LIMIAR, o
+índice nem é consultado e o contexto fica estável entre as mensagens. Senão,
+busca completa, e os candidatos novos entram no conjunto. O conjunto é
+descartado quando a coleção muda de tamanho, quando algum bloco escolhido nele
+já não está no índice (documento apagado ou com o conteúdo trocado), após
+CACHE_CONVERSA_TTL_S sem uso ou quando passam de CACHE_CONVERSA_MAX conversas
+(as menos recentes saem).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from ..config import load_env
+from ..metricas import registrar_fonte
+
+load_env()
+
+CACHE_CONVERSA = os.getenv("CACHE_CONVERSA", "true").strip().lower() == "true"
+CACHE_CONVERSA_BLOCOS = int(os.getenv("CACHE_CONVERSA_BLOCOS", "48"))
+# Relevância (cosseno) mínima do melhor bloco do conjunto para dispensar o índice
+CACHE_CONVERSA_LIMIAR = float(os.getenv("CACHE_CONVERSA_LIMIAR", "0.6"))
+CACHE_CONVERSA_TTL_S = float(os.getenv("CACHE_CONVERSA_TTL_S", "1800"))
+CACHE_CONVERSA_MAX = int(os.getenv("CACHE_CONVERSA_MAX", "2000"))
+
+def _normalizar(vetor):
+    vetor = np.asarray(vetor, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+class ConjuntoTrabalho:
+    def __init__(self, total_vetores: int):
+        # Tamanho da coleção quando o conjunto foi montado: se mudar, ele é descartado
+        self.total_vetores = total_vetores
+        self._blocos = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocos)
+
+    def pontuar(self, vetor_consulta):
+        """Pares (documento, relevância) de todo o conjunto, do mais relevante ao menos."""
+        with self._trava:
+            if not self._blocos:
+                return []
+            ids = list(self._blocos)
+            documentos = [self._blocos[i][0] for i in ids]
+            matriz = np.stack([self._blocos[i][1] for i in ids])
+        relevancias = matriz @ _normalizar(vetor_consulta)
+        ordem = np.argsort(-relevancias)
+        return [(documentos[i], float(relevancias[i])) for i in ordem]
+
+    def usar(self, documentos):
+        """Blocos usados na resposta vão para o fim da fila (os últimos a sair)."""
+        with self._trava:
+            for doc in documentos:
+                if doc.id in self._blocos:
+                    self._blocos.move_to_end(doc.id)
+
+    def limpar(self):
+        with self._trava:
+            self._blocos.clear()
+
+    def adicionar(self, candidatos):
+        """Trios (documento, relevância, embedding) vindos da busca completa."""
+        with self._trava:
+            # Os menos relevantes entram primeiro e saem antes se o conjunto encher
+            for doc, _, vetor in reversed(candidatos):
+                chave = doc.id or doc.page_content
+                self._blocos[chave] = (doc, _normalizar(vetor))
+                self._blocos.move_to_end(chave)
+            while len(self._blocos) > CACHE_CONVERSA_BLOCOS:
+                self._blocos.popitem(last=False)
+
+class ConjuntosConversa:
+    def __init__(self):
+        self._conjuntos = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, total_vetores: int):
+        """Conjunto da conversa (vazio se não houver um válido), ou None se o cache estiver desligado."""
+        if not CACHE_CONVERSA:
+            return None
+        agora = time.monotonic()
+        with self._trava:
+            conjunto, usado_em = self._conjuntos.get(chave, (None, 0.0))
+            if conjunto is None or conjunto.total_vetores != total_vetores or agora - usado_em > CACHE_CONVERSA_TTL_S:
+                conjunto = ConjuntoTrabalho(total_vetores)
+            return conjunto
+
+    def guardar(self, chave, conjunto):
+        if conjunto is None or not len(conjunto):
+            return
+        with self._trava:
+            self._conjuntos[chave] = (conjunto, time.monotonic())
+            self._conjuntos.move_to_end(chave)
+            while len(self._conjuntos) > CACHE_CONVERSA_MAX:
+                self._conjuntos.popitem(last=False)
+
+    def estado(self) -> dict:
+        with self._trava:
+            return {"conversas": len(self._conjuntos), "capacidade": CACHE_CONVERSA_MAX}
+
+conjuntos_conversa = ConjuntosConversa()
+registrar_fonte("cache_conversa", conjuntos_conversa.estado)
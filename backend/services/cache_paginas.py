@@ -0,0 +1,134 @@
+"""
+Cache do texto extraído de cada página dos PDFs.
+
+A chave é o SHA-256 do arquivo mais a versão do extrator (pypdf e
+langchain-community): reprocessar um PDF já lido — nova geração do índice,
+outro chunk_size, reingestão — pula o parser. Cada entrada é um JSON lines
+(uma página por linha) compactado com gzip em CACHE_PAGINAS_DIR; trocar a
+versão do extrator invalida as entradas antigas, que podem ser apagadas à vontade.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from importlib.metadata import PackageNotFoundError, version
+from langchain_core.documents import Document
+from ..config import BASE_DIR, load_env
+from ..metricas import incrementar
+
+logger = logging.getLogger(__name__)
+load_env()
+
+CACHE_PAGINAS = os.getenv("CACHE_PAGINAS", "true").strip().lower() == "true"
+CACHE_PAGINAS_DIR = os.getenv("CACHE_PAGINAS_DIR") or os.path.join(BASE_DIR, "data", "cache_paginas")
+
+# Sobe quando o formato gravado aqui mudar
+FORMATO_CACHE = 2
+
+def _versao_pacote(nome: str) -> str:
+    try:
+        return version(nome)
+    except PackageNotFoundError:
+        return "?"
+
+VERSAO_EXTRATOR = (
+    f"f{FORMATO_CACHE}-pypdf{_versao_pacote('pypdf')}-lc{_versao_pacote('langchain-community')}"
+)
+
+class EntradaCorrompida(Exception):
+    """Entrada do cache ilegível no meio da leitura (já apagada): extrair de novo."""
+
+def hash_arquivo(caminho: str) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(1 << 20), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+def _caminho_entrada(hash_pdf: str) -> str:
+    return os.path.join(CACHE_PAGINAS_DIR, hash_pdf[:2], f"{hash_pdf}.{VERSAO_EXTRATOR}.json.gz")
+
+def ler_paginas(hash_pdf: str, caminho_pdf: str):
+    """Iterador sobre as páginas em cache para este conteúdo, ou None."""
+    if not CACHE_PAGINAS:
+        return None
+    try:
+        arquivo = gzip.open(_caminho_entrada(hash_pdf), "rt", encoding="utf-8")
+    except FileNotFoundError:
+        incrementar("cache_paginas.faltas")
+        return None
+    incrementar("cache_paginas.acertos")
+    return _iterar_entrada(arquivo, hash_pdf, caminho_pdf)
+
+def apagar_paginas(hash_pdf: str) -> int:
+    """Remove as entradas deste conteúdo (de qualquer versão do extrator); devolve os bytes liberados."""
+    pasta = os.path.dirname(_caminho_entrada(hash_pdf))
+    liberados = 0
+    for nome in os.listdir(pasta) if os.path.isdir(pasta) else []:
+        if nome.startswith(f"{hash_pdf}."):
+            caminho = os.path.join(pasta, nome)
+            liberados += os.path.getsize(caminho)
+            os.remove(caminho)
+    return liberados
+
+def _iterar_entrada(arquivo, hash_pdf: str, caminho_pdf: str):
+    # Uma página por linha: o documento nunca fica inteiro na memória
+    try:
+        with arquivo:
+            for linha in arquivo:
+                texto, metadados = json.loads(linha)
+                # "source" aponta para onde o arquivo está agora, como o PyPDFLoader faria
+                yield Document(page_content=texto, metadata={**metadados, "source": caminho_pdf})
+    except (OSError, EOFError, ValueError, TypeError, zlib.error) as e:
+        # Truncada ou corrompida: sai do cache, senão o PDF nunca mais seria indexado
+        logger.warning(f"⚠️ Entrada corrompida no cache de páginas ({hash_pdf[:12]}): {e}")
+        incrementar("cache_paginas.corrompidas")
+        try:
+            os.remove(_caminho_entrada(hash_pdf))
+        except FileNotFoundError:
+            pass
+        raise EntradaCorrompida(str(e)) from e
+
+class GravacaoPaginas:
+    """
+    Grava as páginas à medida que o extrator as produz. A entrada só passa a
+    existir (renomeada do temporário) se a extração terminar sem erro.
+    """
+
+    def __init__(self, hash_pdf: str):
+        self._destino = _caminho_entrada(hash_pdf)
+        self._bruto = None
+        self._arquivo = None
+        self._temporario = None
+
+    def __enter__(self):
+        if not CACHE_PAGINAS:
+            return self
+        try:
+            os.makedirs(os.path.dirname(self._destino), exist_ok=True)
+            fd, self._temporario = tempfile.mkstemp(dir=os.path.dirname(self._destino), suffix=".tmp")
+            self._bruto = os.fdopen(fd, "wb")
+            self._arquivo = gzip.open(self._bruto, "wt", encoding="utf-8")
+        except OSError as e:
+            # Cache é só otimização: falhar aqui não impede o processamento
+            logger.warning(f"⚠️ Não foi possível gravar o cache de páginas: {e}")
+        return self
+
+    def gravar(self, pagina):
+        if self._arquivo:
+            self._arquivo.write(json.dumps([pagina.page_content, pagina.metadata], ensure_ascii=False) + "\n")
+
+    def __exit__(self, tipo, erro, rastro):
+        if not self._arquivo:
+            return False
+        self._arquivo.close()
+        # O gzip não fecha o arquivo que recebeu aberto
+        self._bruto.close()
+        if tipo is None:
+            os.replace(self._temporario, self._destino)
+        else:
+            os.remove(self._temporario)
+        return False
@@ -0,0 +1,198 @@
+"""
+Clientes HTTP compartilhados para os provedores de LLM (Groq) e embeddings (Google).
+
+Sem isto, cada SDK cria o seu próprio cliente httpx (um por ChatGroq: cada etapa
+e a reserva), com o keep-alive padrão de 5 s: depois de uma pausa curta, a
+chamada seguinte paga TCP e TLS de novo. Aqui há um transporte por provedor, e
+o pool de conexões dele é compartilhado por todos os clientes do processo, com
+limites, keep-alive e prazos configurados em HTTP_*. Prazos que o SDK não
+define (o do Google não define nenhum) saem daqui.
+
+Com HTTP_AQUECER_S > 0, uma thread manda um HEAD sem credenciais para a raiz
+do provedor quando ele passa esse tempo sem requisições, para a conexão não
+esfriar entre uma pergunta e outra. /metricas mostra, por provedor, requisições,
+conexões novas, handshakes TLS, aquecimentos e a taxa de reuso.
+"""
+import logging
+import os
+import threading
+import time
+import httpx
+from ..config import load_env
+from ..metricas import registrar_fonte
+
+logger = logging.getLogger(__name__)
+load_env()
+
+HTTP_MAX_CONEXOES = int(os.getenv("HTTP_MAX_CONEXOES", "20"))
+# Conexões ociosas mantidas abertas por provedor e por quanto tempo
+HTTP_MAX_OCIOSAS = int(os.getenv("HTTP_MAX_OCIOSAS", "10"))
+HTTP_KEEPALIVE_S = float(os.getenv("HTTP_KEEPALIVE_S", "120"))
+HTTP_TIMEOUT_CONEXAO_S = float(os.getenv("HTTP_TIMEOUT_CONEXAO_S", "5"))
+# Leitura/escrita quando o SDK não passa prazo próprio
+HTTP_TIMEOUT_S = float(os.getenv("HTTP_TIMEOUT_S", "60"))
+# Precisa do pacote h2; sem ele, fica em HTTP/1.1
+HTTP2 = os.getenv("HTTP2", "false").strip().lower() == "true"
+# Ociosidade (s) que dispara o HEAD de aquecimento (0 desliga)
+HTTP_AQUECER_S = float(os.getenv("HTTP_AQUECER_S", "0"))
+
+ORIGENS = {
+    "groq": "https://api.groq.com",
+    "google": "https://generativelanguage.googleapis.com",
+}
+
+# Eventos de rastreio do httpcore -> contador
+_EVENTOS = {
+    "connection.connect_tcp.complete": "conexoes_novas",
+    "connection.start_tls.complete": "handshakes_tls",
+    "http11.send_request_headers.started": "requisicoes",
+    "http2.send_request_headers.started": "requisicoes",
+}
+
+def _usar_http2() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ HTTP2=true, mas o pacote h2 não está instalado; usando HTTP/1.1.")
+        return False
+    return True
+
+def prazo_http(leitura_s: float) -> httpx.Timeout:
+    """Prazo para um SDK que define o seu (ex.: LLM_TIMEOUT_S), com a conexão limitada a HTTP_TIMEOUT_CONEXAO_S."""
+    return httpx.Timeout(leitura_s, connect=HTTP_TIMEOUT_CONEXAO_S)
+
+class TransporteCompartilhado(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Pool de conexões de um provedor, usado tanto pelos clientes síncronos quanto pelos assíncronos."""
+
+    def __init__(self, provedor: str):
+        self.provedor = provedor
+        self.ultimo_uso = time.monotonic()
+        limites = httpx.Limits(
+            max_connections=HTTP_MAX_CONEXOES,
+            max_keepalive_connections=HTTP_MAX_OCIOSAS,
+            keepalive_expiry=HTTP_KEEPALIVE_S,
+        )
+        http2 = _usar_http2()
+        self._sincrono = httpx.HTTPTransport(limits=limites, http2=http2)
+        self._assincrono = httpx.AsyncHTTPTransport(limits=limites, http2=http2)
+        self._contadores = {"requisicoes": 0, "conexoes_novas": 0, "handshakes_tls": 0, "aquecimentos": 0}
+        self._trava = threading.Lock()
+
+    def _contar(self, nome: str):
+        with self._trava:
+            self._contadores[nome] += 1
+
+    def _rastrear(self, evento, info):
+        if evento in _EVENTOS:
+            self._contar(_EVENTOS[evento])
+
+    async def _rastrear_assincrono(self, evento, info):
+        self._rastrear(evento, info)
+
+    def _preparar(self, request, rastrear):
+        self.ultimo_uso = time.monotonic()
+        prazos = request.extensions.get("timeout") or {}
+        padrao = {"connect": HTTP_TIMEOUT_CONEXAO_S, "read": HTTP_TIMEOUT_S, "write": HTTP_TIMEOUT_S, "pool": HTTP_TIMEOUT_CONEXAO_S}
+        request.extensions["timeout"] = {
+            chave: prazos.get(chave) if prazos.get(chave) is not None else valor for chave, valor in padrao.items()
+        }
+        if request.extensions.pop("aquecimento", False):
+            # Não entra na taxa de reuso: quem aproveita a conexão é a próxima requisição de verdade
+            self._contar("aquecimentos")
+            return
+        request.extensions.setdefault("trace", rastrear)
+
+    def handle_request(self, request):
+        self._preparar(request, self._rastrear)
+        return self._sincrono.handle_request(request)
+
+    async def handle_async_request(self, request):
+        self._preparar(request, self._rastrear_assincrono)
+        return await self._assincrono.handle_async_request(request)
+
+    def close(self):
+        """Chamado quando um cliente do SDK é fechado: o pool é do processo e continua aberto."""
+
+    async def aclose(self):
+        """Idem, para os clientes assíncronos."""
+
+    def aquecer(self):
+        with httpx.Client(transport=self) as cliente:
+            cliente.head(ORIGENS[self.provedor], extensions={"aquecimento": True})
+
+    def estado(self) -> dict:
+        with self._trava:
+            contadores = dict(self._contadores)
+        requisicoes = contadores["requisicoes"]
+        contadores["reuso"] = round(1 - contadores["conexoes_novas"] / requisicoes, 3) if requisicoes else None
+        return contadores
+
+_transportes = {}
+_clientes = {}
+_trava_transportes = threading.Lock()
+
+def transporte(provedor: str) -> TransporteCompartilhado:
+    with _trava_transportes:
+        if provedor not in _transportes:
+            _transportes[provedor] = TransporteCompartilhado(provedor)
+        return _transportes[provedor]
+
+def clientes_http(provedor: str):
+    """Par (httpx.Client, httpx.AsyncClient) sobre o transporte do provedor, para SDKs que recebem o cliente pronto."""
+    base = transporte(provedor)
+    with _trava_transportes:
+        if provedor not in _clientes:
+            _clientes[provedor] = (httpx.Client(transport=base), httpx.AsyncClient(transport=base))
+        return _clientes[provedor]
+
+def _estado() -> dict:
+    with _trava_transportes:
+        transportes = dict(_transportes)
+    return {f"{nome}.{chave}": valor for nome, base in transportes.items() for chave, valor in base.estado().items()}
+
+registrar_fonte("http", _estado)
+
+def _aquecer(transportes):
+    for base in transportes:
+        try:
+            base.aquecer()
+        except httpx.HTTPError as e:
+            logger.warning(f"⚠️ Aquecimento da conexão com {base.provedor} falhou: {e}")
+
+def aquecer_conexoes():
+    """Abre (ou mantém) uma conexão com cada provedor já usado neste processo."""
+    with _trava_transportes:
+        transportes = list(_transportes.values())
+    _aquecer(transportes)
+
+class _Aquecedor:
+    def __init__(self):
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        if HTTP_AQUECER_S <= 0 or self._thread is not None:
+            return
+        if HTTP_AQUECER_S >= HTTP_KEEPALIVE_S:
+            logger.warning("⚠️ HTTP_AQUECER_S >= HTTP_KEEPALIVE_S: o pool fecha a conexão antes do aquecimento.")
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._rodar, name="aquecedor-http", daemon=True)
+        self._thread.start()
+
+    def _rodar(self):
+        # Verifica com folga: uma conexão nunca fica muito mais que HTTP_AQUECER_S parada
+        while not self._parar.wait(max(HTTP_AQUECER_S / 4, 1.0)):
+            agora = time.monotonic()
+            with _trava_transportes:
+                ociosos = [base for base in _transportes.values() if agora - base.ultimo_uso >= HTTP_AQUECER_S]
+            _aquecer(ociosos)
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+aquecedor = _Aquecedor()
@@ -0,0 +1,59 @@
+"""
+Coalescência de chamadas idênticas em andamento (single-flight).
+
+Quando várias requisições fazem a mesma chamada ao mesmo tempo, só a
+primeira executa; as outras esperam e recebem o mesmo resultado (ou a mesma
+exceção). Nada fica guardado depois que a chamada termina: não é um cache.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from ..config import load_env
+from ..metricas import incrementar
+
+load_env()
+
+# "false" desliga a coalescência (cada chamada vai ao LLM / vector store)
+COALESCER_REQUISICOES = os.getenv("COALESCER_REQUISICOES", "true").strip().lower() == "true"
+
+def normalizar_texto(texto: str) -> str:
+    return " ".join(str(texto).split()).casefold()
+
+def chave_de(*partes) -> str:
+    return hashlib.sha256("\x1f".join(normalizar_texto(p) for p in partes).encode("utf-8")).hexdigest()
+
+class VooUnico:
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._em_andamento = {}
+        self._trava = threading.Lock()
+
+    def executar(self, chave: str, funcao, *args, **kwargs):
+        if not COALESCER_REQUISICOES:
+            return funcao(*args, **kwargs)
+        with self._trava:
+            futuro = self._em_andamento.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+        incrementar(f"coalescencia.{self.nome}.chamadas")
+        if not lider:
+            incrementar(f"coalescencia.{self.nome}.deduplicadas")
+            return futuro.result()
+
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._trava:
+                self._em_andamento.pop(chave, None)
+
+voo_llm = VooUnico("llm")
+voo_busca = VooUnico("busca")
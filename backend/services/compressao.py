@@ -0,0 +1,130 @@
+"""
+Compressão extrativa do contexto antes da geração.
+
+Os blocos recuperados são quebrados em frases, cada frase é pontuada contra a
+pergunta (sobreposição lexical ponderada por IDF ou cosseno de embeddings,
+sempre em operações vetoriais sobre todas as frases de uma vez) e só as
+melhores, com as vizinhas, seguem para o prompt.
+"""
+import math
+import os
+import re
+import numpy as np
+from langchain_core.documents import Document
+from ..config import load_env
+from ..metricas import incrementar, medir_etapa
+
+load_env()
+
+# Desligada por padrão: "true" ativa a compressão em /pergunta/ e /perguntas/lote
+COMPRESSAO_CONTEXTO = os.getenv("COMPRESSAO_CONTEXTO", "false").strip().lower() == "true"
+# "lexical" (sem chamadas externas) ou "embeddings" (uma chamada em lote ao modelo de embeddings)
+COMPRESSAO_MODO = os.getenv("COMPRESSAO_MODO", "lexical").strip().lower()
+# Frases mais relevantes mantidas por pergunta e vizinhas de cada lado que vão junto
+COMPRESSAO_FRASES = int(os.getenv("COMPRESSAO_FRASES", "8"))
+COMPRESSAO_VIZINHOS = int(os.getenv("COMPRESSAO_VIZINHOS", "1"))
+
+# Marca onde frases foram removidas no meio de um bloco
+SEPARADOR_CORTE = "[…]"
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?;])\s+|\n\s*\n")
+_TOKEN = re.compile(r"\w{3,}")
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximação de ~4 caracteres por token, suficiente para comparar antes e depois."""
+    return math.ceil(len(texto) / 4)
+
+def _quebrar_frases(texto: str):
+    frases = (" ".join(parte.split()) for parte in _FIM_DE_FRASE.split(texto))
+    return [frase for frase in frases if frase]
+
+def _tokens(texto: str):
+    return set(_TOKEN.findall(texto.casefold()))
+
+def _pontuar_lexical(pergunta: str, frases):
+    termos = sorted(_tokens(pergunta))
+    if not termos:
+        return np.zeros(len(frases), dtype=np.float32)
+    posicao = {termo: i for i, termo in enumerate(termos)}
+    presenca = np.zeros((len(frases), len(termos)), dtype=np.float32)
+    tamanhos = np.empty(len(frases), dtype=np.float32)
+    for linha, frase in enumerate(frases):
+        tokens = _tokens(frase)
+        tamanhos[linha] = len(tokens)
+        for token in tokens & posicao.keys():
+            presenca[linha, posicao[token]] = 1.0
+    # Termos da pergunta que aparecem em quase todas as frases pesam pouco
+    idf = np.log((len(frases) + 1) / (presenca.sum(axis=0) + 1)) + 1.0
+    return (presenca @ idf) / np.sqrt(tamanhos + 1.0)
+
+def _pontuar_embeddings(pergunta: str, frases, embeddings):
+    vetores = np.asarray(embeddings.embed_documents(frases), dtype=np.float32)
+    consulta = np.asarray(embeddings.embed_query(pergunta), dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=1) * (np.linalg.norm(consulta) or 1.0)
+    normas[normas == 0] = 1.0
+    return (vetores @ consulta) / normas
+
+def comprimir_contexto(pergunta: str, documentos, embeddings=None):
+    """
+    Devolve (documentos, relatório). Os documentos mantêm os metadados
+    originais; o relatório traz tokens estimados antes/depois e a economia.
+    Sem compressão ativa, ou sem nenhuma frase relevante, volta o original.
+    """
+    if not COMPRESSAO_CONTEXTO or not documentos:
+        return documentos, None
+    with medir_etapa("compressao"):
+        return _comprimir(pergunta, documentos, embeddings)
+
+def _comprimir(pergunta: str, documentos, embeddings):
+    tokens_antes = sum(estimar_tokens(doc.page_content) for doc in documentos)
+
+    frases, origem = [], []
+    for indice_doc, doc in enumerate(documentos):
+        for frase in _quebrar_frases(doc.page_content):
+            frases.append(frase)
+            origem.append(indice_doc)
+    if not frases:
+        return documentos, None
+
+    if COMPRESSAO_MODO == "embeddings" and embeddings is not None:
+        pontuacoes = _pontuar_embeddings(pergunta, frases, embeddings)
+    else:
+        pontuacoes = _pontuar_lexical(pergunta, frases)
+
+    melhores = [int(i) for i in np.argsort(-pontuacoes)[:COMPRESSAO_FRASES] if pontuacoes[i] > 0]
+    if not melhores:
+        return documentos, _relatorio(tokens_antes, tokens_antes)
+
+    mantidas = set()
+    for i in melhores:
+        for vizinha in range(i - COMPRESSAO_VIZINHOS, i + COMPRESSAO_VIZINHOS + 1):
+            # Vizinhas só dentro do mesmo bloco
+            if 0 <= vizinha < len(frases) and origem[vizinha] == origem[i]:
+                mantidas.add(vizinha)
+
+    comprimidos = []
+    for indice_doc, doc in enumerate(documentos):
+        posicoes = [i for i in range(len(frases)) if origem[i] == indice_doc]
+        if not any(i in mantidas for i in posicoes):
+            continue
+        partes, anterior_mantida = [], True
+        for i in posicoes:
+            if i in mantidas:
+                if not anterior_mantida and partes:
+                    partes.append(SEPARADOR_CORTE)
+                partes.append(frases[i])
+            anterior_mantida = i in mantidas
+        comprimidos.append(Document(page_content=" ".join(partes), metadata=doc.metadata))
+
+    tokens_depois = sum(estimar_tokens(doc.page_content) for doc in comprimidos)
+    if tokens_depois >= tokens_antes:
+        return documentos, _relatorio(tokens_antes, tokens_antes)
+    return comprimidos, _relatorio(tokens_antes, tokens_depois)
+
+def _relatorio(tokens_antes: int, tokens_depois: int) -> dict:
+    incrementar("compressao.tokens_antes", tokens_antes)
+    incrementar("compressao.tokens_depois", tokens_depois)
+    return {
+        "tokens_antes": tokens_antes,
+        "tokens_depois": tokens_depois,
+        "economia": round(1 - tokens_depois / tokens_antes, 3) if tokens_antes else 0.0,
+    }
@@ -1,12 +1,35 @@
 import os
+import contextvars
 import logging
+import queue
+import threading
 from fastapi import HTTPException
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from ..utils import get_vector_count, limpar_chroma_db
+from ..config import load_env
+from ..metricas import incrementar, medir_etapa
+from ..utils import get_vector_count
+from .base_vetorial import (
+    obter_base_vetorial,
+    obter_base_documentos,
+    gravar_vetores,
+    apagar_blocos,
+    ids_das_fontes,
+    nome_colecao,
+    reatribuir_fonte,
+    COLECAO_PADRAO,
+)
+from .geracoes import erro_indice_incompativel
+from .cache_paginas import hash_arquivo, ler_paginas, apagar_paginas, GravacaoPaginas, EntradaCorrompida
+from .roteamento import Centroide
 
 logger = logging.getLogger(__name__)
+load_env()
+
+# Pipeline de ingestão: blocos por chamada de embeddings, blocos por gravação no
+# índice, lotes em espera entre as etapas e chamadas de embeddings em paralelo
+INGESTAO_LOTE_EMBEDDINGS = int(os.getenv("INGESTAO_LOTE_EMBEDDINGS", "64"))
+INGESTAO_LOTE_GRAVACAO = int(os.getenv("INGESTAO_LOTE_GRAVACAO", "256"))
+INGESTAO_FILA = int(os.getenv("INGESTAO_FILA", "4"))
+INGESTAO_EMBEDDERS = int(os.getenv("INGESTAO_EMBEDDERS", "2"))
 
 def validar_upload_pdf(file, max_bytes: int):
     if not file.filename:
@@ -17,7 +40,7 @@ def validar_upload_pdf(file, max_bytes: int):
     file_size = file.file.tell()
     file.file.seek(0)
     if file_size > max_bytes:
-        raise HTTPException(status_code=400, detail="Arquivo muito grande (máximo 10MB)")
+        raise HTTPException(status_code=400, detail=f"Arquivo muito grande (máximo {max_bytes // (1024 * 1024)}MB)")
 
 async def salvar_pdf(file, docs_dir: str):
     os.makedirs(docs_dir, exist_ok=True)
@@ -40,58 +63,279 @@ def restaurar_pdf_se_necessario(caminho_pdf: str, documento_registro, docs_dir:
         return
     raise HTTPException(status_code=404, detail="Arquivo físico não encontrado e sem backup no banco.")
 
-def carregar_paginas_pdf(caminho_pdf: str):
-    loader = PyPDFLoader(caminho_pdf)
-    paginas_pdf = loader.load()
-    if not paginas_pdf or all(not doc.page_content.strip() for doc in paginas_pdf):
+def iterar_paginas_pdf(caminho_pdf: str, hash_pdf: str = None):
+    """Páginas uma a uma: do cache de páginas, ou do PyPDFLoader gravando o cache."""
+    hash_pdf = hash_pdf or hash_arquivo(caminho_pdf)
+    paginas_em_cache = ler_paginas(hash_pdf, caminho_pdf)
+    entregues = 0
+    if paginas_em_cache is not None:
+        try:
+            for pagina in paginas_em_cache:
+                yield pagina
+                entregues += 1
+            return
+        except EntradaCorrompida:
+            # O parser regrava a entrada inteira, mas só entrega as páginas que faltaram
+            pass
+
+    from langchain_community.document_loaders import PyPDFLoader
+    with GravacaoPaginas(hash_pdf) as cache:
+        for numero, pagina in enumerate(PyPDFLoader(caminho_pdf).lazy_load()):
+            cache.gravar(pagina)
+            if numero >= entregues:
+                yield pagina
+
+class _Falha:
+    def __init__(self, erro: Exception):
+        self.erro = erro
+
+_FIM = object()
+
+def _colocar(fila, item, parar):
+    # put com espera limitada: se a etapa seguinte desistiu, não fica preso na fila cheia
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.2)
+            return
+        except queue.Full:
+            continue
+
+def _tirar(fila, parar):
+    while not parar.is_set():
+        try:
+            return fila.get(timeout=0.2)
+        except queue.Empty:
+            continue
+    return _FIM
+
+def indexar_pdf(caminho_pdf: str, embeddings, diretorio: str, colecao: str, configuracao: dict) -> int:
+    """
+    Ingestão em pipeline: leitura+divisão das páginas, embeddings e gravação
+    rodam ao mesmo tempo, ligadas por filas limitadas. A memória fica presa ao
+    tamanho das filas e dos lotes, não ao tamanho do PDF. Os ids dos blocos
+    vêm do hash do PDF, então repetir uma ingestão interrompida não duplica.
+    Devolve quantos blocos da coleção são deste PDF: zero se outro PDF com o
+    mesmo conteúdo já os tinha gravado.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from .rag_engine import CHUNK_SEPARATORS
+
+    try:
+        base_vetorial = obter_base_vetorial(embeddings, diretorio, colecao)
+    except Exception as e:
+        if "dimension" in str(e).lower():
+            raise erro_indice_incompativel(e)
+        raise
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=configuracao["chunk_size"],
+        chunk_overlap=configuracao["chunk_overlap"],
+        separators=CHUNK_SEPARATORS
+    )
+    hash_pdf = hash_arquivo(caminho_pdf)
+    fila_blocos = queue.Queue(maxsize=INGESTAO_FILA)
+    fila_vetores = queue.Queue(maxsize=INGESTAO_FILA)
+    parar = threading.Event()
+    paginas_com_texto = 0
+
+    def dividir():
+        nonlocal paginas_com_texto
+        try:
+            with medir_etapa("ingestao.leitura"):
+                lote, indice = [], 0
+                for pagina in iterar_paginas_pdf(caminho_pdf, hash_pdf):
+                    if parar.is_set():
+                        return
+                    if pagina.page_content.strip():
+                        paginas_com_texto += 1
+                    incrementar("ingestao.paginas")
+                    # O splitter trata cada página separadamente, como em split_documents
+                    for bloco in splitter.split_documents([pagina]):
+                        if not bloco.page_content.strip():
+                            continue
+                        lote.append((f"{hash_pdf}:{indice}", bloco))
+                        indice += 1
+                        if len(lote) == INGESTAO_LOTE_EMBEDDINGS:
+                            _colocar(fila_blocos, lote, parar)
+                            lote = []
+                if lote:
+                    _colocar(fila_blocos, lote, parar)
+        except Exception as e:
+            _colocar(fila_blocos, _Falha(e), parar)
+        finally:
+            for _ in range(INGESTAO_EMBEDDERS):
+                _colocar(fila_blocos, _FIM, parar)
+
+    def embedar():
+        try:
+            with medir_etapa("ingestao.embeddings"):
+                while (lote := _tirar(fila_blocos, parar)) is not _FIM:
+                    if isinstance(lote, _Falha):
+                        _colocar(fila_vetores, lote, parar)
+                        continue
+                    vetores = embeddings.embed_documents([bloco.page_content for _, bloco in lote])
+                    _colocar(fila_vetores, (lote, vetores), parar)
+        except Exception as e:
+            _colocar(fila_vetores, _Falha(e), parar)
+        finally:
+            _colocar(fila_vetores, _FIM, parar)
+
+    # Cada thread leva uma cópia do contexto da requisição (ex.: perfil em andamento)
+    etapas = [threading.Thread(target=contextvars.copy_context().run, args=(dividir,), daemon=True)]
+    etapas += [
+        threading.Thread(target=contextvars.copy_context().run, args=(embedar,), daemon=True)
+        for _ in range(INGESTAO_EMBEDDERS)
+    ]
+    for etapa in etapas:
+        etapa.start()
+
+    # Gravação nesta thread, juntando lotes de embeddings até INGESTAO_LOTE_GRAVACAO
+    total, finalizadas, pendentes = 0, 0, []
+    centroide = Centroide()
+    def gravar():
+        nonlocal total, pendentes
+        blocos = [bloco for _, bloco, _ in pendentes]
+        vetores = [v for _, _, v in pendentes]
+        gravar_vetores(base_vetorial, blocos, vetores, [i for i, _, _ in pendentes])
+        centroide.acumular(vetores)
+        total += len(blocos)
+        incrementar("ingestao.blocos", len(blocos))
+        pendentes = []
+
+    try:
+        with medir_etapa("ingestao.gravacao"):
+            while finalizadas < INGESTAO_EMBEDDERS:
+                item = fila_vetores.get()
+                if item is _FIM:
+                    finalizadas += 1
+                    continue
+                if isinstance(item, _Falha):
+                    raise item.erro
+                lote, vetores = item
+                pendentes.extend((id_bloco, bloco, vetor) for (id_bloco, bloco), vetor in zip(lote, vetores))
+                if len(pendentes) >= INGESTAO_LOTE_GRAVACAO:
+                    gravar()
+            if pendentes:
+                gravar()
+    except Exception as e:
+        parar.set()
+        if "dimension" in str(e).lower():
+            raise erro_indice_incompativel(e)
+        raise
+    finally:
+        parar.set()
+        # Esvazia as filas para nenhuma etapa ficar presa num put
+        for fila in (fila_blocos, fila_vetores):
+            while not fila.empty():
+                fila.get_nowait()
+        for etapa in etapas:
+            etapa.join()
+
+    if paginas_com_texto == 0:
         raise HTTPException(
             status_code=400,
             detail="O PDF está vazio ou não contém texto extraível. Se for um documento escaneado, ele precisa de OCR."
         )
-    return paginas_pdf
-
-def splitar_paginas(paginas_pdf, chunk_size: int, chunk_overlap: int, separators: list[str]):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=separators
-    )
-    blocos = splitter.split_documents(paginas_pdf)
-    blocos = [c for c in blocos if c.page_content.strip()]
-    if not blocos:
+    if total == 0:
         raise HTTPException(status_code=400, detail="Não foi possível extrair blocos de texto significativos deste documento.")
-    return blocos
+    base_vetorial.persist()
+    # Vetor do PDF inteiro, para o roteamento escolher documentos antes dos blocos
+    centroide.gravar(base_vetorial, caminho_pdf, hash_pdf)
+    prefixo = f"{hash_pdf}:"
+    return sum(1 for id_bloco in ids_das_fontes(base_vetorial, [caminho_pdf]) if id_bloco.startswith(prefixo))
 
-def criar_ou_validar_base(embeddings, chroma_dir: str):
+def criar_ou_validar_base(embeddings, chroma_dir: str, colecao: str = COLECAO_PADRAO):
     try:
-        base_vetorial = Chroma(persist_directory=chroma_dir, embedding_function=embeddings)
+        base_vetorial = obter_base_vetorial(embeddings, chroma_dir, colecao)
         total = get_vector_count(base_vetorial)
         return base_vetorial, total
     except Exception as e:
         if "dimension" in str(e).lower():
-            logger.warning(f"⚠️ Erro de dimensão detectado. Resetando índice: {e}")
-            limpar_chroma_db()
-            raise
+            raise erro_indice_incompativel(e)
         logger.error(f"Erro inesperado no Chroma: {e}")
         raise
 
-def persistir_blocos(blocos, embeddings, chroma_dir: str):
-    try:
-        base_vetorial = Chroma.from_documents(
-            documents=blocos,
-            embedding=embeddings,
-            persist_directory=chroma_dir
-        )
-    except Exception as e:
-        if "dimension" in str(e).lower():
-            logger.warning("⚠️ Erro de dimensão ao salvar. Limpando e tentando novamente...")
-            limpar_chroma_db()
-            base_vetorial = Chroma.from_documents(
-                documents=blocos,
-                embedding=embeddings,
-                persist_directory=chroma_dir
-            )
+def fontes_documento(documento, docs_dir: str) -> set:
+    """Caminhos que podem estar no "source" dos blocos: a cópia da API e o caminho registrado."""
+    return {os.path.join(docs_dir, documento.nome_arquivo), documento.caminho_arquivo}
+
+def _hash_do_id(id_bloco: str) -> str:
+    return id_bloco.split(":", 1)[0]
+
+def hashes_indexados(base_vetorial, fontes) -> set:
+    """Conteúdos (hash do PDF, prefixo dos ids) com blocos indexados a partir desses caminhos."""
+    return {_hash_do_id(id_bloco) for id_bloco in ids_das_fontes(base_vetorial, fontes) if ":" in id_bloco}
+
+def sobreviventes_na_colecao(candidatos, documento, colecao: str) -> dict:
+    """
+    Por hash, o primeiro dos `candidatos` (outros documentos processados com
+    esse conteúdo) que está na mesma coleção que `documento`.
+    """
+    sobreviventes = {}
+    for outro in candidatos:
+        if outro.id != documento.id and outro.preprocessado and nome_colecao(outro.usuario_id) == colecao:
+            sobreviventes.setdefault(outro.hash_conteudo, outro)
+    return sobreviventes
+
+def desvincular_blocos(base_vetorial, fontes, sobreviventes: dict = None, manter_hash: str = None):
+    """
+    Tira da coleção os blocos e centroides indexados a partir de `fontes`.
+    Os ids vêm do conteúdo (`<hash>:<i>`, centroide `<hash>`): um PDF igual a
+    outro da coleção não grava nada e fica com os blocos do primeiro. Por isso,
+    num hash de `sobreviventes` ({hash: caminho do outro PDF}) blocos e
+    centroide passam a apontar para o outro PDF em vez de sair; os de
+    `manter_hash` ficam como estão. Devolve os blocos apagados e, por hash,
+    quantos foram repassados.
+    """
+    sobreviventes = sobreviventes or {}
+    apagar, repassar = [], {}
+    for id_bloco in ids_das_fontes(base_vetorial, fontes):
+        hash_bloco = _hash_do_id(id_bloco)
+        if hash_bloco == manter_hash:
+            continue
+        if hash_bloco in sobreviventes:
+            repassar.setdefault(hash_bloco, []).append(id_bloco)
         else:
-            raise e
-    base_vetorial.persist()
-    return base_vetorial
+            apagar.append(id_bloco)
+    removidos = apagar_blocos(base_vetorial, ids=apagar)
+    for hash_bloco, ids in repassar.items():
+        reatribuir_fonte(base_vetorial, ids, sobreviventes[hash_bloco])
+
+    base_documentos = obter_base_documentos(base_vetorial)
+    if base_documentos is not None:
+        centroides = [h for h in ids_das_fontes(base_documentos, fontes) if h != manter_hash]
+        apagar_blocos(base_documentos, ids=[h for h in centroides if h not in sobreviventes])
+        for hash_bloco in centroides:
+            if hash_bloco in sobreviventes:
+                reatribuir_fonte(base_documentos, [hash_bloco], sobreviventes[hash_bloco])
+    incrementar("documentos.blocos_apagados", removidos)
+    return removidos, {hash_bloco: len(ids) for hash_bloco, ids in repassar.items()}
+
+def apagar_documento_indexado(documento, base_vetorial, docs_dir: str, sobreviventes: dict = None,
+                              manter_cache_paginas: bool = False):
+    """
+    Tira do índice os blocos do documento e o seu centroide (ou os repassa ao
+    documento sobrevivente com o mesmo conteúdo, ver desvincular_blocos),
+    depois a cópia do PDF em `docs_dir` e a entrada do cache de páginas.
+    Devolve os blocos apagados e os repassados por hash.
+    """
+    sobreviventes = sobreviventes or {}
+    caminho_pdf = os.path.join(docs_dir, documento.nome_arquivo)
+    removidos, repassados = desvincular_blocos(base_vetorial, fontes_documento(documento, docs_dir), sobreviventes)
+    hash_pdf = documento.hash_conteudo
+    if hash_pdf and hash_pdf not in sobreviventes:
+        # Conteúdo só deste documento: os ids pegam também os blocos indexados a partir
+        # de outro caminho (ex.: cópia temporária numa reconstrução)
+        ids = [f"{hash_pdf}:{i}" for i in range(documento.numero_chunks or 0)]
+        extras = apagar_blocos(base_vetorial, ids=ids)
+        base_documentos = obter_base_documentos(base_vetorial)
+        if base_documentos is not None:
+            apagar_blocos(base_documentos, ids=[hash_pdf])
+        incrementar("documentos.blocos_apagados", extras)
+        removidos += extras
+
+    # Só a cópia que a API guardou: na ingestão em lote o caminho é a pasta de origem do cliente
+    if os.path.exists(caminho_pdf):
+        os.remove(caminho_pdf)
+    if hash_pdf and not manter_cache_paginas:
+        apagar_paginas(hash_pdf)
+    return removidos, repassados
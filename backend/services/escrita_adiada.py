@@ -0,0 +1,165 @@
+"""
+Escrita adiada (write-behind) das mensagens do chat.
+
+Com ESCRITA_ADIADA=true, as mensagens respondidas entram numa fila em memória
+e uma tarefa do worker as grava em lotes, numa transação por lote, fora do
+caminho da resposta. A fila é descarregada antes de qualquer leitura de
+histórico deste worker e no desligamento (lifespan do main.py). Se o processo
+morrer sem desligar, o que estiver pendente se perde.
+
+Falha de conexão com o banco devolve o lote à fila. Qualquer outro erro é de
+alguma linha: elas são gravadas uma a uma, e a que falhar ESCRITA_TENTATIVAS
+vezes sai da fila para ESCRITA_DESCARTES (JSON lines), sem travar as demais.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as TempoEsgotadoPool
+from ..config import BASE_DIR, load_env
+from ..metricas import incrementar, registrar_fonte
+
+logger = logging.getLogger(__name__)
+load_env()
+
+ESCRITA_ADIADA = os.getenv("ESCRITA_ADIADA", "false").strip().lower() == "true"
+# Grava quando juntar este número de mensagens ou a cada intervalo, o que vier antes
+ESCRITA_LOTE = int(os.getenv("ESCRITA_LOTE", "100"))
+ESCRITA_INTERVALO_MS = int(os.getenv("ESCRITA_INTERVALO_MS", "200"))
+ESCRITA_TENTATIVAS = int(os.getenv("ESCRITA_TENTATIVAS", "3"))
+ESCRITA_DESCARTES = os.getenv("ESCRITA_DESCARTES") or os.path.join(BASE_DIR, "data", "mensagens_descartadas.jsonl")
+
+def _transitorio(erro: Exception) -> bool:
+    """Banco fora do ar, conexão caída ou pool esgotado: o lote inteiro pode ir de novo."""
+    if isinstance(erro, (OperationalError, InterfaceError, TempoEsgotadoPool, OSError, asyncio.TimeoutError)):
+        return True
+    return isinstance(erro, DBAPIError) and erro.connection_invalidated
+
+def _descartar(mensagem: dict, erro: Exception):
+    logger.error(
+        f"❌ Mensagem adiada descartada após {ESCRITA_TENTATIVAS} tentativas "
+        f"(conversa {mensagem['conversa_id']}): {erro}"
+    )
+    incrementar("escrita_adiada.descartadas")
+    try:
+        os.makedirs(os.path.dirname(ESCRITA_DESCARTES), exist_ok=True)
+        with open(ESCRITA_DESCARTES, "a", encoding="utf-8") as f:
+            f.write(json.dumps({**mensagem, "erro": str(erro)}, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.error(f"❌ Não foi possível gravar em {ESCRITA_DESCARTES}: {e}")
+
+class FilaMensagens:
+    def __init__(self):
+        self._pendentes = []
+        # Falhas de cada mensagem (pelo id do dict) em gravações linha a linha
+        self._falhas = {}
+        self._trava = None
+        self._cheia = None
+        self._tarefa = None
+
+    def _primitivas(self):
+        # Criadas no event loop do worker, na primeira vez que são usadas
+        if self._trava is None:
+            self._trava = asyncio.Lock()
+            self._cheia = asyncio.Event()
+
+    def enfileirar(self, conversa_id: int, pergunta: str, resposta: str):
+        self._primitivas()
+        # Horário de agora, não o da gravação: a ordem do histórico não muda
+        self._pendentes.append({"conversa_id": conversa_id, "conteudo": pergunta,
+                                "remetente": "user", "criado_em": datetime.utcnow()})
+        self._pendentes.append({"conversa_id": conversa_id, "conteudo": resposta,
+                                "remetente": "ia", "criado_em": datetime.utcnow()})
+        incrementar("escrita_adiada.enfileiradas", 2)
+        if len(self._pendentes) >= ESCRITA_LOTE:
+            self._cheia.set()
+
+    async def descarregar(self) -> bool:
+        """
+        Grava tudo o que está pendente; quem chama só continua depois do commit.
+        Nunca levanta: devolve False se algo ficou na fila para o próximo ciclo.
+        """
+        from ..database import AsyncSessionLocal
+        from ..models import Mensagem
+
+        self._primitivas()
+        async with self._trava:
+            lote, self._pendentes = self._pendentes, []
+            if not lote:
+                return True
+            try:
+                async with AsyncSessionLocal() as db:
+                    db.add_all([Mensagem(**mensagem) for mensagem in lote])
+                    await db.commit()
+            except Exception as e:
+                if _transitorio(e):
+                    # Volta para a frente da fila e tenta de novo no próximo ciclo
+                    self._pendentes[:0] = lote
+                    incrementar("escrita_adiada.falhas")
+                    logger.error(f"❌ Falha ao gravar {len(lote)} mensagens adiadas: {e}")
+                    return False
+                logger.warning(f"⚠️ Lote de {len(lote)} mensagens adiadas recusado ({e}); gravando uma a uma")
+                return await self._gravar_uma_a_uma(lote)
+            incrementar("escrita_adiada.lotes")
+            incrementar("escrita_adiada.gravadas", len(lote))
+            return True
+
+    async def _gravar_uma_a_uma(self, lote) -> bool:
+        from ..database import AsyncSessionLocal
+        from ..models import Mensagem
+
+        restantes = []
+        async with AsyncSessionLocal() as db:
+            for posicao, mensagem in enumerate(lote):
+                try:
+                    db.add(Mensagem(**mensagem))
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    if _transitorio(e):
+                        restantes.extend(lote[posicao:])
+                        incrementar("escrita_adiada.falhas")
+                        logger.error(f"❌ Falha ao gravar {len(lote) - posicao} mensagens adiadas: {e}")
+                        break
+                    falhas = self._falhas.pop(id(mensagem), 0) + 1
+                    if falhas >= ESCRITA_TENTATIVAS:
+                        _descartar(mensagem, e)
+                    else:
+                        self._falhas[id(mensagem)] = falhas
+                        restantes.append(mensagem)
+                    continue
+                self._falhas.pop(id(mensagem), None)
+                incrementar("escrita_adiada.gravadas")
+        self._pendentes[:0] = restantes
+        return not restantes
+
+    async def _executar(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._cheia.wait(), timeout=ESCRITA_INTERVALO_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._cheia.clear()
+            if not await self.descarregar():
+                await asyncio.sleep(1)
+
+    def iniciar(self):
+        self._primitivas()
+        self._tarefa = asyncio.create_task(self._executar())
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        await self.descarregar()
+
+    def pendentes(self) -> int:
+        return len(self._pendentes)
+
+fila_mensagens = FilaMensagens()
+registrar_fonte("escrita_adiada", lambda: {"pendentes": fila_mensagens.pendentes()})
@@ -0,0 +1,329 @@
+"""
+Gerações versionadas do índice vetorial.
+
+Cada geração é uma pasta `CHROMA_DIR/geracoes/<id>` com um `geracao.json`
+(modelo de embeddings e parâmetros de chunk). O arquivo `CHROMA_DIR/ATUAL`
+aponta para a geração servida e é trocado atomicamente. Sem `ATUAL`, a
+própria `CHROMA_DIR` é a geração (layout anterior às gerações). Com
+`CHROMA_HOST` o ponteiro fica no servidor Chroma, junto com a configuração,
+para todas as réplicas servirem a mesma geração.
+
+Uma reconstrução monta uma geração nova a partir dos PDFs guardados no banco
+enquanto a antiga continua atendendo; no fim o ponteiro é trocado e as
+gerações antigas são apagadas depois de um intervalo de carência, pelo
+processo que reconstruiu ou, se ele sair antes, na subida do próximo.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+from fastapi import HTTPException
+from ..config import load_env, CHROMA_DIR
+from ..utils import trava_arquivo, tentar_trava, ARQUIVO_TRAVA, ARQUIVO_PORTAO, ARQUIVO_PROCESSO
+from .base_vetorial import (
+    CHROMA_HOST,
+    VECTOR_BACKEND,
+    apagar_colecoes_servidor,
+    descartar_bases_em_cache,
+    gravar_ponteiro_servidor,
+    ler_ponteiro_servidor,
+    nome_colecao,
+)
+from .rag_engine import CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, obter_embeddings
+
+logger = logging.getLogger(__name__)
+load_env()
+
+# Tempo que gerações substituídas ficam no disco para as buscas em andamento terminarem
+GERACAO_CARENCIA_S = float(os.getenv("GERACAO_CARENCIA_S", "120"))
+# Com CHROMA_HOST: segundos que cada processo reaproveita o ponteiro lido do servidor
+GERACAO_PONTEIRO_TTL_S = float(os.getenv("GERACAO_PONTEIRO_TTL_S", "2"))
+
+ARQUIVO_ATUAL = "ATUAL"
+ARQUIVO_GERACAO = "geracao.json"
+ARQUIVO_RECONSTRUCAO = ".trava_reconstrucao"
+PASTA_GERACOES = "geracoes"
+
+# Com o Chroma em servidor não há pasta compartilhada entre as réplicas
+_PONTEIRO_NO_SERVIDOR = VECTOR_BACKEND == "chroma" and bool(CHROMA_HOST)
+
+_estado_reconstrucao = {"em_andamento": False}
+_trava_estado = threading.Lock()
+_ponteiro_servidor = {"dados": None, "lido_em": None}
+_trava_ponteiro = threading.Lock()
+
+def _configuracao_padrao() -> dict:
+    return {"modelo_embeddings": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+def _ler_json(caminho: str):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _escrever_json_atomico(caminho: str, dados: dict):
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+def _ler_ponteiro():
+    """Conteúdo do ponteiro da geração ativa ({"geracao", "ativada_em", ...}), ou None."""
+    local = _ler_json(os.path.join(CHROMA_DIR, ARQUIVO_ATUAL))
+    if not _PONTEIRO_NO_SERVIDOR:
+        return local
+    with _trava_ponteiro:
+        lido_em = _ponteiro_servidor["lido_em"]
+        if lido_em is not None and time.monotonic() - lido_em < GERACAO_PONTEIRO_TTL_S:
+            return _ponteiro_servidor["dados"]
+        try:
+            dados = ler_ponteiro_servidor()
+        except Exception as e:
+            if lido_em is None:
+                raise
+            # Servidor fora do ar: a última leitura continua valendo até ele voltar
+            logger.warning(f"⚠️ Ponteiro da geração indisponível no servidor Chroma: {e}")
+            return _ponteiro_servidor["dados"]
+        # Instalação que ativou gerações antes do ponteiro ir para o servidor
+        dados = dados or local
+        _ponteiro_servidor.update({"dados": dados, "lido_em": time.monotonic()})
+        return dados
+
+def geracao_ativa():
+    """Id da geração servida, ou None no layout antigo (tudo direto em CHROMA_DIR)."""
+    atual = _ler_ponteiro()
+    return atual["geracao"] if atual else None
+
+def diretorio_geracao(geracao) -> str:
+    if geracao is None:
+        return CHROMA_DIR
+    return os.path.join(CHROMA_DIR, PASTA_GERACOES, geracao)
+
+def diretorio_ativo() -> str:
+    return diretorio_geracao(geracao_ativa())
+
+def configuracao_geracao(diretorio: str) -> dict:
+    """Modelo de embeddings e parâmetros de chunk com que a geração foi construída."""
+    configuracao = _configuracao_padrao()
+    manifesto = _ler_json(os.path.join(diretorio, ARQUIVO_GERACAO))
+    if manifesto is None and _PONTEIRO_NO_SERVIDOR:
+        # A pasta só existe na réplica que construiu; as outras leem do ponteiro
+        atual = _ler_ponteiro()
+        if atual and diretorio_geracao(atual["geracao"]) == diretorio:
+            manifesto = atual.get("configuracao")
+    if manifesto:
+        configuracao.update({chave: manifesto[chave] for chave in configuracao if chave in manifesto})
+    return configuracao
+
+def configuracao_ativa() -> dict:
+    return configuracao_geracao(diretorio_ativo())
+
+def indice_ativo():
+    """Pasta e configuração da geração ativa, lidas juntas para não atravessar uma troca."""
+    diretorio = diretorio_ativo()
+    return diretorio, configuracao_geracao(diretorio)
+
+def _criar_geracao(configuracao: dict):
+    geracao = f"g{datetime.utcnow():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:6]}"
+    diretorio = diretorio_geracao(geracao)
+    os.makedirs(diretorio)
+    _escrever_json_atomico(os.path.join(diretorio, ARQUIVO_GERACAO), {
+        **configuracao,
+        "geracao": geracao,
+        "criada_em": datetime.utcnow().isoformat(),
+    })
+    return geracao, diretorio
+
+def ativar_geracao(geracao: str):
+    """Troca atômica do ponteiro: a próxima requisição de qualquer worker já usa a nova geração."""
+    ponteiro = {"geracao": geracao, "ativada_em": datetime.utcnow().isoformat()}
+    if _PONTEIRO_NO_SERVIDOR:
+        ponteiro["configuracao"] = configuracao_geracao(diretorio_geracao(geracao))
+        gravar_ponteiro_servidor(ponteiro)
+        with _trava_ponteiro:
+            _ponteiro_servidor.update({"dados": ponteiro, "lido_em": time.monotonic()})
+    else:
+        with trava_arquivo(CHROMA_DIR):
+            _escrever_json_atomico(os.path.join(CHROMA_DIR, ARQUIVO_ATUAL), ponteiro)
+    descartar_bases_em_cache()
+    logger.info(f"🔁 Geração {geracao} ativada.")
+
+def coletar_geracoes_antigas():
+    """Apaga gerações anteriores à ativa (e os arquivos do layout antigo, se já houver gerações)."""
+    ativa = geracao_ativa()
+    if ativa is None:
+        return
+    if _PONTEIRO_NO_SERVIDOR:
+        apagar_colecoes_servidor(diretorio_geracao(ativa))
+        logger.info("🧹 Gerações antigas removidas do servidor Chroma.")
+        return
+    with trava_arquivo(CHROMA_DIR):
+        pasta_geracoes = os.path.join(CHROMA_DIR, PASTA_GERACOES)
+        for nome in os.listdir(pasta_geracoes):
+            # Ids são ordenáveis por data: as mais novas que a ativa ainda estão sendo construídas
+            if nome < ativa:
+                shutil.rmtree(os.path.join(pasta_geracoes, nome), ignore_errors=True)
+        for nome in os.listdir(CHROMA_DIR):
+            if nome in (ARQUIVO_ATUAL, PASTA_GERACOES, ARQUIVO_TRAVA, ARQUIVO_PORTAO, ARQUIVO_RECONSTRUCAO, ARQUIVO_PROCESSO):
+                continue
+            caminho = os.path.join(CHROMA_DIR, nome)
+            if os.path.isdir(caminho):
+                shutil.rmtree(caminho, ignore_errors=True)
+            else:
+                os.remove(caminho)
+    logger.info("🧹 Gerações antigas removidas.")
+
+def _agendar_coleta(atraso: float):
+    def coletar():
+        try:
+            coletar_geracoes_antigas()
+        except Exception as e:
+            logger.error(f"❌ Falha ao apagar gerações antigas: {e}")
+
+    temporizador = threading.Timer(max(0.0, atraso), coletar)
+    temporizador.daemon = True
+    temporizador.start()
+
+def coletar_geracoes_pendentes():
+    """
+    Na subida: agenda a coleta que o processo da última reconstrução pode não
+    ter feito, respeitando o que ainda falta da carência.
+    """
+    try:
+        atual = _ler_ponteiro()
+    except Exception as e:
+        logger.error(f"❌ Ponteiro da geração ilegível, coleta adiada para a próxima reconstrução: {e}")
+        return
+    if not atual:
+        return
+    decorrido = (datetime.utcnow() - datetime.fromisoformat(atual["ativada_em"])).total_seconds()
+    _agendar_coleta(GERACAO_CARENCIA_S - decorrido)
+
+def _indexar_documento(documento, diretorio: str, configuracao: dict, embeddings) -> int:
+    from .documentos_service import indexar_pdf
+
+    caminho_pdf = documento.caminho_arquivo
+    temporario = None
+    if not os.path.exists(caminho_pdf):
+        if not documento.conteudo_binario:
+            raise FileNotFoundError("Arquivo físico não encontrado e sem backup no banco.")
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(documento.conteudo_binario)
+            temporario = caminho_pdf = f.name
+    try:
+        return indexar_pdf(caminho_pdf, embeddings, diretorio, nome_colecao(documento.usuario_id), configuracao)
+    finally:
+        if temporario:
+            os.remove(temporario)
+
+def reconstruir_indice(configuracao: dict = None, motivo: str = "manual"):
+    """
+    Constrói uma geração nova com todos os documentos já processados e a ativa.
+    Só uma reconstrução roda por vez, mesmo com vários workers.
+    """
+    from ..database import SessionLocal
+    from ..models import Documento
+
+    configuracao = {**configuracao_ativa(), **(configuracao or {})}
+    with tentar_trava(os.path.join(CHROMA_DIR, ARQUIVO_RECONSTRUCAO)) as obtida:
+        if not obtida:
+            logger.info("Reconstrução já em andamento em outro worker.")
+            return None
+
+        geracao, diretorio = _criar_geracao(configuracao)
+        with _trava_estado:
+            _estado_reconstrucao.update({
+                "em_andamento": True, "geracao": geracao, "motivo": motivo, "configuracao": configuracao,
+                "inicio": datetime.utcnow().isoformat(), "documentos_processados": 0, "falhas": {},
+            })
+        logger.info(f"🏗️ Reconstruindo índice na geração {geracao} ({motivo}).")
+        inicio = time.perf_counter()
+        embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+        db = SessionLocal()
+        try:
+            chunks_por_documento = {}
+            # Repete até não sobrar documento: os processados durante a reconstrução também entram
+            while True:
+                pendentes = db.query(Documento).filter(
+                    Documento.preprocessado == True,  # noqa: E712
+                    Documento.id.notin_(list(chunks_por_documento) or [-1]),
+                ).all()
+                with _trava_estado:
+                    falhas_anteriores = set(_estado_reconstrucao["falhas"])
+                pendentes = [d for d in pendentes if d.nome_arquivo not in falhas_anteriores]
+                if not pendentes:
+                    break
+                for documento in pendentes:
+                    try:
+                        chunks_por_documento[documento.id] = _indexar_documento(
+                            documento, diretorio, configuracao, embeddings
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Falha ao reindexar {documento.nome_arquivo}: {e}")
+                        with _trava_estado:
+                            _estado_reconstrucao["falhas"][documento.nome_arquivo] = str(getattr(e, "detail", e))
+                        continue
+                    with _trava_estado:
+                        _estado_reconstrucao["documentos_processados"] += 1
+
+            ativar_geracao(geracao)
+            for documento_id, numero_chunks in chunks_por_documento.items():
+                db.query(Documento).filter(Documento.id == documento_id).update({Documento.numero_chunks: numero_chunks})
+            db.commit()
+        except Exception as e:
+            logger.error(f"❌ Reconstrução da geração {geracao} abortada: {e}")
+            shutil.rmtree(diretorio, ignore_errors=True)
+            raise
+        finally:
+            db.close()
+            with _trava_estado:
+                _estado_reconstrucao["em_andamento"] = False
+                _estado_reconstrucao["duracao_s"] = round(time.perf_counter() - inicio, 1)
+
+    _agendar_coleta(GERACAO_CARENCIA_S)
+    return geracao
+
+def agendar_reconstrucao(configuracao: dict = None, motivo: str = "manual") -> bool:
+    """Dispara a reconstrução em segundo plano; False se já havia uma rodando neste processo."""
+    with _trava_estado:
+        if _estado_reconstrucao.get("em_andamento"):
+            return False
+        _estado_reconstrucao["em_andamento"] = True
+
+    def executar():
+        try:
+            reconstruir_indice(configuracao, motivo)
+        except Exception:
+            pass  # já registrado em reconstruir_indice
+        finally:
+            with _trava_estado:
+                _estado_reconstrucao["em_andamento"] = False
+
+    threading.Thread(target=executar, name="reconstrucao-indice", daemon=True).start()
+    return True
+
+def estado_reconstrucao() -> dict:
+    with _trava_estado:
+        estado = dict(_estado_reconstrucao)
+    estado["geracao_ativa"] = geracao_ativa()
+    estado["configuracao_ativa"] = configuracao_ativa()
+    return estado
+
+def erro_indice_incompativel(e: Exception) -> HTTPException:
+    """
+    Resposta para erro de dimensão: em vez de apagar a base, agenda uma geração
+    nova com a configuração atual e pede para o usuário tentar de novo.
+    """
+    logger.error(f"❌ Índice incompatível com o modelo de embeddings: {e}")
+    agendar_reconstrucao(_configuracao_padrao(), motivo="dimensao")
+    return HTTPException(
+        status_code=503,
+        detail="O índice é incompatível com o modelo de embeddings atual e está sendo reconstruído. Tente novamente em alguns minutos.",
+        headers={"Retry-After": "60"},
+    )
@@ -0,0 +1,248 @@
+"""
+Chamadas ao LLM com prazo, novas tentativas, requisição duplicada (hedge) e
+disjuntor para um modelo reserva.
+
+Cada tentativa espera no máximo LLM_TIMEOUT_S; se passar LLM_HEDGE_S sem
+resposta, uma cópia da mesma chamada é disparada e vale a que voltar
+primeiro. Erros transitórios (timeout, 429, 5xx, rede) são repetidos com
+backoff exponencial com jitter até LLM_TENTATIVAS ou até o prazo total
+LLM_PRAZO_S. Se, entre as últimas chamadas, a fração de erros ou de respostas
+acima de LLM_LENTO_S passar de LLM_DISJUNTOR_LIMIAR, o disjuntor abre e as
+chamadas vão para o modelo reserva por LLM_DISJUNTOR_ABERTO_S; depois disso,
+uma chamada de teste decide se o principal volta.
+
+Uma chamada abandonada (prazo estourado) continua rodando na thread até o
+provedor responder: ela conta como ruim no disjuntor, e o hedge não é
+disparado quando as LLM_THREADS já estão ocupadas.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fastapi import HTTPException
+from ..config import load_env
+from ..metricas import incrementar, registrar_fonte
+
+logger = logging.getLogger(__name__)
+load_env()
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_PRAZO_S = float(os.getenv("LLM_PRAZO_S", "60"))
+LLM_TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", "3"))
+LLM_BACKOFF_S = float(os.getenv("LLM_BACKOFF_S", "0.5"))
+# 0 desliga o hedge
+LLM_HEDGE_S = float(os.getenv("LLM_HEDGE_S", "4"))
+LLM_LENTO_S = float(os.getenv("LLM_LENTO_S", "10"))
+LLM_DISJUNTOR_JANELA = int(os.getenv("LLM_DISJUNTOR_JANELA", "20"))
+LLM_DISJUNTOR_MINIMO = int(os.getenv("LLM_DISJUNTOR_MINIMO", "10"))
+LLM_DISJUNTOR_LIMIAR = float(os.getenv("LLM_DISJUNTOR_LIMIAR", "0.5"))
+LLM_DISJUNTOR_ABERTO_S = float(os.getenv("LLM_DISJUNTOR_ABERTO_S", "30"))
+LLM_THREADS = int(os.getenv("LLM_THREADS", "32"))
+
+# Chamadas rodam aqui para poderem ser abandonadas (prazo) ou duplicadas (hedge)
+_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+# Chamadas no executor ainda sem resultado, rodando ou na fila dele (inclui as abandonadas)
+_ocupadas = 0
+_trava_ocupadas = threading.Lock()
+
+def _liberar(_futuro):
+    global _ocupadas
+    with _trava_ocupadas:
+        _ocupadas -= 1
+
+def _submeter(funcao, *args):
+    global _ocupadas
+    with _trava_ocupadas:
+        _ocupadas += 1
+    futuro = _executor.submit(funcao, *args)
+    futuro.add_done_callback(_liberar)
+    return futuro
+
+def _threads_livres() -> bool:
+    with _trava_ocupadas:
+        return _ocupadas < LLM_THREADS
+
+def _estado_executor() -> dict:
+    with _trava_ocupadas:
+        return {"ocupadas": _ocupadas, "capacidade": LLM_THREADS}
+
+def _status_http(erro) -> int:
+    status = getattr(erro, "status_code", None)
+    if status is None:
+        status = getattr(getattr(erro, "response", None), "status_code", None)
+    return status
+
+def _repetivel(erro) -> bool:
+    """Erros do cliente (4xx) não mudam tentando de novo, exceto 408 e 429."""
+    status = _status_http(erro)
+    if status is None:
+        return True
+    return status in (408, 429) or status >= 500
+
+class Disjuntor:
+    def __init__(self):
+        self._resultados = deque(maxlen=LLM_DISJUNTOR_JANELA)
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._trava = threading.Lock()
+
+    def permitir(self) -> bool:
+        """True se a chamada pode ir ao modelo principal."""
+        with self._trava:
+            if not self._aberto_ate:
+                return True
+            if time.monotonic() < self._aberto_ate or self._testando:
+                return False
+            # Meio aberto: só esta chamada testa o principal
+            self._testando = True
+            return True
+
+    def registrar(self, ruim: bool):
+        with self._trava:
+            if self._testando:
+                self._testando = False
+                if ruim:
+                    self._abrir()
+                else:
+                    self._aberto_ate = 0.0
+                    self._resultados.clear()
+                    logger.info("✅ Disjuntor do LLM fechado: modelo principal de volta.")
+                return
+            self._resultados.append(ruim)
+            if (
+                not self._aberto_ate
+                and len(self._resultados) >= LLM_DISJUNTOR_MINIMO
+                and sum(self._resultados) / len(self._resultados) >= LLM_DISJUNTOR_LIMIAR
+            ):
+                self._abrir()
+
+    def _abrir(self):
+        self._aberto_ate = time.monotonic() + LLM_DISJUNTOR_ABERTO_S
+        incrementar("llm.disjuntor_aberturas")
+        logger.warning(f"⚠️ Disjuntor do LLM aberto por {LLM_DISJUNTOR_ABERTO_S:.0f}s: usando o modelo reserva.")
+
+    def estado(self) -> dict:
+        with self._trava:
+            ruins = sum(self._resultados)
+            return {
+                "aberto": bool(self._aberto_ate) and (time.monotonic() < self._aberto_ate or self._testando),
+                "taxa_ruim": round(ruins / len(self._resultados), 3) if self._resultados else 0.0,
+                "janela": len(self._resultados),
+            }
+
+class LLMResiliente:
+    """Mesma interface usada do ChatGroq (`invoke`, `model_name`), com a política acima."""
+
+    def __init__(self, principal, reserva=None):
+        self.principal = principal
+        self.reserva = reserva
+        self.disjuntor = Disjuntor()
+
+    @property
+    def model_name(self):
+        return getattr(self.principal, "model_name", type(self.principal).__name__)
+
+    def invoke(self, mensagens):
+        limite = time.monotonic() + LLM_PRAZO_S
+        usar_principal = self.reserva is None or self.disjuntor.permitir()
+        modelo = self.principal if usar_principal else self.reserva
+        if not usar_principal:
+            incrementar("llm.reserva")
+
+        ultimo_erro = None
+        for tentativa in range(LLM_TENTATIVAS):
+            if tentativa:
+                # Backoff exponencial com jitter completo, sem passar do prazo
+                pausa = random.uniform(0, LLM_BACKOFF_S * 2 ** (tentativa - 1))
+                if time.monotonic() + pausa >= limite:
+                    break
+                incrementar("llm.repeticoes")
+                time.sleep(pausa)
+            inicio = time.monotonic()
+            disjuntor = self.disjuntor if usar_principal and self.reserva is not None else None
+            try:
+                resposta = self._tentar(modelo, mensagens, limite, disjuntor)
+            except Exception as e:
+                ultimo_erro = e
+                # Prazo estourado: _tentar já contou cada chamada abandonada
+                if disjuntor is not None and not isinstance(e, TimeoutError):
+                    disjuntor.registrar(True)
+                if not _repetivel(e):
+                    break
+                continue
+            if usar_principal and self.reserva is not None:
+                self.disjuntor.registrar(time.monotonic() - inicio > LLM_LENTO_S)
+            return resposta
+
+        # Principal esgotou as tentativas: última chance no reserva, se houver prazo
+        if usar_principal and self.reserva is not None and time.monotonic() < limite:
+            incrementar("llm.reserva")
+            try:
+                return self._tentar(self.reserva, mensagens, limite)
+            except Exception as e:
+                ultimo_erro = e
+        incrementar("llm.falhas")
+        if isinstance(ultimo_erro, TimeoutError) or ultimo_erro is None:
+            raise HTTPException(status_code=504, detail="O modelo de linguagem não respondeu a tempo. Tente novamente.")
+        raise ultimo_erro
+
+    def _tentar(self, modelo, mensagens, limite: float, disjuntor: Disjuntor = None):
+        """
+        Uma tentativa: a chamada e, se demorar mais que LLM_HEDGE_S e houver
+        thread livre, uma cópia dela. No prazo, cada chamada abandonada ainda
+        rodando conta como ruim em `disjuntor`.
+        """
+        prazo = min(LLM_TIMEOUT_S, limite - time.monotonic())
+        if prazo <= 0:
+            raise TimeoutError("Prazo da chamada ao LLM esgotado")
+        incrementar("llm.tentativas")
+        inicio = time.monotonic()
+        primeiro = _submeter(modelo.invoke, mensagens)
+        pendentes = {primeiro}
+        hedge_disparado = False
+        ultimo_erro = None
+        while pendentes:
+            restante = prazo - (time.monotonic() - inicio)
+            if restante <= 0:
+                break
+            espera = restante
+            if LLM_HEDGE_S and not hedge_disparado:
+                espera = min(restante, max(LLM_HEDGE_S - (time.monotonic() - inicio), 0))
+            prontos, pendentes = wait(pendentes, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                if futuro.exception() is None:
+                    if futuro is not primeiro:
+                        incrementar("llm.hedge_venceu")
+                    return futuro.result()
+                ultimo_erro = futuro.exception()
+            if not prontos and LLM_HEDGE_S and not hedge_disparado:
+                hedge_disparado = True
+                if not _threads_livres():
+                    # A cópia só esperaria na fila do executor, atrás das chamadas presas
+                    incrementar("llm.hedges_sem_thread")
+                    continue
+                # Sem resposta até aqui: dispara a cópia e fica com a que chegar antes
+                incrementar("llm.hedges")
+                pendentes.add(_submeter(modelo.invoke, mensagens))
+        if ultimo_erro is not None and not pendentes:
+            raise ultimo_erro
+        # Na fila do executor dá para cancelar; rodando, a thread fica presa até o provedor responder
+        abandonadas = sum(1 for futuro in pendentes if not futuro.cancel())
+        if abandonadas:
+            incrementar("llm.abandonadas", abandonadas)
+            if disjuntor is not None:
+                for _ in range(abandonadas):
+                    disjuntor.registrar(True)
+        elif disjuntor is not None:
+            disjuntor.registrar(True)
+        raise TimeoutError(f"LLM sem resposta em {prazo:.0f}s")
+
+registrar_fonte("llm.executor", _estado_executor)
+
+def criar_llm_resiliente(principal, reserva=None, nome: str = "llm") -> LLMResiliente:
+    llm = LLMResiliente(principal, reserva)
+    registrar_fonte(f"{nome}.disjuntor", llm.disjuntor.estado)
+    return llm
@@ -0,0 +1,170 @@
+"""
+Perfilamento opcional de requisições com cProfile.
+
+Só é instalado no app com PERFIL_TAXA > 0 (fração das requisições perfiladas
+por amostragem) ou PERFIL_CABECALHO=true (um administrador pede com o
+cabeçalho `X-Perfil: 1`); desligado, não há middleware nem gancho nenhum.
+Uma requisição perfilada tem o cProfile ligado na thread do event loop e,
+via medir_etapa, em cada etapa de rag_service/documentos_service que roda no
+threadpool. Tudo vira um único arquivo .prof (pstats) em PERFIL_DIR, com um
+.json ao lado trazendo o id da requisição, a rota, o status e o tempo de cada
+etapa. Abra com `python -m pstats`, snakeviz ou flameprof.
+
+Um perfil por vez por worker: outra requisição sorteada enquanto um perfil
+está em andamento segue sem perfil. O perfil da thread do event loop também
+inclui o que outras requisições fizeram nela durante o intervalo.
+"""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from ..config import BASE_DIR, load_env
+from ..metricas import incrementar, instalar_gancho_etapa
+
+logger = logging.getLogger(__name__)
+load_env()
+
+PERFIL_TAXA = float(os.getenv("PERFIL_TAXA", "0"))
+PERFIL_CABECALHO = os.getenv("PERFIL_CABECALHO", "false").strip().lower() == "true"
+PERFIL_DIR = os.getenv("PERFIL_DIR") or os.path.join(BASE_DIR, "data", "perfis")
+PERFIL_ATIVO = PERFIL_TAXA > 0 or PERFIL_CABECALHO
+
+_perfil_atual = ContextVar("perfil_atual", default=None)
+_um_por_vez = threading.Lock()
+_thread_perfilada = threading.local()
+_ID_VALIDO = re.compile(r"[^A-Za-z0-9_.-]")
+
+class Perfil:
+    def __init__(self, request_id: str, metodo: str, caminho: str):
+        self.request_id = request_id
+        self.metodo = metodo
+        self.caminho = caminho
+        self.nome = f"{datetime.utcnow():%Y%m%dT%H%M%S}_{request_id}"
+        self.thread_principal = threading.get_ident()
+        self.principal = cProfile.Profile()
+        self.outros = []
+        self.etapas = []
+
+    def salvar(self, status, duracao_ms: float):
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        estatisticas = pstats.Stats(self.principal)
+        for perfil in self.outros:
+            estatisticas.add(perfil)
+        base = os.path.join(PERFIL_DIR, self.nome)
+        estatisticas.dump_stats(base + ".prof")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "request_id": self.request_id,
+                "metodo": self.metodo,
+                "caminho": self.caminho,
+                "status": status,
+                "duracao_ms": round(duracao_ms, 2),
+                "etapas": self.etapas,
+                "pstats": self.nome + ".prof",
+            }, f, ensure_ascii=False, indent=2)
+
+@contextmanager
+def _perfilar_etapa(nome: str):
+    perfil = _perfil_atual.get()
+    if perfil is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    # A thread do event loop já está sendo perfilada; etapas aninhadas também
+    perfilar = threading.get_ident() != perfil.thread_principal and not getattr(_thread_perfilada, "ativa", False)
+    perfilador = cProfile.Profile() if perfilar else None
+    if perfilador:
+        _thread_perfilada.ativa = True
+        perfilador.enable()
+    try:
+        yield
+    finally:
+        if perfilador:
+            perfilador.disable()
+            _thread_perfilada.ativa = False
+            perfil.outros.append(perfilador)
+        perfil.etapas.append({
+            "etapa": nome,
+            "ms": round((time.perf_counter() - inicio) * 1000, 2),
+            "thread": threading.current_thread().name,
+        })
+
+def _cabecalho(scope, nome: bytes):
+    for chave, valor in scope.get("headers", []):
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+def _pedido_por_admin(scope) -> bool:
+    """X-Perfil só vale com o token de um email em ADMIN_EMAILS."""
+    if not PERFIL_CABECALHO or not _cabecalho(scope, b"x-perfil"):
+        return False
+    from jose import JWTError, jwt
+    from ..deps import ADMIN_EMAILS
+    from ..security import ALGORITHM, SECRET_KEY
+    autorizacao = _cabecalho(scope, b"authorization") or ""
+    if not autorizacao.lower().startswith("bearer "):
+        return False
+    try:
+        email = jwt.decode(autorizacao[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return False
+    return email in ADMIN_EMAILS
+
+class MiddlewarePerfil:
+    def __init__(self, app):
+        self.app = app
+        instalar_gancho_etapa(_perfilar_etapa)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            _pedido_por_admin(scope) or (PERFIL_TAXA and random.random() < PERFIL_TAXA)
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not _um_por_vez.acquire(blocking=False):
+            incrementar("perfil.ignorados")
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _ID_VALIDO.sub("", _cabecalho(scope, b"x-request-id") or "")[:64] or uuid.uuid4().hex[:16]
+        perfil = Perfil(request_id, scope["method"], scope["path"])
+        status = None
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                mensagem = {**mensagem, "headers": [
+                    *mensagem.get("headers", []),
+                    (b"x-request-id", request_id.encode()),
+                    (b"x-perfil", perfil.nome.encode()),
+                ]}
+            await send(mensagem)
+
+        token = _perfil_atual.set(perfil)
+        inicio = time.perf_counter()
+        perfil.principal.enable()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            perfil.principal.disable()
+            _perfil_atual.reset(token)
+            _um_por_vez.release()
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            try:
+                await asyncio.to_thread(perfil.salvar, status, duracao_ms)
+                incrementar("perfil.gravados")
+                logger.info(f"Perfil de {scope['method']} {scope['path']} ({duracao_ms:.0f} ms) em {perfil.nome}.prof")
+            except OSError as e:
+                logger.warning(f"⚠️ Não foi possível gravar o perfil: {e}")
@@ -1,12 +1,78 @@
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_groq import ChatGroq
+import os
+from functools import lru_cache
 from ..config import load_env
+from ..metricas import registrar_fonte
 
 load_env()
 
-CHUNK_SIZE = 1500
-CHUNK_OVERLAP = 200
+# Valores usados por novas gerações do índice; a geração ativa guarda os seus no manifesto
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
 CHUNK_SEPARATORS = ["\n\n", "\n", " ", ""]
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
 
-embeddings = GoogleGenerativeAIEmbeddings(model="text-embedding-004")
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+# Recuperação com k adaptativo: busca RETRIEVAL_FETCH_K candidatos, descarta os
+# abaixo do limiar de relevância (cosseno), corta no "cotovelo" das pontuações
+# e mantém entre RETRIEVAL_MIN_K e RETRIEVAL_MAX_K blocos
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "12"))
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "1"))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "8"))
+RETRIEVAL_LIMIAR = float(os.getenv("RETRIEVAL_LIMIAR", "0.3"))
+# Queda mínima entre pontuações vizinhas para contar como cotovelo
+RETRIEVAL_COTOVELO = float(os.getenv("RETRIEVAL_COTOVELO", "0.08"))
+
+# Modelo da Groq por etapa do pipeline, cada um com temperatura e limite de
+# tokens próprios: reescrever a pergunta de acompanhamento não precisa do 70B.
+# LLM_MODELO_RESERVA é usado por todas quando o disjuntor abre (vazio desliga).
+LLM_MODELO = os.getenv("LLM_MODELO", "llama-3.3-70b-versatile")
+LLM_MODELO_RESERVA = os.getenv("LLM_MODELO_RESERVA", "llama-3.1-8b-instant").strip()
+
+def _configurar_etapa(etapa: str, modelo: str, max_tokens: str):
+    prefixo = etapa.upper()
+    return {
+        "modelo": os.getenv(f"LLM_MODELO_{prefixo}", modelo),
+        "temperatura": float(os.getenv(f"LLM_TEMPERATURA_{prefixo}", "0")),
+        # Vazio: sem limite além do próprio modelo
+        "max_tokens": int(os.getenv(f"LLM_MAX_TOKENS_{prefixo}", max_tokens) or 0) or None,
+    }
+
+ETAPAS_LLM = {
+    "reformulacao": _configurar_etapa("reformulacao", "llama-3.1-8b-instant", "256"),
+    "resposta": _configurar_etapa("resposta", LLM_MODELO, ""),
+    "resumo": _configurar_etapa("resumo", "llama-3.1-8b-instant", "512"),
+}
+registrar_fonte("etapas", lambda: {f"{etapa}.modelo": c["modelo"] for etapa, c in ETAPAS_LLM.items()})
+
+# Os clientes (e os SDKs do Google e da Groq) só são importados no primeiro uso,
+# para não pesar no import do app, no --reload e na subida de cada worker.
+
+@lru_cache(maxsize=None)
+def obter_embeddings(modelo: str = EMBEDDING_MODEL):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from .clientes_http import transporte
+    # O SDK monta o próprio httpx.Client, mas sobre o pool compartilhado do processo
+    return GoogleGenerativeAIEmbeddings(model=modelo, client_args={"transport": transporte("google")})
+
+@lru_cache(maxsize=None)
+def _cliente_groq(modelo: str, temperatura: float, max_tokens):
+    from langchain_groq import ChatGroq
+    from .clientes_http import clientes_http, prazo_http
+    from .llm_resiliente import LLM_TIMEOUT_S
+    # Prazo e novas tentativas ficam com o LLMResiliente, não com o SDK; todas
+    # as etapas e a reserva dividem as mesmas conexões com a Groq
+    sincrono, assincrono = clientes_http("groq")
+    return ChatGroq(
+        model=modelo, temperature=temperatura, max_tokens=max_tokens, timeout=prazo_http(LLM_TIMEOUT_S),
+        max_retries=0, http_client=sincrono, http_async_client=assincrono,
+    )
+
+@lru_cache(maxsize=None)
+def obter_llm(etapa: str = "resposta"):
+    """LLM configurado para a etapa ("reformulacao", "resposta" ou "resumo")."""
+    from .llm_resiliente import criar_llm_resiliente
+    configuracao = ETAPAS_LLM[etapa]
+    principal = _cliente_groq(configuracao["modelo"], configuracao["temperatura"], configuracao["max_tokens"])
+    reserva = None
+    if LLM_MODELO_RESERVA and LLM_MODELO_RESERVA != configuracao["modelo"]:
+        reserva = _cliente_groq(LLM_MODELO_RESERVA, configuracao["temperatura"], configuracao["max_tokens"])
+    return criar_llm_resiliente(principal, reserva, nome=f"llm.{etapa}")
@@ -1,48 +1,52 @@
+import inspect
 import logging
 from fastapi import HTTPException
-from langchain_community.vectorstores import Chroma
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from sqlalchemy import select
 from ..config import CHROMA_DIR
 from ..models import Conversa, Mensagem
-from ..utils import get_vector_count, limpar_chroma_db
+from ..utils import get_vector_count
+from .base_vetorial import obter_base_vetorial, leitura_segura, ids_existentes, COLECAO_PADRAO
+from .geracoes import erro_indice_incompativel
+from .coalescencia import chave_de, voo_busca, voo_llm
+from .escrita_adiada import ESCRITA_ADIADA, fila_mensagens
+from .cache_conversa import CACHE_CONVERSA_LIMIAR
+from .roteamento import base_roteamento, buscar_candidatos
+from .rag_engine import RETRIEVAL_FETCH_K, RETRIEVAL_MIN_K, RETRIEVAL_MAX_K, RETRIEVAL_LIMIAR, RETRIEVAL_COTOVELO
+from ..metricas import incrementar, medir_etapa
 
 logger = logging.getLogger(__name__)
 
-def carregar_base_vetorial(embeddings):
+def carregar_base_vetorial(embeddings, colecao: str = COLECAO_PADRAO, diretorio: str = CHROMA_DIR):
     try:
-        base_vetorial = Chroma(
-            persist_directory=CHROMA_DIR,
-            embedding_function=embeddings
-        )
+        base_vetorial = obter_base_vetorial(embeddings, diretorio, colecao)
         total_vetores = get_vector_count(base_vetorial)
     except Exception as e:
         if "dimension" in str(e).lower():
-            logger.error(f"❌ Erro de dimensão no Chroma: {e}")
-            limpar_chroma_db()
-            raise HTTPException(
-                status_code=400,
-                detail="A base de dados era incompatível e foi resetada. Por favor, processe o documento novamente."
-            )
+            raise erro_indice_incompativel(e)
         logger.error(f"Erro ao carregar ChromaDB: {e}")
         raise HTTPException(status_code=500, detail="Erro ao carregar base de dados. Re-processe o documento.")
     if total_vetores == 0:
         raise HTTPException(status_code=404, detail="Nenhum documento indexado. Por favor, processe um documento primeiro.")
     return base_vetorial, total_vetores
 
-def carregar_conversa(db, conversa_id: int, usuario_id: int):
-    conversa_atual = db.query(Conversa).filter(
+async def carregar_conversa(db, conversa_id: int, usuario_id: int):
+    conversa_atual = (await db.execute(select(Conversa).where(
         Conversa.id == conversa_id,
         Conversa.usuario_id == usuario_id
-    ).first()
+    ))).scalar_one_or_none()
     if not conversa_atual:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     return conversa_atual
 
-def carregar_historico(conversa_atual, db):
+async def carregar_historico(conversa_atual, db):
+    if ESCRITA_ADIADA:
+        # Mensagens ainda na fila entram no histórico antes da leitura
+        await fila_mensagens.descarregar()
     historico_msgs = []
-    historico_msgs_db = db.query(Mensagem).filter(
+    historico_msgs_db = list((await db.execute(select(Mensagem).where(
         Mensagem.conversa_id == conversa_atual.id
-    ).order_by(Mensagem.criado_em.desc()).limit(6).all()
+    ).order_by(Mensagem.criado_em.desc(), Mensagem.id.desc()).limit(6))).scalars().all())
     historico_msgs_db.reverse()
     for msg in historico_msgs_db:
         if msg.remetente == "user":
@@ -51,6 +55,12 @@ def carregar_historico(conversa_atual, db):
             historico_msgs.append(AIMessage(content=msg.conteudo))
     return historico_msgs
 
+def invocar_llm(llm, mensagens):
+    """llm.invoke com coalescência: prompts iguais em andamento compartilham uma única chamada."""
+    modelo = getattr(llm, "model_name", type(llm).__name__)
+    chave = chave_de(modelo, *(f"{msg.type}:{msg.content}" for msg in mensagens))
+    return voo_llm.executar(chave, llm.invoke, mensagens)
+
 def reformular_pergunta(pergunta: str, historico_msgs, llm):
     if not historico_msgs:
         return pergunta
@@ -60,22 +70,119 @@ Não responda à pergunta, apenas reescreva-a se necessário. Se a pergunta já
         *historico_msgs,
         HumanMessage(content=pergunta)
     ]
-    res_reform = llm.invoke(prompt_reform)
+    with medir_etapa("reformulacao"):
+        res_reform = invocar_llm(llm, prompt_reform)
     logger.info(f"Pergunta Original: {pergunta} | Reformulada: {res_reform.content}")
     return res_reform.content
 
+def selecionar_adaptativo(resultados, min_k: int = RETRIEVAL_MIN_K, max_k: int = RETRIEVAL_MAX_K,
+                          limiar: float = RETRIEVAL_LIMIAR, cotovelo: float = RETRIEVAL_COTOVELO):
+    """
+    Decide quantos pares (documento, relevância) entram no prompt: descarta os
+    abaixo do limiar, corta na maior queda entre pontuações vizinhas (se for
+    de pelo menos `cotovelo`) e mantém o resultado entre min_k e max_k.
+    """
+    resultados = sorted(resultados, key=lambda par: par[1], reverse=True)[:max_k]
+    relevantes = [par for par in resultados if par[1] >= limiar]
+    if len(relevantes) <= min_k:
+        selecionados = resultados[:min_k]
+    else:
+        quedas = [relevantes[i][1] - relevantes[i + 1][1] for i in range(min_k - 1, len(relevantes) - 1)]
+        maior_queda = max(quedas)
+        selecionados = relevantes[:min_k + quedas.index(maior_queda)] if maior_queda >= cotovelo else relevantes
+    incrementar("recuperacao.buscas")
+    incrementar("recuperacao.blocos", len(selecionados))
+    return selecionados
+
+def _buscar(base_vetorial, pergunta_busca: str, vetor=None):
+    """Trios (documento, relevância, embedding) da busca completa, antes do k adaptativo."""
+    if vetor is None:
+        vetor = base_vetorial.embeddings.embed_query(pergunta_busca)
+    base_documentos = base_roteamento(base_vetorial)
+    with leitura_segura(base_vetorial):
+        return buscar_candidatos(
+            base_vetorial, base_documentos, [vetor], k=max(RETRIEVAL_FETCH_K, RETRIEVAL_MAX_K), com_vetores=True
+        )[0]
+
+def _buscar_coalescido(base_vetorial, pergunta_busca: str, vetor=None):
+    # A mesma instância em cache atende todos os usuários da coleção
+    chave = chave_de(id(base_vetorial), pergunta_busca)
+    return voo_busca.executar(chave, _buscar, base_vetorial, pergunta_busca, vetor)
+
 def buscar_documentos(base_vetorial, pergunta_busca: str):
+    """Pares (documento, relevância) escolhidos pelo k adaptativo, do mais relevante ao menos."""
+    try:
+        with medir_etapa("busca"):
+            candidatos = _buscar_coalescido(base_vetorial, pergunta_busca)
+        return selecionar_adaptativo([(doc, relevancia) for doc, relevancia, _ in candidatos])
+    except Exception as e:
+        if "dimension" in str(e).lower():
+            raise erro_indice_incompativel(e)
+        raise e
+
+def buscar_documentos_conversa(base_vetorial, pergunta_busca: str, conjunto=None):
+    """
+    Como buscar_documentos, mas olhando antes o conjunto de trabalho da
+    conversa: o índice só é consultado se nenhum bloco recente for relevante o
+    bastante e se os escolhidos ainda estiverem indexados. Os candidatos da
+    busca completa (coalescida como em buscar_documentos) entram no conjunto.
+    """
+    if conjunto is None:
+        return buscar_documentos(base_vetorial, pergunta_busca)
     try:
-        return base_vetorial.similarity_search(pergunta_busca, k=4)
+        with medir_etapa("busca"):
+            vetor = base_vetorial.embeddings.embed_query(pergunta_busca)
+            recentes = conjunto.pontuar(vetor)
+            if recentes and recentes[0][1] >= CACHE_CONVERSA_LIMIAR:
+                selecionados = selecionar_adaptativo(recentes)
+                if _ainda_indexados(base_vetorial, selecionados):
+                    incrementar("cache_conversa.acertos")
+                    conjunto.usar([doc for doc, _ in selecionados])
+                    return selecionados
+                # Documento apagado ou trocado desde a última pergunta: nada do conjunto vale mais
+                incrementar("cache_conversa.invalidacoes")
+                conjunto.limpar()
+            incrementar("cache_conversa.faltas")
+            candidatos = _buscar_coalescido(base_vetorial, pergunta_busca, vetor)
+            conjunto.adicionar(candidatos)
+            selecionados = selecionar_adaptativo([(doc, relevancia) for doc, relevancia, _ in candidatos])
+            conjunto.usar([doc for doc, _ in selecionados])
+            return selecionados
     except Exception as e:
         if "dimension" in str(e).lower():
-            limpar_chroma_db()
-            raise HTTPException(
-                status_code=400,
-                detail="Erro de compatibilidade detectado. A base foi limpa. Processe o documento novamente."
-            )
+            raise erro_indice_incompativel(e)
         raise e
 
+def _ainda_indexados(base_vetorial, selecionados) -> bool:
+    ids = {doc.id for doc, _ in selecionados if doc.id}
+    with leitura_segura(base_vetorial):
+        return ids <= ids_existentes(base_vetorial, ids)
+
+def embedar_consultas(embeddings, perguntas: list[str]):
+    """Embeddings de várias perguntas em uma chamada, como consultas (não como documentos)."""
+    if "task_type" in inspect.signature(embeddings.embed_documents).parameters:
+        return embeddings.embed_documents(perguntas, task_type="retrieval_query")
+    return embeddings.embed_documents(perguntas)
+
+def buscar_documentos_lote(base_vetorial, perguntas: list[str]):
+    try:
+        with medir_etapa("busca_lote"):
+            vetores = embedar_consultas(base_vetorial.embeddings, perguntas)
+            base_documentos = base_roteamento(base_vetorial)
+            with leitura_segura(base_vetorial):
+                candidatos = buscar_candidatos(
+                    base_vetorial, base_documentos, vetores, k=max(RETRIEVAL_FETCH_K, RETRIEVAL_MAX_K)
+                )
+        return [selecionar_adaptativo(resultado) for resultado in candidatos]
+    except Exception as e:
+        if "dimension" in str(e).lower():
+            raise erro_indice_incompativel(e)
+        raise e
+
+def montar_fontes(resultados):
+    """Metadados de cada bloco usado, com a relevância (para calibrar o limiar)."""
+    return [{**doc.metadata, "score": round(float(score), 4)} for doc, score in resultados]
+
 def montar_contexto(documentos):
     context_parts = []
     for doc in documentos:
@@ -98,19 +205,27 @@ Diretrizes:
         *historico_msgs,
         HumanMessage(content=f"Contexto Recuperado:\n{context}\n\nPergunta do Usuário: {pergunta}")
     ]
-    return llm.invoke(messages_final)
-
-def registrar_mensagens(db, conversa_atual, pergunta: str, resposta):
-    msg_user = Mensagem(
-        conversa_id=conversa_atual.id,
-        conteudo=pergunta,
-        remetente="user"
-    )
-    msg_ia = Mensagem(
-        conversa_id=conversa_atual.id,
-        conteudo=resposta.content,
-        remetente="ia"
-    )
-    db.add(msg_user)
-    db.add(msg_ia)
-    db.commit()
+    with medir_etapa("resposta"):
+        return invocar_llm(llm, messages_final)
+
+async def registrar_mensagens(db, conversa_atual, pergunta: str, resposta):
+    await registrar_mensagens_lote(db, [(conversa_atual, pergunta, resposta)])
+
+async def registrar_mensagens_lote(db, trocas):
+    """
+    Grava cada (conversa, pergunta, resposta) no mesmo commit do que já estiver
+    pendente na sessão (as conversas recém-criadas, por exemplo). Com
+    ESCRITA_ADIADA, só as conversas são gravadas aqui e as mensagens vão para a fila.
+    """
+    if ESCRITA_ADIADA:
+        if db.new or db.dirty:
+            await db.commit()
+        for conversa, pergunta, resposta in trocas:
+            fila_mensagens.enfileirar(conversa.id, pergunta, resposta.content)
+        return
+    # flush só para as conversas novas terem id: o commit é um só
+    await db.flush()
+    for conversa, pergunta, resposta in trocas:
+        db.add(Mensagem(conversa_id=conversa.id, conteudo=pergunta, remetente="user"))
+        db.add(Mensagem(conversa_id=conversa.id, conteudo=resposta.content, remetente="ia"))
+    await db.commit()
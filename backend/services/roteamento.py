@@ -0,0 +1,103 @@
+"""
+Roteamento em dois estágios para coleções com muitos PDFs.
+
+Na ingestão, cada PDF ganha um vetor próprio, o centroide dos embeddings dos
+seus blocos, gravado na coleção irmã `<coleção>_documentos` da mesma geração
+do índice (id = hash do PDF, metadados com "source" e número de blocos).
+Na busca, se a coleção tiver mais de ROTEAMENTO_MIN_DOCUMENTOS PDFs, a
+pergunta escolhe primeiro os ROTEAMENTO_DOCUMENTOS PDFs mais próximos e só os
+blocos deles são pontuados: o custo do segundo estágio depende de N, não do
+tamanho da coleção. Coleções indexadas antes disso (sem centroide para todos
+os blocos) seguem na busca plana até serem reconstruídas.
+"""
+import os
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from ..config import load_env
+from ..metricas import incrementar, medir_etapa
+from ..utils import get_vector_count
+from .base_vetorial import buscar_por_vetores, gravar_vetores, listar_metadados, obter_base_documentos
+
+load_env()
+
+# PDFs escolhidos no primeiro estágio (0 desliga o roteamento)
+ROTEAMENTO_DOCUMENTOS = int(os.getenv("ROTEAMENTO_DOCUMENTOS", "20"))
+# Abaixo disso a busca plana já é barata e não perde nada
+ROTEAMENTO_MIN_DOCUMENTOS = int(os.getenv("ROTEAMENTO_MIN_DOCUMENTOS", "50"))
+
+# (id da coleção de documentos) -> (PDFs, blocos na coleção, todos os blocos têm centroide?)
+_cobertura = {}
+_trava = threading.Lock()
+
+class Centroide:
+    """Soma dos embeddings normalizados dos blocos, acumulada lote a lote na ingestão."""
+
+    def __init__(self):
+        self.soma = None
+        self.blocos = 0
+
+    def acumular(self, vetores):
+        vetores = np.asarray(vetores, dtype=np.float32)
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        parcial = (vetores / normas).sum(axis=0)
+        self.soma = parcial if self.soma is None else self.soma + parcial
+        self.blocos += len(vetores)
+
+    def gravar(self, base_vetorial, caminho_pdf: str, hash_pdf: str):
+        if not self.blocos:
+            return
+        base_documentos = obter_base_documentos(base_vetorial)
+        if base_documentos is None:
+            return
+        documento = Document(
+            page_content=os.path.basename(caminho_pdf),
+            metadata={"source": caminho_pdf, "blocos": self.blocos},
+        )
+        gravar_vetores(base_documentos, [documento], [(self.soma / self.blocos).tolist()], [hash_pdf])
+
+def base_roteamento(base_vetorial):
+    """
+    Coleção de documentos, se o roteamento vale para esta busca; senão None.
+    Abre a coleção aqui, fora da trava de leitura (no Chroma local a abertura
+    trava a mesma pasta).
+    """
+    if not ROTEAMENTO_DOCUMENTOS:
+        return None
+    base_documentos = obter_base_documentos(base_vetorial)
+    if base_documentos is None:
+        return None
+    documentos = get_vector_count(base_documentos)
+    if documentos <= max(ROTEAMENTO_MIN_DOCUMENTOS, ROTEAMENTO_DOCUMENTOS):
+        return None
+    blocos = get_vector_count(base_vetorial)
+    chave = id(base_documentos)
+    with _trava:
+        cobertura = _cobertura.get(chave)
+    if cobertura is None or cobertura[:2] != (documentos, blocos):
+        # Só quando a coleção muda: soma os blocos declarados por todos os centroides
+        cobertos = sum(metadados.get("blocos", 0) for metadados in listar_metadados(base_documentos))
+        cobertura = (documentos, blocos, cobertos == blocos)
+        with _trava:
+            _cobertura[chave] = cobertura
+    return base_documentos if cobertura[2] else None
+
+def buscar_candidatos(base_vetorial, base_documentos, vetores, k: int, com_vetores: bool = False):
+    """
+    Como buscar_por_vetores, em dois estágios quando `base_documentos` não é
+    None. Chamar dentro de leitura_segura(base_vetorial).
+    """
+    if base_documentos is None:
+        return buscar_por_vetores(base_vetorial, vetores, k=k, com_vetores=com_vetores)
+    with medir_etapa("roteamento"):
+        escolhidos = buscar_por_vetores(base_documentos, vetores, k=ROTEAMENTO_DOCUMENTOS)
+    incrementar("roteamento.buscas", len(vetores))
+    resultados = []
+    for vetor, documentos in zip(vetores, escolhidos):
+        fontes = [doc.metadata["source"] for doc, _ in documentos if doc.metadata.get("source")]
+        # Cada pergunta tem os seus PDFs: o segundo estágio é uma busca por pergunta
+        resultados.extend(
+            buscar_por_vetores(base_vetorial, [vetor], k=k, com_vetores=com_vetores, fontes=fontes or None)
+        )
+    return resultados
@@ -0,0 +1,237 @@
+"""
+Snapshot da geração ativa do índice, para subir uma réplica sem reembedar os PDFs.
+
+O arquivo é um tar (opcionalmente gzip) cujo primeiro membro, `snapshot.json`,
+traz a versão do formato, o backend, o modelo de embeddings e os parâmetros
+de chunk da geração, a dimensão e o número de vetores de cada coleção, e o
+tamanho e o SHA-256 de cada arquivo. Os arquivos vêm depois, sob `indice/`,
+exatamente como estão na pasta da geração (matriz NumPy + SQLite dos
+metadados, ou o chroma.sqlite3 com os segmentos HNSW).
+
+A importação lê o manifesto antes de extrair qualquer coisa, grava os
+arquivos numa geração nova conferindo cada checksum, abre as coleções para
+conferir contagens e dimensões e só então troca o ponteiro da geração ativa.
+A tabela `documentos` não vai no snapshot: as réplicas compartilham o banco.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import time
+from datetime import datetime
+from io import BytesIO
+from ..utils import trava_arquivo, ARQUIVO_TRAVA, ARQUIVO_PORTAO, ARQUIVO_TRAVA_LEITURA, ARQUIVO_PROCESSO
+from .base_vetorial import (
+    CHROMA_HOST,
+    COLECAO_PADRAO,
+    VECTOR_BACKEND,
+    _diretorio_numpy,
+    obter_base_vetorial,
+)
+from .geracoes import (
+    ARQUIVO_ATUAL,
+    ARQUIVO_GERACAO,
+    ARQUIVO_RECONSTRUCAO,
+    PASTA_GERACOES,
+    _criar_geracao,
+    ativar_geracao,
+    indice_ativo,
+)
+from .rag_engine import obter_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Sobe quando o layout do arquivo mudar; importações recusam versões mais novas
+FORMATO_SNAPSHOT = 1
+MANIFESTO = "snapshot.json"
+PREFIXO = "indice/"
+_IGNORADOS = {
+    ARQUIVO_TRAVA, ARQUIVO_PORTAO, ARQUIVO_TRAVA_LEITURA, f"{ARQUIVO_TRAVA_LEITURA}_portao", ARQUIVO_PROCESSO,
+    ARQUIVO_RECONSTRUCAO, ARQUIVO_ATUAL, ARQUIVO_GERACAO,
+}
+
+def _listar_arquivos(diretorio: str):
+    """Caminhos relativos dos arquivos da geração, sem travas, temporários e (no layout antigo) outras gerações."""
+    arquivos = []
+    for raiz, pastas, nomes in os.walk(diretorio):
+        if raiz == diretorio and PASTA_GERACOES in pastas:
+            pastas.remove(PASTA_GERACOES)
+        for nome in nomes:
+            if nome in _IGNORADOS or ".tmp" in nome:
+                continue
+            arquivos.append(os.path.relpath(os.path.join(raiz, nome), diretorio).replace(os.sep, "/"))
+    return sorted(arquivos)
+
+def _sha256(caminho: str) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(1 << 20), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+def _colecoes_numpy(diretorio: str) -> dict:
+    pasta = os.path.dirname(_diretorio_numpy(diretorio, COLECAO_PADRAO))
+    colecoes = {}
+    for nome in sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []:
+        try:
+            with open(os.path.join(pasta, nome, "manifesto.json"), encoding="utf-8") as f:
+                manifesto = json.load(f)
+        except FileNotFoundError:
+            continue
+        colecoes[nome] = {
+            "vetores": manifesto["total"] - manifesto.get("removidos", 0),
+            "dimensao": manifesto["dimensao"],
+            "quantizacao": manifesto["quantizacao"],
+        }
+    return colecoes
+
+def _colecoes_chroma(diretorio: str) -> dict:
+    # Cliente direto: abrir pela base_vetorial pegaria a trava exclusiva que a exportação já segura
+    import chromadb
+    cliente = chromadb.PersistentClient(path=diretorio)
+    colecoes = {}
+    for colecao in cliente.list_collections():
+        colecao = cliente.get_collection(getattr(colecao, "name", colecao))
+        amostra = colecao.get(limit=1, include=["embeddings"])["embeddings"]
+        colecoes[colecao.name] = {
+            "vetores": colecao.count(),
+            "dimensao": len(amostra[0]) if amostra is not None and len(amostra) else None,
+        }
+    return colecoes
+
+def exportar_snapshot(destino: str, comprimir: bool = False) -> dict:
+    """
+    Grava o snapshot da geração ativa em `destino`. A pasta fica com a trava
+    compartilhada do começo ao fim: buscas seguem, escritas esperam.
+    """
+    backend = VECTOR_BACKEND
+    if backend == "chroma" and CHROMA_HOST:
+        raise ValueError("Com CHROMA_HOST os vetores ficam no servidor Chroma; use o backup do próprio servidor.")
+    diretorio, configuracao = indice_ativo()
+    inicio = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with trava_arquivo(diretorio, exclusiva=False):
+        colecoes = _colecoes_numpy(diretorio) if backend == "numpy" else _colecoes_chroma(diretorio)
+        # Duas passadas: o manifesto com os checksums precisa ser o primeiro membro
+        arquivos = {
+            relativo: {"bytes": os.path.getsize(os.path.join(diretorio, relativo)), "sha256": _sha256(os.path.join(diretorio, relativo))}
+            for relativo in _listar_arquivos(diretorio)
+        }
+        manifesto = {
+            "formato": FORMATO_SNAPSHOT,
+            "criado_em": datetime.utcnow().isoformat(),
+            "geracao": os.path.basename(os.path.normpath(diretorio)),
+            "backend": backend,
+            "configuracao": configuracao,
+            "colecoes": colecoes,
+            "arquivos": arquivos,
+        }
+        conteudo = json.dumps(manifesto, ensure_ascii=False, indent=2).encode("utf-8")
+        temporario = destino + ".tmp"
+        with tarfile.open(temporario, "w|gz" if comprimir else "w|") as tar:
+            info = tarfile.TarInfo(MANIFESTO)
+            info.size, info.mtime = len(conteudo), int(time.time())
+            tar.addfile(info, BytesIO(conteudo))
+            for relativo in arquivos:
+                tar.add(os.path.join(diretorio, relativo), arcname=PREFIXO + relativo, recursive=False)
+    os.replace(temporario, destino)
+    return {
+        "arquivo": destino,
+        "bytes": os.path.getsize(destino),
+        "geracao": manifesto["geracao"],
+        "colecoes": colecoes,
+        "duracao_s": round(time.perf_counter() - inicio, 1),
+    }
+
+def _validar_manifesto(manifesto: dict):
+    if manifesto.get("formato", 0) > FORMATO_SNAPSHOT:
+        raise ValueError(f"Snapshot no formato {manifesto.get('formato')}; esta versão lê até o {FORMATO_SNAPSHOT}.")
+    if manifesto["backend"] != VECTOR_BACKEND:
+        raise ValueError(f"Snapshot do backend {manifesto['backend']}, mas VECTOR_BACKEND={VECTOR_BACKEND}.")
+    if VECTOR_BACKEND == "chroma" and CHROMA_HOST:
+        raise ValueError("Com CHROMA_HOST não há pasta local para restaurar o snapshot.")
+    for relativo in manifesto["arquivos"]:
+        partes = relativo.split("/")
+        if relativo.startswith("/") or ".." in partes or "" in partes:
+            raise ValueError(f"Caminho inválido no snapshot: {relativo}")
+
+def _extrair(tar, manifesto: dict, diretorio: str):
+    esperados = manifesto["arquivos"]
+    recebidos = set()
+    for membro in tar:
+        if membro.name == MANIFESTO:
+            # Já lido: a iteração recomeça pelos membros carregados
+            continue
+        relativo = membro.name[len(PREFIXO):] if membro.name.startswith(PREFIXO) else None
+        if relativo not in esperados or not membro.isfile():
+            raise ValueError(f"Membro inesperado no snapshot: {membro.name}")
+        destino = os.path.join(diretorio, *relativo.split("/"))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        sha = hashlib.sha256()
+        origem = tar.extractfile(membro)
+        with open(destino, "wb") as f:
+            for parte in iter(lambda: origem.read(1 << 20), b""):
+                sha.update(parte)
+                f.write(parte)
+        if sha.hexdigest() != esperados[relativo]["sha256"] or membro.size != esperados[relativo]["bytes"]:
+            raise ValueError(f"Checksum não confere: {relativo}")
+        recebidos.add(relativo)
+    faltando = set(esperados) - recebidos
+    if faltando:
+        raise ValueError(f"Snapshot incompleto, faltam {len(faltando)} arquivos (ex.: {sorted(faltando)[0]})")
+
+def _conferir_colecoes(manifesto: dict, diretorio: str, embeddings):
+    """Abre cada coleção restaurada como o serviço abriria e compara com o manifesto."""
+    from ..utils import get_vector_count
+    for nome, esperado in manifesto["colecoes"].items():
+        base_vetorial = obter_base_vetorial(embeddings, diretorio, nome)
+        total = get_vector_count(base_vetorial)
+        if total != esperado["vetores"]:
+            raise ValueError(f"Coleção {nome}: {total} vetores restaurados, {esperado['vetores']} no snapshot.")
+
+def importar_snapshot(caminho: str, ativar: bool = True, sondar_embeddings: bool = True) -> dict:
+    """
+    Restaura o snapshot numa geração nova e (com `ativar`) passa a servi-la.
+    Com `sondar_embeddings`, embeda um texto com o modelo do snapshot e confere a
+    dimensão contra a das coleções: um modelo indisponível ou trocado falha aqui,
+    não na primeira pergunta.
+    """
+    inicio = time.perf_counter()
+    with tarfile.open(caminho, "r|*") as tar:
+        primeiro = tar.next()
+        if primeiro is None or primeiro.name != MANIFESTO:
+            raise ValueError(f"{caminho} não é um snapshot do índice (falta {MANIFESTO}).")
+        manifesto = json.load(tar.extractfile(primeiro))
+        _validar_manifesto(manifesto)
+        configuracao = manifesto["configuracao"]
+        embeddings = obter_embeddings(configuracao["modelo_embeddings"])
+        dimensoes = {c["dimensao"] for c in manifesto["colecoes"].values() if c.get("dimensao")}
+        if len(dimensoes) > 1:
+            raise ValueError(f"Coleções com dimensões diferentes no snapshot: {sorted(dimensoes)}")
+        if sondar_embeddings and dimensoes:
+            dimensao = len(embeddings.embed_query("verificação do snapshot"))
+            if dimensao not in dimensoes:
+                raise ValueError(
+                    f"{configuracao['modelo_embeddings']} gera vetores de {dimensao} dimensões; o snapshot tem {dimensoes.pop()}."
+                )
+
+        geracao, diretorio = _criar_geracao({**configuracao, "snapshot": manifesto["geracao"]})
+        try:
+            _extrair(tar, manifesto, diretorio)
+            _conferir_colecoes(manifesto, diretorio, embeddings)
+        except Exception:
+            shutil.rmtree(diretorio, ignore_errors=True)
+            raise
+    if ativar:
+        ativar_geracao(geracao)
+    logger.info(f"📦 Snapshot {manifesto['geracao']} restaurado na geração {geracao}.")
+    return {
+        "geracao": geracao,
+        "diretorio": diretorio,
+        "ativada": ativar,
+        "origem": manifesto["geracao"],
+        "colecoes": manifesto["colecoes"],
+        "duracao_s": round(time.perf_counter() - inicio, 1),
+    }
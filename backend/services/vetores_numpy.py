@@ -0,0 +1,553 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import logging
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from ..utils import trava_arquivo, ARQUIVO_TRAVA_LEITURA
+
+logger = logging.getLogger(__name__)
+
+QUANTIZACOES = ("float32", "float16", "int8")
+ARQUIVO_VETORES = "vetores.npy"
+ARQUIVO_ESCALAS = "escalas.npy"
+ARQUIVO_METADADOS = "metadados.sqlite3"
+ARQUIVO_MANIFESTO = "manifesto.json"
+
+# Linhas processadas por produto matriz-vetor (limita a cópia temporária em float32)
+BLOCO_BUSCA = 65536
+# Capacidade nova quando a matriz enche, em múltiplos da atual: anexar custa O(lote), não O(total)
+CRESCIMENTO = 1.5
+
+def _normalizar(vetores):
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vetores / normas
+
+# O np.load lê o cabeçalho do .npy com ast.literal_eval, que no CPython 3.11 falha
+# (SystemError) quando duas threads o chamam ao mesmo tempo
+_trava_cabecalho = threading.Lock()
+
+def _abrir_npy(caminho: str, modo: str = "r"):
+    with _trava_cabecalho:
+        return np.load(caminho, mmap_mode=modo)
+
+def _versao_manifesto(estado) -> tuple:
+    # Anexos seguidos cabem no mesmo tique do relógio do sistema de arquivos; o
+    # manifesto é sempre um arquivo novo (os.replace), então o inode desempata
+    return estado.st_ino, estado.st_mtime_ns
+
+def _quantizar(vetores, quantizacao: str):
+    """Converte vetores float32 normalizados para o formato de armazenamento."""
+    if quantizacao == "float16":
+        return vetores.astype(np.float16), None
+    if quantizacao == "int8":
+        escalas = np.abs(vetores).max(axis=1) / 127.0
+        escalas[escalas == 0] = 1.0
+        quantizados = np.round(vetores / escalas[:, None]).astype(np.int8)
+        return quantizados, escalas.astype(np.float32)
+    return vetores.astype(np.float32), None
+
+class BaseVetorialNumpy(VectorStore):
+    """
+    Índice vetorial plano em uma matriz `.npy` mapeada em memória.
+    Os vetores são normalizados na escrita, então a similaridade de cosseno vira
+    um único produto matriz-vetor. Texto e metadados ficam numa tabela SQLite ao lado.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function, quantizacao: str = "float32",
+                 diretorio_trava: str = None):
+        if quantizacao not in QUANTIZACOES:
+            raise ValueError(f"Quantização inválida: {quantizacao}. Use uma de {QUANTIZACOES}.")
+        self._diretorio = persist_directory
+        # A trava fica na pasta da geração do índice, compartilhada por todas as coleções
+        self._diretorio_trava = diretorio_trava or persist_directory
+        self._embeddings = embedding_function
+        self._quantizacao = quantizacao
+        self._dimensao = None
+        self._total = 0
+        self._matriz = None
+        self._escalas = None
+        self._versao = None
+        self._conexao = None
+        # Linhas apagadas que continuam na matriz até a compactação (None se não houver)
+        self._vivas = None
+        self._removidos = 0
+        # Escritas são serializadas (entre threads e, via flock, entre workers). Leituras
+        # pegam um retrato (matriz, escalas, total, conexão) e não esperam por elas; só
+        # a compactação, que renumera as linhas, espera as leituras em andamento
+        self._trava_escrita = threading.Lock()
+        self._trava_estado = threading.Lock()
+        self._trava_recarga = threading.Lock()
+        with self._leitura():
+            self._conectar()
+            self._carregar()
+
+    def _leitura(self):
+        """Trava compartilhada da coleção: a compactação pega a exclusiva antes de trocar os arquivos."""
+        return trava_arquivo(self._diretorio, exclusiva=False, nome=ARQUIVO_TRAVA_LEITURA)
+
+    def _conectar(self):
+        os.makedirs(self._diretorio, exist_ok=True)
+        conexao = sqlite3.connect(self._caminho(ARQUIVO_METADADOS), check_same_thread=False)
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS blocos ("
+            "posicao INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, conteudo TEXT NOT NULL, metadados TEXT)"
+        )
+        # Busca restrita a alguns documentos (roteamento): linhas de cada PDF pelo "source"
+        conexao.execute(
+            "CREATE INDEX IF NOT EXISTS blocos_fonte ON blocos (json_extract(metadados, '$.source'))"
+        )
+        # A conexão anterior não é fechada aqui: uma busca que ainda a tem no retrato
+        # termina com ela, e ela é liberada quando a última referência sair
+        with self._trava_estado:
+            self._conexao = conexao
+        self._inode_metadados = os.stat(self._caminho(ARQUIVO_METADADOS)).st_ino
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def _caminho(self, nome: str) -> str:
+        return os.path.join(self._diretorio, nome)
+
+    def _carregar(self):
+        """Abre a matriz em modo somente leitura (mmap); nada é lido do disco até a busca."""
+        caminho_manifesto = self._caminho(ARQUIVO_MANIFESTO)
+        try:
+            versao = _versao_manifesto(os.stat(caminho_manifesto))
+        except FileNotFoundError:
+            # Índice vazio ou apagado por outro worker
+            with self._trava_estado:
+                self._versao, self._dimensao = None, None
+                self._matriz, self._escalas, self._total = None, None, 0
+                self._vivas, self._removidos = None, 0
+            return
+        with open(caminho_manifesto, encoding="utf-8") as f:
+            manifesto = json.load(f)
+        if manifesto["quantizacao"] != self._quantizacao:
+            logger.warning(
+                f"Índice NumPy salvo em {manifesto['quantizacao']}; ignorando quantização {self._quantizacao}."
+            )
+            self._quantizacao = manifesto["quantizacao"]
+        matriz = _abrir_npy(self._caminho(ARQUIVO_VETORES))
+        escalas = None
+        if self._quantizacao == "int8":
+            escalas = _abrir_npy(self._caminho(ARQUIVO_ESCALAS))
+        total, vivas = manifesto["total"], None
+        if manifesto.get("removidos"):
+            # Máscara das linhas que ainda têm metadados; o SQLite é a fonte da verdade
+            vivas = np.zeros(total, dtype=bool)
+            vivas[[linha[0] for linha in self._conexao.execute(
+                "SELECT posicao FROM blocos WHERE posicao < ?", (total,)
+            )]] = True
+        with self._trava_estado:
+            self._versao, self._dimensao = versao, manifesto["dimensao"]
+            self._matriz, self._escalas, self._total = matriz, escalas, total
+            self._vivas = vivas
+            self._removidos = 0 if vivas is None else total - int(vivas.sum())
+
+    def sincronizar(self):
+        """
+        Recarrega se outro processo gravou ou apagou o índice desde a última leitura.
+        Custa dois stat() por chamada, então é feito a cada busca. Chamar com a
+        trava de leitura da coleção ou a de escrita da geração.
+        """
+        with self._trava_recarga:
+            try:
+                inode = os.stat(self._caminho(ARQUIVO_METADADOS)).st_ino
+            except FileNotFoundError:
+                inode = None
+            if inode != self._inode_metadados:
+                self._conectar()
+            try:
+                versao = _versao_manifesto(os.stat(self._caminho(ARQUIVO_MANIFESTO)))
+            except FileNotFoundError:
+                versao = None
+            if versao != self._versao:
+                self._carregar()
+
+    def _retrato(self):
+        with self._trava_estado:
+            return self._matriz, self._escalas, self._total, self._vivas, self._conexao
+
+    def contar(self) -> int:
+        with self._leitura():
+            self.sincronizar()
+            with self._trava_estado:
+                return self._total - self._removidos
+
+    def _validar_dimensao(self, dimensao: int):
+        if self._dimensao is not None and dimensao != self._dimensao:
+            # Mesma mensagem do Chroma, para reaproveitar o tratamento de "dimension" existente
+            raise ValueError(
+                f"Embedding dimension {dimensao} does not match collection dimensionality {self._dimensao}"
+            )
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        textos = list(texts)
+        if not textos:
+            return []
+        metadatas = metadatas or [{} for _ in textos]
+        ids = ids or [str(uuid.uuid4()) for _ in textos]
+
+        self.adicionar_vetores(textos, metadatas, self._embeddings.embed_documents(textos), ids)
+        return ids
+
+    def adicionar_vetores(self, textos, metadatas, vetores, ids):
+        """Grava vetores já calculados; ids que já estão no índice são ignorados."""
+        vetores = np.asarray(vetores, dtype=np.float32)
+        self._validar_dimensao(vetores.shape[1])
+        novos, novas_escalas = _quantizar(_normalizar(vetores), self._quantizacao)
+        with self._trava_escrita:
+            self._gravar(list(textos), list(metadatas), list(ids), novos, novas_escalas)
+
+    @staticmethod
+    def _ids_existentes(conexao, ids, total: int):
+        existentes = set()
+        for inicio in range(0, len(ids), 500):
+            parte = ids[inicio:inicio + 500]
+            marcadores = ",".join("?" * len(parte))
+            existentes.update(linha[0] for linha in conexao.execute(
+                f"SELECT id FROM blocos WHERE posicao < ? AND id IN ({marcadores})", (total, *parte)
+            ))
+        return existentes
+
+    def ids_existentes(self, ids):
+        with self._leitura():
+            self.sincronizar()
+            _, _, total, _, conexao = self._retrato()
+            return self._ids_existentes(conexao, list(ids), total)
+
+    def _gravar(self, textos, metadatas, ids, novos, novas_escalas):
+        with trava_arquivo(self._diretorio_trava):
+            # Outro worker pode ter anexado linhas desde a última leitura
+            self.sincronizar()
+            self._validar_dimensao(novos.shape[1])
+            existentes = self._ids_existentes(self._conexao, ids, self._total)
+            if existentes:
+                # Regravação (ex.: ingestão retomada depois de uma falha): só o que falta
+                manter = [i for i, id_bloco in enumerate(ids) if id_bloco not in existentes]
+                if not manter:
+                    return
+                textos = [textos[i] for i in manter]
+                metadatas = [metadatas[i] for i in manter]
+                ids = [ids[i] for i in manter]
+                novos = novos[manter]
+                novas_escalas = novas_escalas[manter] if novas_escalas is not None else None
+            self._anexar(novos, novas_escalas)
+            self._inserir_metadados(textos, metadatas, ids)
+            self._salvar_manifesto(self._total + len(textos), novos.shape[1], self._removidos)
+            self._carregar()
+
+    def _inserir_metadados(self, textos, metadatas, ids):
+        inicio = self._total
+        with self._conexao:
+            # Linhas órfãs de uma escrita interrompida antes do manifesto
+            self._conexao.execute("DELETE FROM blocos WHERE posicao >= ?", (inicio,))
+            self._conexao.executemany(
+                "INSERT INTO blocos (posicao, id, conteudo, metadados) VALUES (?, ?, ?, ?)",
+                [
+                    (inicio + i, ids[i], textos[i], json.dumps(metadatas[i], ensure_ascii=False))
+                    for i in range(len(textos))
+                ],
+            )
+
+    def _anexar(self, novos, novas_escalas):
+        """
+        Grava as novas linhas logo depois das `total` atuais. Os arquivos têm folga
+        (o manifesto diz quantas linhas valem), então normalmente a escrita é no
+        próprio arquivo; as buscas não leem além do total antigo até o manifesto
+        novo ser trocado.
+        """
+        total = self._total
+        self._escrever_linhas(ARQUIVO_VETORES, novos, total)
+        if novas_escalas is not None:
+            self._escrever_linhas(ARQUIVO_ESCALAS, novas_escalas, total)
+
+    def _escrever_linhas(self, nome: str, linhas, total: int):
+        """
+        Sem espaço, copia as `total` linhas para um arquivo maior (CRESCIMENTO) e o
+        troca atomicamente: quem está buscando continua no arquivo antigo até
+        pegar um novo retrato.
+        """
+        caminho = self._caminho(nome)
+        fim = total + len(linhas)
+        atual = _abrir_npy(caminho, "r+") if total else None
+        if atual is not None and len(atual) >= fim:
+            atual[total:fim] = linhas
+            atual.flush()
+            return
+        capacidade = max(fim, int(len(atual) * CRESCIMENTO) if atual is not None else 0)
+        temporario = caminho + ".tmp.npy"
+        arquivo = np.lib.format.open_memmap(
+            temporario, mode="w+", dtype=linhas.dtype, shape=(capacidade,) + linhas.shape[1:]
+        )
+        for inicio in range(0, total, BLOCO_BUSCA):
+            arquivo[inicio:min(inicio + BLOCO_BUSCA, total)] = atual[inicio:min(inicio + BLOCO_BUSCA, total)]
+        arquivo[total:fim] = linhas
+        arquivo.flush()
+        del arquivo, atual
+        os.replace(temporario, caminho)
+
+    def _salvar_manifesto(self, total: int, dimensao: int, removidos: int = 0):
+        caminho = self._caminho(ARQUIVO_MANIFESTO)
+        with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"quantizacao": self._quantizacao, "dimensao": dimensao, "total": total, "removidos": removidos}, f)
+        os.replace(caminho + ".tmp", caminho)
+
+    def apagar(self, fontes=(), ids=()) -> int:
+        """
+        Remove os blocos desses PDFs (metadado "source") e desses ids. Saem do
+        SQLite na hora e deixam de aparecer nas buscas; as linhas da matriz só
+        são liberadas em compactar().
+        """
+        with self._trava_escrita, trava_arquivo(self._diretorio_trava):
+            self.sincronizar()
+            if not self._total:
+                return 0
+            removidos = 0
+            with self._conexao:
+                for coluna, valores in (("json_extract(metadados, '$.source')", list(fontes)), ("id", list(ids))):
+                    for inicio in range(0, len(valores), 500):
+                        parte = valores[inicio:inicio + 500]
+                        marcadores = ",".join("?" * len(parte))
+                        removidos += self._conexao.execute(
+                            f"DELETE FROM blocos WHERE {coluna} IN ({marcadores}) AND posicao < ?", (*parte, self._total)
+                        ).rowcount
+            if removidos:
+                # O manifesto novo faz os outros workers recarregarem a máscara
+                self._salvar_manifesto(self._total, self._dimensao, self._removidos + removidos)
+                self._carregar()
+            return removidos
+
+    def ids_das_fontes(self, fontes):
+        with self._leitura():
+            self.sincronizar()
+            _, _, total, _, conexao = self._retrato()
+            ids = []
+            for inicio in range(0, len(fontes), 500):
+                parte = list(fontes[inicio:inicio + 500])
+                marcadores = ",".join("?" * len(parte))
+                ids.extend(linha[0] for linha in conexao.execute(
+                    f"SELECT id FROM blocos WHERE json_extract(metadados, '$.source') IN ({marcadores}) "
+                    "AND posicao < ?", (*parte, total)
+                ))
+            return ids
+
+    def reatribuir_fonte(self, ids, fonte: str) -> int:
+        """Troca o "source" desses blocos; só o SQLite muda, a matriz fica como está."""
+        ids = list(ids)
+        with self._trava_escrita, trava_arquivo(self._diretorio_trava):
+            self.sincronizar()
+            alterados = 0
+            with self._conexao:
+                for inicio in range(0, len(ids), 500):
+                    parte = ids[inicio:inicio + 500]
+                    marcadores = ",".join("?" * len(parte))
+                    alterados += self._conexao.execute(
+                        f"UPDATE blocos SET metadados = json_set(coalesce(metadados, '{{}}'), '$.source', ?) "
+                        f"WHERE id IN ({marcadores}) AND posicao < ?", (fonte, *parte, self._total)
+                    ).rowcount
+            return alterados
+
+    def compactar(self) -> int:
+        """
+        Reescreve matriz, escalas e SQLite só com as linhas vivas, renumeradas,
+        e troca os arquivos, sem a folga deixada pelos anexos. Sem linhas
+        apagadas nem folga, só um VACUUM. Devolve quantas
+        linhas saíram da matriz. As posições mudam, então antes espera as buscas
+        em andamento (trava exclusiva da coleção); as novas esperam a troca.
+        """
+        with self._trava_escrita, trava_arquivo(self._diretorio_trava), \
+                trava_arquivo(self._diretorio, nome=ARQUIVO_TRAVA_LEITURA):
+            self.sincronizar()
+            matriz, escalas, total, vivas, _ = self._retrato()
+            for resto in (ARQUIVO_VETORES + ".tmp", ARQUIVO_VETORES + ".tmp.npy", ARQUIVO_ESCALAS + ".tmp.npy",
+                          ARQUIVO_METADADOS + ".tmp"):
+                if os.path.exists(self._caminho(resto)):
+                    os.remove(self._caminho(resto))
+            if vivas is None and (matriz is None or len(matriz) == total):
+                with self._conexao:
+                    # Linhas órfãs de uma escrita interrompida antes do manifesto
+                    self._conexao.execute("DELETE FROM blocos WHERE posicao >= ?", (total,))
+                self._conexao.execute("VACUUM")
+                return 0
+            posicoes = np.arange(total) if vivas is None else np.flatnonzero(vivas)
+            if not len(posicoes):
+                for nome in (ARQUIVO_MANIFESTO, ARQUIVO_VETORES, ARQUIVO_ESCALAS, ARQUIVO_METADADOS):
+                    if os.path.exists(self._caminho(nome)):
+                        os.remove(self._caminho(nome))
+            else:
+                self._reescrever(matriz, escalas, posicoes, total)
+                self._salvar_manifesto(len(posicoes), self._dimensao)
+            self._conectar()
+            self._carregar()
+            return total - len(posicoes)
+
+    def _reescrever(self, matriz, escalas, posicoes, total: int):
+        caminho = self._caminho(ARQUIVO_VETORES)
+        nova = np.lib.format.open_memmap(caminho + ".tmp", mode="w+", dtype=matriz.dtype, shape=(len(posicoes), matriz.shape[1]))
+        for inicio in range(0, len(posicoes), BLOCO_BUSCA):
+            parte = posicoes[inicio:inicio + BLOCO_BUSCA]
+            nova[inicio:inicio + len(parte)] = matriz[parte]
+        nova.flush()
+        del nova
+        if escalas is not None:
+            np.save(self._caminho(ARQUIVO_ESCALAS) + ".tmp.npy", np.asarray(escalas[posicoes]))
+
+        # SQLite novo, já sem páginas livres, com as posições na ordem da matriz nova
+        temporario = self._caminho(ARQUIVO_METADADOS) + ".tmp"
+        self._conexao.execute("ATTACH DATABASE ? AS nova", (temporario,))
+        try:
+            with self._conexao:
+                self._conexao.execute(
+                    "CREATE TABLE nova.blocos ("
+                    "posicao INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, conteudo TEXT NOT NULL, metadados TEXT)"
+                )
+                self._conexao.execute(
+                    "INSERT INTO nova.blocos (posicao, id, conteudo, metadados) "
+                    "SELECT ROW_NUMBER() OVER (ORDER BY posicao) - 1, id, conteudo, metadados "
+                    "FROM main.blocos WHERE posicao < ? ORDER BY posicao", (total,)
+                )
+                self._conexao.execute(
+                    "CREATE INDEX nova.blocos_fonte ON blocos (json_extract(metadados, '$.source'))"
+                )
+        finally:
+            self._conexao.execute("DETACH DATABASE nova")
+
+        os.replace(caminho + ".tmp", caminho)
+        if escalas is not None:
+            os.replace(self._caminho(ARQUIVO_ESCALAS) + ".tmp.npy", self._caminho(ARQUIVO_ESCALAS))
+        os.replace(temporario, self._caminho(ARQUIVO_METADADOS))
+
+    @staticmethod
+    def _pontuar(matriz, escalas, total: int, consultas):
+        """
+        Similaridade de cosseno de cada consulta (uma por coluna) contra todas as
+        linhas, bloco a bloco. Várias consultas juntas leem a matriz uma vez só.
+        """
+        pontuacoes = np.empty((total, consultas.shape[1]), dtype=np.float32)
+        for inicio in range(0, total, BLOCO_BUSCA):
+            fim = min(inicio + BLOCO_BUSCA, total)
+            pontuacoes[inicio:fim] = matriz[inicio:fim].astype(np.float32) @ consultas
+        if escalas is not None:
+            pontuacoes *= escalas[:total, None]
+        return pontuacoes
+
+    @staticmethod
+    def _posicoes_das_fontes(conexao, fontes, total: int):
+        posicoes = []
+        for inicio in range(0, len(fontes), 500):
+            parte = list(fontes[inicio:inicio + 500])
+            marcadores = ",".join("?" * len(parte))
+            posicoes.extend(linha[0] for linha in conexao.execute(
+                f"SELECT posicao FROM blocos WHERE json_extract(metadados, '$.source') IN ({marcadores}) "
+                "AND posicao < ?", (*parte, total)
+            ))
+        return np.sort(np.asarray(posicoes, dtype=np.int64))
+
+    def buscar_por_vetores(self, embeddings, k: int = 4, com_vetores: bool = False, fontes=None):
+        """
+        Top-k de cada consulta, como listas de (Document, distância) na ordem das
+        consultas. Com `com_vetores`, (Document, distância, vetor normalizado).
+        Com `fontes`, só as linhas desses PDFs são lidas e pontuadas.
+        """
+        with self._leitura():
+            return self._buscar_por_vetores(embeddings, k, com_vetores, fontes)
+
+    def _buscar_por_vetores(self, embeddings, k: int, com_vetores: bool, fontes):
+        self.sincronizar()
+        matriz, escalas, total, vivas, conexao = self._retrato()
+        if not total or (vivas is not None and not vivas.any()):
+            return [[] for _ in embeddings]
+        consultas = np.asarray(embeddings, dtype=np.float32)
+        self._validar_dimensao(consultas.shape[1])
+        normas = np.linalg.norm(consultas, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        consultas = consultas / normas
+
+        if fontes is None:
+            linhas = None
+            pontuacoes = self._pontuar(matriz, escalas, total, consultas.T)
+            if vivas is not None:
+                pontuacoes[~vivas] = -np.inf
+        else:
+            linhas = self._posicoes_das_fontes(conexao, fontes, total)
+            if not len(linhas):
+                return [[] for _ in embeddings]
+            pontuacoes = matriz[linhas].astype(np.float32) @ consultas.T
+            if escalas is not None:
+                pontuacoes *= escalas[linhas, None]
+        k = min(k, len(pontuacoes) if vivas is None or linhas is not None else int(vivas.sum()))
+        resultados = []
+        for coluna in pontuacoes.T:
+            melhores = np.argpartition(-coluna, k - 1)[:k]
+            melhores = melhores[np.argsort(-coluna[melhores])]
+            coluna = coluna[melhores]
+            if linhas is not None:
+                melhores = linhas[melhores]
+            vetores = None
+            if com_vetores:
+                vetores = matriz[melhores].astype(np.float32)
+                if escalas is not None:
+                    vetores *= escalas[melhores, None]
+            resultados.append(self._montar_documentos(conexao, melhores, coluna, vetores))
+        return resultados
+
+    def listar_metadados(self):
+        with self._leitura():
+            self.sincronizar()
+            _, _, total, _, conexao = self._retrato()
+            return [
+                json.loads(linha[0] or "{}")
+                for linha in conexao.execute("SELECT metadados FROM blocos WHERE posicao < ?", (total,))
+            ]
+
+    def _buscar_por_vetor(self, embedding, k: int):
+        return self.buscar_por_vetores([embedding], k)[0]
+
+    @staticmethod
+    def _montar_documentos(conexao, posicoes, pontuacoes, vetores=None):
+        marcadores = ",".join("?" * len(posicoes))
+        linhas = conexao.execute(
+            f"SELECT posicao, id, conteudo, metadados FROM blocos WHERE posicao IN ({marcadores})",
+            [int(p) for p in posicoes],
+        ).fetchall()
+        por_posicao = {linha[0]: linha for linha in linhas}
+        resultados = []
+        for i, (posicao, pontuacao) in enumerate(zip(posicoes, pontuacoes)):
+            if int(posicao) not in por_posicao:
+                # Apagada por outro worker depois do retrato
+                continue
+            _, id_bloco, conteudo, metadados = por_posicao[int(posicao)]
+            documento = Document(page_content=conteudo, metadata=json.loads(metadados or "{}"), id=id_bloco)
+            # Distância de cosseno (menor é melhor), mesma convenção do similarity_search_with_score do Chroma
+            item = (documento, float(1.0 - pontuacao))
+            resultados.append(item if vetores is None else item + (vetores[i],))
+        return resultados
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self._buscar_por_vetor(self._embeddings.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self._buscar_por_vetor(embedding, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda distancia: 1.0 - distancia
+
+    def persist(self):
+        """Mantido por compatibilidade com a interface do Chroma: a escrita já é persistida."""
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, persist_directory: str = None,
+                   quantizacao: str = "float32", **kwargs):
+        base_vetorial = cls(persist_directory, embedding, quantizacao)
+        base_vetorial.add_texts(texts, metadatas, ids=ids)
+        return base_vetorial
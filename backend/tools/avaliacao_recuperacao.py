@@ -0,0 +1,238 @@
+"""
+Avaliação offline da recuperação: qualidade x latência por configuração.
+
+Uso:
+    python -m backend.tools.avaliacao_recuperacao
+    python -m backend.tools.avaliacao_recuperacao --chunk-size 500,1000,1500 --chunk-overlap 100,200 --k 4,8 --saida avaliacao.md
+
+Gera os PDFs do conjunto de referência (avaliacao_recuperacao.json: textos
+por página e perguntas com as páginas esperadas), indexa com EmbeddingsLocais
+e passa cada pergunta por buscar_documentos. Para cada combinação da
+varredura informa recall@k e MRR das páginas esperadas, blocos e tokens de
+contexto por pergunta e latência da busca. Cada configuração roda num
+processo novo, porque os parâmetros de recuperação são lidos na importação.
+Com --pdfs, os documentos vêm da pasta e o JSON só precisa das perguntas.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+GOLDEN_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "avaliacao_recuperacao.json")
+COLECAO = "avaliacao"
+
+def _quebrar_linhas(texto: str, largura: int = 95):
+    linhas, atual = [], ""
+    for palavra in texto.split():
+        if atual and len(atual) + 1 + len(palavra) > largura:
+            linhas.append(atual)
+            atual = palavra
+        else:
+            atual = f"{atual} {palavra}".strip()
+    return linhas + [atual] if atual else linhas
+
+def _escapar(linha: str) -> str:
+    return linha.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def gerar_pdf(paginas) -> bytes:
+    """PDF mínimo com uma página por texto (Helvetica, WinAnsi), legível pelo PyPDFLoader."""
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    filhos = []
+    for texto in paginas:
+        linhas = " ".join(f"({_escapar(linha)}) '" for linha in _quebrar_linhas(texto))
+        conteudo = f"BT /F1 11 Tf 50 760 Td 14 TL {linhas} ET".encode("cp1252")
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(conteudo), conteudo))
+        objetos.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objetos)} 0 R "
+            "/Resources << /Font << /F1 3 0 R >> >> >>"
+        ).encode())
+        filhos.append(f"{len(objetos)} 0 R")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(filhos)}] /Count {len(filhos)} >>".encode()
+
+    saida, posicoes = b"%PDF-1.4\n", []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    inicio_xref = len(saida)
+    saida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    saida += b"".join(f"{posicao:010d} 00000 n \n".encode() for posicao in posicoes)
+    saida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return saida
+
+def _preparar_pdfs(golden: dict, pasta_pdfs: str, destino: str) -> list:
+    if pasta_pdfs:
+        return sorted(
+            os.path.join(pasta_pdfs, nome) for nome in os.listdir(pasta_pdfs) if nome.lower().endswith(".pdf")
+        )
+    os.makedirs(destino, exist_ok=True)
+    caminhos = []
+    for nome, paginas in golden["documentos"].items():
+        caminho = os.path.join(destino, nome)
+        with open(caminho, "wb") as f:
+            f.write(gerar_pdf(paginas))
+        caminhos.append(caminho)
+    return caminhos
+
+def indexar(args):
+    from ..services.documentos_service import indexar_pdf
+    from .embeddings_locais import EmbeddingsLocais
+
+    embeddings = EmbeddingsLocais(args.dimensao)
+    configuracao = {"chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap}
+    inicio = time.perf_counter()
+    blocos = sum(
+        indexar_pdf(caminho, embeddings, args.diretorio, COLECAO, configuracao)
+        for caminho in json.loads(args.pdfs)
+    )
+    return {"blocos_indice": blocos, "indexacao_s": round(time.perf_counter() - inicio, 2)}
+
+def avaliar(args):
+    from ..services.base_vetorial import obter_base_vetorial
+    from ..services.compressao import estimar_tokens
+    from ..services.rag_service import buscar_documentos, montar_contexto
+    from .embeddings_locais import EmbeddingsLocais
+
+    with open(args.golden, encoding="utf-8") as f:
+        perguntas = json.load(f)["perguntas"]
+    base_vetorial = obter_base_vetorial(EmbeddingsLocais(args.dimensao), args.diretorio, COLECAO)
+    # Primeira busca fora da conta: abre o índice e aquece caches
+    buscar_documentos(base_vetorial, perguntas[0]["pergunta"])
+
+    recall, reciprocos, blocos, tokens, latencias = [], [], [], [], []
+    for item in perguntas:
+        esperadas = {(nome, pagina) for nome, pagina in item["fontes"]}
+        for _ in range(args.repeticoes):
+            inicio = time.perf_counter()
+            resultados = buscar_documentos(base_vetorial, item["pergunta"])
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        documentos = [doc for doc, _ in resultados]
+        # Páginas no golden começam em 1; o PyPDFLoader numera a partir de 0
+        paginas = [
+            (os.path.basename(doc.metadata.get("source", "")), doc.metadata.get("page", -1) + 1) for doc in documentos
+        ]
+        recall.append(len(esperadas & set(paginas)) / len(esperadas))
+        posicao = next((i for i, pagina in enumerate(paginas, 1) if pagina in esperadas), None)
+        reciprocos.append(1 / posicao if posicao else 0.0)
+        blocos.append(len(documentos))
+        tokens.append(estimar_tokens(montar_contexto(documentos)))
+
+    latencias.sort()
+    media = lambda valores: sum(valores) / len(valores)
+    return {
+        "recall": round(media(recall), 3),
+        "mrr": round(media(reciprocos), 3),
+        "blocos": round(media(blocos), 2),
+        "tokens_contexto": round(media(tokens)),
+        "p50_ms": round(latencias[len(latencias) // 2], 2),
+        "p95_ms": round(latencias[max(0, int(len(latencias) * 0.95) - 1)], 2),
+    }
+
+def _ambiente(args, k: int, estrategia: str, raiz: str) -> dict:
+    ambiente = {
+        **os.environ,
+        "VECTOR_BACKEND": args.backend,
+        # A avaliação não usa o banco, mas o import de rag_service exige uma URL
+        "DATABASE_URL": os.environ.get("DATABASE_URL") or f"sqlite+aiosqlite:///{os.path.join(raiz, 'avaliacao.db')}",
+        "CACHE_PAGINAS_DIR": os.path.join(raiz, "cache_paginas"),
+        "RETRIEVAL_MAX_K": str(k),
+        "RETRIEVAL_FETCH_K": str(max(k, int(os.environ.get("RETRIEVAL_FETCH_K", "12")))),
+    }
+    if estrategia == "fixo":
+        # Sempre exatamente k blocos: sem limiar e sem corte no cotovelo
+        ambiente.update({"RETRIEVAL_MIN_K": str(k), "RETRIEVAL_LIMIAR": "0"})
+    return ambiente
+
+def _executar_fase(fase: str, ambiente: dict, args, diretorio: str, chunk_size: int, chunk_overlap: int, pdfs) -> dict:
+    comando = [
+        sys.executable, "-m", "backend.tools.avaliacao_recuperacao",
+        "--fase", fase, "--diretorio", diretorio, "--golden", args.golden,
+        "--chunk-size", str(chunk_size), "--chunk-overlap", str(chunk_overlap),
+        "--dimensao", str(args.dimensao), "--repeticoes", str(args.repeticoes), "--pdfs-fase", json.dumps(pdfs),
+    ]
+    saida = subprocess.run(comando, env=ambiente, capture_output=True, text=True)
+    if saida.returncode:
+        raise RuntimeError(f"Fase {fase} falhou:\n{saida.stderr[-2000:]}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def _lista(tipo):
+    return lambda valor: [tipo(parte) for parte in valor.split(",") if parte.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", default=GOLDEN_PADRAO, help="JSON com documentos (opcional com --pdfs) e perguntas")
+    parser.add_argument("--pdfs", help="Pasta com os PDFs, em vez de gerá-los a partir do JSON")
+    parser.add_argument("--chunk-size", default="500,1000,1500", help="Valores separados por vírgula")
+    parser.add_argument("--chunk-overlap", default="200")
+    parser.add_argument("--k", default="4", help="Máximo de blocos por pergunta (RETRIEVAL_MAX_K)")
+    parser.add_argument("--estrategia", default="adaptativo,fixo", help="adaptativo (k adaptativo da API) e/ou fixo")
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--dimensao", type=int, default=768)
+    parser.add_argument("--repeticoes", type=int, default=5, help="Buscas por pergunta para medir a latência")
+    parser.add_argument("--saida", help="Também grava a tabela (markdown) neste arquivo")
+    parser.add_argument("--fase", choices=["indexar", "avaliar"])
+    parser.add_argument("--diretorio")
+    parser.add_argument("--pdfs-fase", default="[]", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.golden = os.path.abspath(args.golden)
+
+    if args.fase:
+        args.chunk_size, args.chunk_overlap, args.pdfs = int(args.chunk_size), int(args.chunk_overlap), args.pdfs_fase
+        resultado = indexar(args) if args.fase == "indexar" else avaliar(args)
+        print(json.dumps(resultado))
+        return
+
+    with open(args.golden, encoding="utf-8") as f:
+        golden = json.load(f)
+    if not args.pdfs and "documentos" not in golden:
+        parser.error("o JSON não tem 'documentos': informe a pasta dos PDFs com --pdfs")
+    estrategias = _lista(str)(args.estrategia)
+    if set(estrategias) - {"adaptativo", "fixo"}:
+        parser.error("--estrategia aceita adaptativo e fixo")
+
+    raiz = tempfile.mkdtemp(prefix="avaliacao_recuperacao_")
+    try:
+        pdfs = _preparar_pdfs(golden, args.pdfs, os.path.join(raiz, "pdfs"))
+        linhas = []
+        for chunk_size, chunk_overlap in itertools.product(_lista(int)(args.chunk_size), _lista(int)(args.chunk_overlap)):
+            if chunk_overlap >= chunk_size:
+                continue
+            # Um índice por combinação de chunk, reaproveitado por todos os k e estratégias
+            diretorio = os.path.join(raiz, f"indice_{chunk_size}_{chunk_overlap}")
+            ambiente = _ambiente(args, 4, "adaptativo", raiz)
+            indice = _executar_fase("indexar", ambiente, args, diretorio, chunk_size, chunk_overlap, pdfs)
+            for k, estrategia in itertools.product(_lista(int)(args.k), estrategias):
+                ambiente = _ambiente(args, k, estrategia, raiz)
+                resultado = _executar_fase("avaliar", ambiente, args, diretorio, chunk_size, chunk_overlap, pdfs)
+                rotulo = f"adaptativo k≤{k}" if estrategia == "adaptativo" else f"fixo k={k}"
+                linhas.append((f"{chunk_size}/{chunk_overlap}", rotulo, {**resultado, **indice}))
+
+        colunas = list(linhas[0][2].keys())
+        tabela = [
+            f"{len(golden['perguntas'])} perguntas, {len(pdfs)} PDFs, backend {args.backend}, "
+            f"{args.repeticoes} buscas por pergunta",
+            "",
+            "| chunk/overlap | recuperação | " + " | ".join(colunas) + " |",
+            "|---" * (len(colunas) + 2) + "|",
+        ]
+        tabela += [
+            f"| {chunk} | {estrategia} | " + " | ".join(str(resultado[c]) for c in colunas) + " |"
+            for chunk, estrategia, resultado in linhas
+        ]
+        print("\n".join(tabela))
+        if args.saida:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                f.write("\n".join(tabela) + "\n")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Curva de escala da busca com roteamento por documento.
+
+Uso:
+    python -m backend.tools.benchmark_roteamento --documentos 100,1000,4000 --n 10,50
+
+Para cada tamanho de coleção gera PDFs sintéticos (blocos espalhados em volta
+de um tema por documento), grava blocos e centroides como a ingestão faria e
+compara, com as mesmas consultas, a busca plana com a roteada (primeiro os N
+documentos mais próximos, depois só os blocos deles). Mostra a latência de
+cada estágio e o recall@k da busca roteada em relação à plana.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+def _percentis(amostras):
+    amostras = sorted(amostras)
+    return round(amostras[len(amostras) // 2], 2), round(amostras[max(0, int(len(amostras) * 0.95) - 1)], 2)
+
+def _medir(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+def construir(diretorio: str, documentos: int, blocos_por_documento: int, dimensao: int, aleatorio, backend: str):
+    from langchain_core.documents import Document
+    from ..services.base_vetorial import gravar_vetores, obter_base_documentos, obter_base_vetorial
+    from ..services.roteamento import Centroide
+    from .embeddings_locais import EmbeddingsLocais
+
+    base = obter_base_vetorial(EmbeddingsLocais(dimensao), diretorio, "benchmark", backend)
+    temas = aleatorio.standard_normal((documentos, dimensao)).astype(np.float32)
+    centroides, blocos, vetores, ids = [], [], [], []
+    for d, tema in enumerate(temas):
+        fonte = f"documento_{d}.pdf"
+        proprios = tema + aleatorio.standard_normal((blocos_por_documento, dimensao)).astype(np.float32)
+        centroide = Centroide()
+        centroide.acumular(proprios)
+        centroides.append((fonte, f"hash_{d}", centroide))
+        blocos += [Document(page_content=f"{fonte} bloco {i}", metadata={"source": fonte}) for i in range(blocos_por_documento)]
+        vetores.append(proprios)
+        ids += [f"hash_{d}:{i}" for i in range(blocos_por_documento)]
+    vetores = np.concatenate(vetores)
+    # Lotes grandes: cada gravação no NumPy reescreve a matriz
+    lote = 50000
+    for inicio in range(0, len(blocos), lote):
+        gravar_vetores(base, blocos[inicio:inicio + lote], vetores[inicio:inicio + lote], ids[inicio:inicio + lote])
+
+    base_documentos = obter_base_documentos(base)
+    gravar_vetores(
+        base_documentos,
+        [Document(page_content=fonte, metadata={"source": fonte, "blocos": c.blocos}) for fonte, _, c in centroides],
+        [c.soma / c.blocos for _, _, c in centroides],
+        [h for _, h, _ in centroides],
+    )
+    return base, base_documentos, temas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documentos", default="100,1000,4000", help="Tamanhos de coleção (PDFs), separados por vírgula")
+    parser.add_argument("--blocos-por-documento", type=int, default=50)
+    parser.add_argument("--n", default="10,50", help="PDFs escolhidos no primeiro estágio")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--dimensao", type=int, default=256)
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--backend", default="numpy")
+    args = parser.parse_args()
+
+    from ..services.base_vetorial import buscar_por_vetores, descartar_bases_em_cache
+
+    raiz = tempfile.mkdtemp(prefix="benchmark_roteamento_")
+    aleatorio = np.random.default_rng(1)
+    linhas = []
+    try:
+        for documentos in (int(v) for v in args.documentos.split(",")):
+            diretorio = os.path.join(raiz, str(documentos))
+            base, base_documentos, temas = construir(
+                diretorio, documentos, args.blocos_por_documento, args.dimensao, aleatorio, args.backend
+            )
+            escolhidos = aleatorio.integers(0, documentos, args.consultas)
+            consultas = temas[escolhidos] + aleatorio.standard_normal((args.consultas, args.dimensao)).astype(np.float32)
+            # Aquecimento: abre o mmap e o SQLite antes de medir
+            buscar_por_vetores(base, [consultas[0]], k=args.k)
+
+            plano, tempos_plano = [], []
+            for vetor in consultas:
+                resultado, ms = _medir(lambda: buscar_por_vetores(base, [vetor], k=args.k)[0])
+                plano.append({doc.id or doc.page_content for doc, _ in resultado})
+                tempos_plano.append(ms)
+
+            for n in (int(v) for v in args.n.split(",")):
+                tempos_documentos, tempos_blocos, acertos = [], [], 0
+                for vetor, esperado in zip(consultas, plano):
+                    primeiros, ms_documentos = _medir(lambda: buscar_por_vetores(base_documentos, [vetor], k=n)[0])
+                    fontes = [doc.metadata["source"] for doc, _ in primeiros]
+                    resultado, ms_blocos = _medir(lambda: buscar_por_vetores(base, [vetor], k=args.k, fontes=fontes)[0])
+                    tempos_documentos.append(ms_documentos)
+                    tempos_blocos.append(ms_blocos)
+                    acertos += len(esperado & {doc.id or doc.page_content for doc, _ in resultado})
+                linhas.append({
+                    "documentos": documentos,
+                    "blocos": documentos * args.blocos_por_documento,
+                    "n": n,
+                    "plano_p50_ms": _percentis(tempos_plano)[0],
+                    "plano_p95_ms": _percentis(tempos_plano)[1],
+                    "estagio1_p50_ms": _percentis(tempos_documentos)[0],
+                    "estagio2_p50_ms": _percentis(tempos_blocos)[0],
+                    "roteado_p95_ms": _percentis([a + b for a, b in zip(tempos_documentos, tempos_blocos)])[1],
+                    "recall_vs_plano": round(acertos / (args.k * args.consultas), 3),
+                })
+            descartar_bases_em_cache()
+
+        colunas = list(linhas[0].keys())
+        print(f"{args.blocos_por_documento} blocos por PDF x {args.dimensao} dimensões, {args.consultas} consultas, k={args.k}")
+        print("| " + " | ".join(colunas) + " |")
+        print("|---" * len(colunas) + "|")
+        for linha in linhas:
+            print("| " + " | ".join(str(linha[c]) for c in colunas) + " |")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark de memória e latência dos backends de vector store.
+
+Uso:
+    python -m backend.tools.benchmark_vetores --vetores 20000 --consultas 200
+
+Cada configuração é construída e medida em um processo novo, para que a
+abertura a frio e o pico de RSS reflitam o que um worker da API veria.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGURACOES = [
+    ("chroma", "float32"),
+    ("numpy", "float32"),
+    ("numpy", "float16"),
+    ("numpy", "int8"),
+]
+
+def _gerar_textos(quantidade: int, semente: int):
+    aleatorio = random.Random(semente)
+    vocabulario = [f"termo{i}" for i in range(5000)]
+    return [" ".join(aleatorio.choices(vocabulario, k=60)) for _ in range(quantidade)]
+
+def _pico_rss_mb() -> float:
+    # ru_maxrss é em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _tamanho_diretorio_mb(diretorio: str) -> float:
+    total = 0
+    for raiz, _, arquivos in os.walk(diretorio):
+        total += sum(os.path.getsize(os.path.join(raiz, a)) for a in arquivos)
+    return total / (1024 * 1024)
+
+def construir(args):
+    from langchain_core.documents import Document
+    from ..services.base_vetorial import adicionar_documentos
+    from .embeddings_locais import EmbeddingsLocais
+
+    embeddings = EmbeddingsLocais(args.dimensao)
+    textos = _gerar_textos(args.vetores, semente=1)
+    inicio = time.perf_counter()
+    for i in range(0, len(textos), args.lote):
+        blocos = [Document(page_content=t, metadata={"source": f"doc{j}.pdf"}) for j, t in enumerate(textos[i:i + args.lote], i)]
+        adicionar_documentos(blocos, embeddings, args.diretorio, args.backend)
+    return {"ingestao_s": round(time.perf_counter() - inicio, 2)}
+
+def medir(args):
+    from ..services.base_vetorial import abrir_base_vetorial
+    from .embeddings_locais import EmbeddingsLocais
+
+    embeddings = EmbeddingsLocais(args.dimensao)
+    consultas = [embeddings.embed_query(t) for t in _gerar_textos(args.consultas, semente=2)]
+    rss_antes = _pico_rss_mb()
+
+    inicio = time.perf_counter()
+    base_vetorial = abrir_base_vetorial(embeddings, args.diretorio, args.backend)
+    base_vetorial.similarity_search_by_vector(consultas[0], k=args.k)
+    abertura_ms = (time.perf_counter() - inicio) * 1000
+
+    latencias = []
+    for vetor in consultas:
+        inicio = time.perf_counter()
+        base_vetorial.similarity_search_by_vector(vetor, k=args.k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    latencias.sort()
+    return {
+        "abertura_fria_ms": round(abertura_ms, 1),
+        "p50_ms": round(latencias[len(latencias) // 2], 2),
+        "p95_ms": round(latencias[int(len(latencias) * 0.95) - 1], 2),
+        "rss_busca_mb": round(_pico_rss_mb() - rss_antes, 1),
+        "disco_mb": round(_tamanho_diretorio_mb(args.diretorio), 1),
+    }
+
+def _executar_fase(fase: str, backend: str, quantizacao: str, diretorio: str, args) -> dict:
+    comando = [
+        sys.executable, "-m", "backend.tools.benchmark_vetores",
+        "--fase", fase, "--backend", backend, "--diretorio", diretorio,
+        "--vetores", str(args.vetores), "--dimensao", str(args.dimensao),
+        "--consultas", str(args.consultas), "--k", str(args.k), "--lote", str(args.lote),
+    ]
+    env = {**os.environ, "VECTOR_QUANTIZACAO": quantizacao}
+    saida = subprocess.run(comando, env=env, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vetores", type=int, default=20000)
+    parser.add_argument("--dimensao", type=int, default=768)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--lote", type=int, default=2000)
+    parser.add_argument("--fase", choices=["construir", "medir"])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--diretorio")
+    args = parser.parse_args()
+
+    if args.fase:
+        resultado = construir(args) if args.fase == "construir" else medir(args)
+        print(json.dumps(resultado))
+        return
+
+    raiz = tempfile.mkdtemp(prefix="benchmark_vetores_")
+    try:
+        linhas = []
+        for backend, quantizacao in CONFIGURACOES:
+            diretorio = os.path.join(raiz, f"{backend}_{quantizacao}")
+            resultado = _executar_fase("construir", backend, quantizacao, diretorio, args)
+            resultado.update(_executar_fase("medir", backend, quantizacao, diretorio, args))
+            linhas.append((f"{backend}/{quantizacao}" if backend == "numpy" else backend, resultado))
+
+        colunas = list(linhas[0][1].keys())
+        print(f"{args.vetores} vetores x {args.dimensao} dimensões, {args.consultas} consultas, k={args.k}")
+        print("| backend | " + " | ".join(colunas) + " |")
+        print("|---" * (len(colunas) + 1) + "|")
+        for nome, resultado in linhas:
+            print(f"| {nome} | " + " | ".join(str(resultado[c]) for c in colunas) + " |")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
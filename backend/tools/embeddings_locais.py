@@ -0,0 +1,28 @@
+import re
+import zlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class EmbeddingsLocais(Embeddings):
+    """
+    Embeddings determinísticos por hashing de tokens, sem chamadas de rede.
+    Servem de substituto local do Google em benchmarks e avaliações offline:
+    textos com palavras em comum ficam próximos no espaço vetorial.
+    """
+
+    def __init__(self, dimensao: int = 768):
+        self.dimensao = dimensao
+
+    def _vetorizar(self, texto: str):
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for token in re.findall(r"\w+", texto.lower()):
+            h = zlib.crc32(token.encode("utf-8"))
+            vetor[h % self.dimensao] += 1.0 if (h >> 16) & 1 else -1.0
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma else vetor).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vetorizar(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vetorizar(text)
@@ -0,0 +1,142 @@
+"""
+Verificação de acesso concorrente à base vetorial por vários workers.
+
+Uso:
+    python -m backend.tools.estresse_workers --escritores 2 --leitores 4
+    CHROMA_HOST=localhost python -m backend.tools.estresse_workers
+
+Sobe processos independentes (como os workers do uvicorn) apontando para a
+mesma base: escritores anexam lotes enquanto leitores buscam sem parar.
+No fim confere que nenhum bloco se perdeu, que nenhuma busca falhou e que
+nenhum leitor viu a contagem andar para trás. Sai com código 1 se algo falhar.
+
+Roda nos modos com vários workers suportados: o índice NumPy sempre e o
+Chroma em servidor quando `CHROMA_HOST` está definido. O Chroma local é de
+um processo só e é recusado.
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+import uuid
+
+SUPORTADOS = ("numpy", "chroma")
+
+def _escritor(indice: int, backend: str, diretorio: str, colecao: str, lotes: int, tamanho_lote: int, fila):
+    from langchain_core.documents import Document
+    from ..services.base_vetorial import adicionar_documentos
+    from .embeddings_locais import EmbeddingsLocais
+
+    embeddings = EmbeddingsLocais(256)
+    try:
+        for lote in range(lotes):
+            blocos = [
+                Document(page_content=f"escritor {indice} lote {lote} bloco {i} termo{i % 50}")
+                for i in range(tamanho_lote)
+            ]
+            adicionar_documentos(blocos, embeddings, diretorio, colecao, backend)
+        fila.put(("escritor", indice, None))
+    except Exception as e:
+        fila.put(("escritor", indice, repr(e)))
+
+def _leitor(indice: int, backend: str, diretorio: str, colecao: str, parar, fila):
+    from ..services.base_vetorial import obter_base_vetorial, leitura_segura
+    from ..utils import get_vector_count
+    from .embeddings_locais import EmbeddingsLocais
+
+    embeddings = EmbeddingsLocais(256)
+    buscas, ultima_contagem = 0, 0
+    try:
+        base_vetorial = obter_base_vetorial(embeddings, diretorio, colecao, backend)
+        while not parar.is_set():
+            with leitura_segura(base_vetorial):
+                contagem = get_vector_count(base_vetorial)
+                # Como na API: coleção vazia não é consultada (carregar_base_vetorial devolve 404)
+                if contagem:
+                    base_vetorial.similarity_search(f"termo{buscas % 50}", k=4)
+            if contagem < ultima_contagem:
+                raise AssertionError(f"contagem voltou de {ultima_contagem} para {contagem}")
+            ultima_contagem = contagem
+            buscas += 1
+        fila.put(("leitor", indice, None, buscas))
+    except Exception as e:
+        fila.put(("leitor", indice, repr(e), buscas))
+
+def _rodar(backend: str, args) -> list:
+    diretorio = args.diretorio or tempfile.mkdtemp(prefix="estresse_workers_")
+    # No servidor a pasta não separa as rodadas: cada uma usa uma coleção nova
+    colecao = f"estresse_{uuid.uuid4().hex[:8]}"
+    contexto = multiprocessing.get_context("spawn")
+    fila, parar = contexto.Queue(), contexto.Event()
+
+    leitores = [
+        contexto.Process(target=_leitor, args=(i, backend, diretorio, colecao, parar, fila))
+        for i in range(args.leitores)
+    ]
+    escritores = [
+        contexto.Process(target=_escritor, args=(i, backend, diretorio, colecao, args.lotes, args.tamanho_lote, fila))
+        for i in range(args.escritores)
+    ]
+    inicio = time.perf_counter()
+    for processo in leitores + escritores:
+        processo.start()
+    for processo in escritores:
+        processo.join()
+    parar.set()
+    for processo in leitores:
+        processo.join()
+
+    falhas, buscas = [], 0
+    while not fila.empty():
+        resultado = fila.get()
+        if resultado[2]:
+            falhas.append(f"{backend}: {resultado[0]} {resultado[1]}: {resultado[2]}")
+        if resultado[0] == "leitor":
+            buscas += resultado[3]
+
+    from ..services.base_vetorial import CHROMA_HOST, _cliente_chroma_servidor, abrir_base_vetorial
+    from ..utils import get_vector_count
+    from .embeddings_locais import EmbeddingsLocais
+    total = get_vector_count(abrir_base_vetorial(EmbeddingsLocais(256), diretorio, colecao, backend))
+    esperado = args.escritores * args.lotes * args.tamanho_lote
+    if total != esperado:
+        falhas.append(f"{backend}: total final {total}, esperado {esperado}")
+    if backend == "chroma" and CHROMA_HOST:
+        _cliente_chroma_servidor().delete_collection(colecao)
+
+    print(
+        f"[{backend}] {args.escritores} escritores, {args.leitores} leitores, "
+        f"{buscas} buscas em {time.perf_counter() - inicio:.1f}s; blocos gravados: {total}/{esperado}"
+    )
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escritores", type=int, default=2)
+    parser.add_argument("--leitores", type=int, default=4)
+    parser.add_argument("--lotes", type=int, default=10)
+    parser.add_argument("--tamanho-lote", type=int, default=50)
+    parser.add_argument("--diretorio", help="Pasta da base (padrão: temporária)")
+    parser.add_argument(
+        "--backends", help="Separados por vírgula (padrão: numpy, e chroma quando CHROMA_HOST está definido)"
+    )
+    args = parser.parse_args()
+
+    from ..services.base_vetorial import CHROMA_HOST
+    backends = args.backends.split(",") if args.backends else ["numpy"] + (["chroma"] if CHROMA_HOST else [])
+    for backend in backends:
+        if backend not in SUPORTADOS:
+            sys.exit(f"Backend desconhecido: {backend}")
+        if backend == "chroma" and not CHROMA_HOST:
+            sys.exit("Chroma local não suporta vários processos; defina CHROMA_HOST para testar o Chroma em servidor.")
+
+    falhas = []
+    for backend in backends:
+        falhas.extend(_rodar(backend, args))
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
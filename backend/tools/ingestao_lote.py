@@ -0,0 +1,184 @@
+"""
+Ingestão em lote de uma pasta (e subpastas) de PDFs.
+
+Uso:
+    python -m backend.tools.ingestao_lote /caminho/dos/pdfs --usuario cliente@empresa.com
+    python -m backend.tools.ingestao_lote /caminho/dos/pdfs --usuario cliente@empresa.com --workers 8
+
+Cada arquivo passa pelo mesmo caminho de `/processar/{filename}` (indexar_pdf)
+em um pool de threads, gravando o resultado na tabela `documentos`. Rodar de novo depois de
+uma interrupção pula os arquivos já indexados com o mesmo conteúdo (hash) e
+reprocessa os pendentes e os que falharam.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fastapi import HTTPException
+
+def _listar_pdfs(raiz: str):
+    caminhos = []
+    for pasta, subpastas, arquivos in os.walk(raiz):
+        subpastas.sort()
+        caminhos.extend(os.path.join(pasta, nome) for nome in sorted(arquivos) if nome.lower().endswith(".pdf"))
+    return caminhos
+
+def _desvincular(db, documento, fontes, base_vetorial, colecao: str, manter_hash: str = None):
+    """Como em /processar/: tira da coleção os blocos de outro conteúdo indexados a partir do documento."""
+    from ..models import Documento
+    from ..services.documentos_service import desvincular_blocos, hashes_indexados, sobreviventes_na_colecao
+
+    hashes = hashes_indexados(base_vetorial, fontes)
+    hashes.discard(manter_hash)
+    if not hashes:
+        return
+    candidatos = (
+        db.query(Documento)
+        .filter(Documento.hash_conteudo.in_(hashes), Documento.id != documento.id)
+        .order_by(Documento.id)
+        .all()
+    )
+    sobreviventes = sobreviventes_na_colecao(candidatos, documento, colecao)
+    _, repassados = desvincular_blocos(
+        base_vetorial, fontes, {h: outro.caminho_arquivo for h, outro in sobreviventes.items()}, manter_hash
+    )
+    for hash_bloco, quantidade in repassados.items():
+        sobreviventes[hash_bloco].numero_chunks = (sobreviventes[hash_bloco].numero_chunks or 0) + quantidade
+
+def _ingerir_arquivo(caminho: str, raiz: str, usuario_id: int, indice, embeddings, args):
+    from ..config import DOCS_DIR
+    from ..database import SessionLocal
+    from ..models import Documento
+    from ..services.base_vetorial import nome_colecao
+    from ..services.cache_paginas import hash_arquivo
+    from ..services.documentos_service import criar_ou_validar_base, fontes_documento, indexar_pdf
+
+    diretorio, configuracao = indice
+    # Caminho relativo como nome: PDFs homônimos em subpastas diferentes não colidem
+    nome = os.path.relpath(caminho, raiz).replace(os.sep, "/")
+    hash_conteudo = hash_arquivo(caminho)
+
+    db = SessionLocal()
+    try:
+        documento = db.query(Documento).filter(Documento.nome_arquivo == nome).first()
+        if documento and documento.hash_conteudo == hash_conteudo and documento.usuario_id == usuario_id:
+            if documento.preprocessado:
+                return "pulado", nome, f"{documento.numero_chunks} blocos"
+            if documento.erro_processamento and args.pular_falhas:
+                return "pulado", nome, documento.erro_processamento
+
+        fontes = {os.path.abspath(caminho)}
+        dono_anterior = documento.usuario_id if documento else None
+        if not documento:
+            documento = Documento(nome_arquivo=nome, nome_original=os.path.basename(caminho))
+            db.add(documento)
+        else:
+            fontes |= fontes_documento(documento, DOCS_DIR)
+        documento.caminho_arquivo = os.path.abspath(caminho)
+        documento.hash_conteudo = hash_conteudo
+        documento.usuario_id = usuario_id
+        documento.preprocessado = False
+        documento.numero_chunks = 0
+        documento.erro_processamento = None
+        if not args.sem_binario:
+            # Backup no banco, como no upload: permite reconstruir o índice sem a pasta original
+            with open(caminho, "rb") as f:
+                documento.conteudo_binario = f.read()
+        db.commit()
+
+        colecao = nome_colecao(usuario_id)
+        try:
+            # Conteúdo trocado desde a última ingestão: sem isto os blocos antigos, com o
+            # mesmo "source", continuariam nas buscas
+            base_vetorial, _ = criar_ou_validar_base(embeddings, diretorio, colecao)
+            _desvincular(db, documento, fontes, base_vetorial, colecao, manter_hash=hash_conteudo)
+            # Mudou de dono (já gravado acima): os blocos não ficam para trás na coleção anterior
+            if dono_anterior is not None and nome_colecao(dono_anterior) != colecao:
+                base_anterior, _ = criar_ou_validar_base(embeddings, diretorio, nome_colecao(dono_anterior))
+                _desvincular(db, documento, fontes, base_anterior, nome_colecao(dono_anterior))
+            db.commit()
+            numero_blocos = indexar_pdf(caminho, embeddings, diretorio, colecao, configuracao)
+        except HTTPException as e:
+            # 503 é índice incompatível: não adianta seguir com os outros arquivos
+            if e.status_code == 503:
+                raise
+            documento.erro_processamento = e.detail
+            db.commit()
+            return "falha", nome, e.detail
+        except Exception as e:
+            documento.erro_processamento = str(e)
+            db.commit()
+            return "falha", nome, str(e)
+
+        documento.preprocessado = True
+        documento.numero_chunks = numero_blocos
+        db.commit()
+        return "indexado", nome, f"{numero_blocos} blocos"
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pasta", help="Pasta com os PDFs (subpastas incluídas)")
+    parser.add_argument("--usuario", required=True, help="Email do dono da coleção onde os blocos serão indexados")
+    parser.add_argument("--workers", type=int, default=4, help="Arquivos processados em paralelo")
+    parser.add_argument("--sem-binario", action="store_true", help="Não guarda uma cópia do PDF no banco")
+    parser.add_argument("--pular-falhas", action="store_true", help="Não tenta de novo arquivos que já falharam")
+    args = parser.parse_args()
+
+    from ..database import SessionLocal
+    from ..models import Usuario
+    from ..services.geracoes import indice_ativo
+    from ..services.rag_engine import obter_embeddings
+
+    db = SessionLocal()
+    try:
+        usuario = db.query(Usuario).filter(Usuario.email == args.usuario).first()
+    finally:
+        db.close()
+    if not usuario:
+        sys.exit(f"Usuário {args.usuario} não encontrado.")
+
+    raiz = os.path.abspath(args.pasta)
+    caminhos = _listar_pdfs(raiz)
+    if not caminhos:
+        sys.exit(f"Nenhum PDF encontrado em {raiz}.")
+
+    indice = indice_ativo()
+    embeddings = obter_embeddings(indice[1]["modelo_embeddings"])
+    contagem = {"indexado": 0, "pulado": 0, "falha": 0}
+    falhas = []
+    print(f"{len(caminhos)} PDFs em {raiz}, {args.workers} workers, geração {os.path.basename(indice[0])}")
+
+    inicio = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    futuros = [
+        executor.submit(_ingerir_arquivo, caminho, raiz, usuario.id, indice, embeddings, args)
+        for caminho in caminhos
+    ]
+    try:
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            situacao, nome, detalhe = futuro.result()
+            contagem[situacao] += 1
+            if situacao == "falha":
+                falhas.append(f"{nome}: {detalhe}")
+            decorrido = time.perf_counter() - inicio
+            print(f"[{concluidos}/{len(caminhos)}] {situacao:<8} {nome} ({detalhe}) — {concluidos / decorrido:.2f} arquivos/s")
+    except (HTTPException, KeyboardInterrupt) as e:
+        executor.shutdown(wait=True, cancel_futures=True)
+        motivo = e.detail if isinstance(e, HTTPException) else "interrompido"
+        sys.exit(f"Ingestão parada ({motivo}). Rode de novo para continuar de onde parou.")
+    executor.shutdown()
+
+    decorrido = time.perf_counter() - inicio
+    print(
+        f"Indexados: {contagem['indexado']}, pulados: {contagem['pulado']}, falhas: {contagem['falha']} "
+        f"em {decorrido:.1f}s ({len(caminhos) / decorrido:.2f} arquivos/s)"
+    )
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import random
+import threading
+import time
+from langchain_core.messages import AIMessage
+
+class FalhaSimulada(Exception):
+    """Erro com status HTTP, como os que o SDK da Groq levanta."""
+
+    def __init__(self, status_code: int = 503):
+        super().__init__(f"Falha simulada (HTTP {status_code})")
+        self.status_code = status_code
+
+class LLMLocal:
+    """
+    Substituto local do ChatGroq, sem rede, para exercitar o LLMResiliente.
+    `atrasos` e `falhas` são listas consumidas uma por chamada (depois vale o
+    último valor); `taxa_falha` sorteia falhas além das listadas.
+    """
+
+    def __init__(self, model_name: str = "llm-local", atrasos=(0.0,), falhas=(None,), taxa_falha: float = 0.0,
+                 semente: int = None):
+        self.model_name = model_name
+        self._atrasos = list(atrasos)
+        self._falhas = list(falhas)
+        self._taxa_falha = taxa_falha
+        self._aleatorio = random.Random(semente)
+        self._trava = threading.Lock()
+        self.chamadas = 0
+
+    def _proximo(self, valores):
+        return valores[min(self.chamadas, len(valores) - 1)]
+
+    def invoke(self, mensagens):
+        with self._trava:
+            atraso = self._proximo(self._atrasos)
+            falha = self._proximo(self._falhas)
+            if falha is None and self._aleatorio.random() < self._taxa_falha:
+                falha = 503
+            self.chamadas += 1
+        time.sleep(atraso)
+        if falha is not None:
+            raise FalhaSimulada(falha)
+        return AIMessage(content=f"[{self.model_name}] {mensagens[-1].content[:80]}")
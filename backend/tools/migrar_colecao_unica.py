@@ -0,0 +1,55 @@
+"""
+Migração da coleção única (`langchain`) para as coleções por usuário.
+
+Uso:
+    python -m backend.tools.migrar_colecao_unica --usuario cliente@empresa.com
+
+Documentos processados antes das coleções por usuário não têm dono no banco e
+os blocos deles ficaram na coleção única, onde as buscas não olham mais. O
+banco não guarda quem os enviou, então quem roda escolhe o dono: eles passam
+para o usuário indicado e o índice é reconstruído numa geração nova, com cada
+documento na coleção do seu dono. A geração antiga continua respondendo até o
+fim e é apagada depois da carência (GERACAO_CARENCIA_S).
+"""
+import argparse
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuario", required=True, help="Email de quem fica com os documentos sem dono")
+    args = parser.parse_args()
+
+    from ..database import SessionLocal
+    from ..models import Documento, Usuario
+    from ..services.base_vetorial import VECTOR_COLECAO_POR_USUARIO
+    from ..services.geracoes import estado_reconstrucao, reconstruir_indice
+
+    if not VECTOR_COLECAO_POR_USUARIO:
+        sys.exit("VECTOR_COLECAO_POR_USUARIO=false: a coleção única continua sendo a usada.")
+
+    db = SessionLocal()
+    try:
+        usuario = db.query(Usuario).filter(Usuario.email == args.usuario).first()
+        if not usuario:
+            sys.exit(f"Usuário {args.usuario} não encontrado.")
+        sem_dono = db.query(Documento).filter(
+            Documento.usuario_id.is_(None), Documento.preprocessado == True  # noqa: E712
+        ).all()
+        for documento in sem_dono:
+            documento.usuario_id = usuario.id
+        db.commit()
+    finally:
+        db.close()
+    print(f"{len(sem_dono)} documentos sem dono passaram para {args.usuario}.")
+
+    geracao = reconstruir_indice(motivo="colecao_por_usuario")
+    if geracao is None:
+        sys.exit("Já há uma reconstrução em andamento; rode de novo quando ela terminar.")
+    print(f"Geração {geracao} ativa, com cada documento na coleção do seu dono.")
+    falhas = estado_reconstrucao()["falhas"]
+    for nome, erro in falhas.items():
+        print(f"FALHA: {nome}: {erro}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
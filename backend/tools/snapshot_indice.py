@@ -0,0 +1,62 @@
+"""
+Exporta e importa snapshots da geração ativa do índice.
+
+Uso:
+    python -m backend.tools.snapshot_indice exportar --saida /backups/indice.tar
+    python -m backend.tools.snapshot_indice importar /backups/indice.tar
+
+Na réplica nova, rode a importação antes de subir a API: os vetores chegam
+prontos, sem chamar a API de embeddings para cada PDF. A importação confere
+versão, backend, checksums, contagens e a dimensão do modelo de embeddings
+antes de ativar a geração restaurada.
+"""
+import argparse
+import os
+import sys
+import tarfile
+from datetime import datetime
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    exportar = comandos.add_parser("exportar", help="Grava o snapshot da geração ativa")
+    exportar.add_argument("--saida", help="Arquivo de destino (padrão: data/snapshots/indice_<geração>_<data>.tar)")
+    exportar.add_argument("--gzip", action="store_true", help="Compacta o tar (vetores comprimem pouco; o texto, bem)")
+    exportar.add_argument("--compactar", action="store_true", help="Libera os blocos apagados antes de exportar")
+    importar = comandos.add_parser("importar", help="Restaura um snapshot numa geração nova")
+    importar.add_argument("arquivo")
+    importar.add_argument("--nao-ativar", action="store_true", help="Só restaura e confere, sem trocar a geração ativa")
+    importar.add_argument("--sem-sonda", action="store_true", help="Não chama o modelo de embeddings para conferir a dimensão")
+    args = parser.parse_args()
+
+    from ..config import BASE_DIR
+    from ..services.geracoes import indice_ativo
+    from ..services.snapshots import exportar_snapshot, importar_snapshot
+
+    try:
+        if args.comando == "exportar":
+            diretorio, configuracao = indice_ativo()
+            if args.compactar:
+                from ..services.base_vetorial import compactar_indice
+                from ..services.rag_engine import obter_embeddings
+                relatorio = compactar_indice(obter_embeddings(configuracao["modelo_embeddings"]), diretorio)
+                print(f"Compactação: {relatorio['bytes_recuperados']} bytes recuperados")
+            saida = args.saida or os.path.join(
+                BASE_DIR, "data", "snapshots",
+                f"indice_{os.path.basename(os.path.normpath(diretorio))}_{datetime.utcnow():%Y%m%dT%H%M%S}.tar"
+                + (".gz" if args.gzip else ""),
+            )
+            resultado = exportar_snapshot(saida, comprimir=args.gzip)
+            print(f"Snapshot da geração {resultado['geracao']} em {resultado['arquivo']} "
+                  f"({resultado['bytes'] / 1e6:.1f} MB, {resultado['duracao_s']}s)")
+        else:
+            resultado = importar_snapshot(args.arquivo, ativar=not args.nao_ativar, sondar_embeddings=not args.sem_sonda)
+            situacao = "ativada" if resultado["ativada"] else "restaurada (não ativada)"
+            print(f"Snapshot {resultado['origem']} → geração {resultado['geracao']} {situacao} em {resultado['duracao_s']}s")
+        for nome, colecao in resultado["colecoes"].items():
+            print(f"  {nome}: {colecao['vetores']} vetores, dimensão {colecao['dimensao']}")
+    except (ValueError, OSError, tarfile.TarError) as e:
+        sys.exit(f"Falha: {e}")
+
+if __name__ == "__main__":
+    main()
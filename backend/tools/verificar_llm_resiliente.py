@@ -0,0 +1,154 @@
+"""
+Verificação da política do LLMResiliente com o LLMLocal, sem rede.
+
+Uso:
+    python -m backend.tools.verificar_llm_resiliente
+
+Roda cada cenário com prazos curtos (frações de segundo): hedge, repetição
+depois de 5xx, nenhuma repetição em 4xx, prazo total, disjuntor abrindo para
+o reserva, chamadas abandonadas contando no disjuntor e hedge suspenso com as
+threads ocupadas. Sai com código 1 se algum falhar.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from langchain_core.messages import HumanMessage
+
+MENSAGENS = [HumanMessage(content="pergunta de teste")]
+
+def _configurar(llm_resiliente, **valores):
+    padrao = {
+        "LLM_TIMEOUT_S": 0.5,
+        "LLM_PRAZO_S": 1.5,
+        "LLM_TENTATIVAS": 3,
+        "LLM_BACKOFF_S": 0.01,
+        "LLM_HEDGE_S": 0.1,
+        "LLM_LENTO_S": 0.4,
+        "LLM_DISJUNTOR_JANELA": 4,
+        "LLM_DISJUNTOR_MINIMO": 4,
+        "LLM_DISJUNTOR_LIMIAR": 0.5,
+        "LLM_DISJUNTOR_ABERTO_S": 5,
+        "LLM_THREADS": 8,
+    }
+    padrao.update(valores)
+    for nome, valor in padrao.items():
+        setattr(llm_resiliente, nome, valor)
+    # Executor novo por cenário, depois que as chamadas presas do anterior terminarem
+    llm_resiliente._executor.shutdown(wait=True)
+    llm_resiliente._executor = ThreadPoolExecutor(max_workers=padrao["LLM_THREADS"], thread_name_prefix="llm")
+
+def _contador(nome: str) -> int:
+    from ..metricas import instantaneo
+    return instantaneo().get(nome, 0)
+
+def _hedge(m, LLMLocal):
+    _configurar(m)
+    principal = LLMLocal(atrasos=[0.4, 0.0])
+    antes = _contador("llm.hedge_venceu")
+    inicio = time.monotonic()
+    m.LLMResiliente(principal).invoke(MENSAGENS)
+    decorrido = time.monotonic() - inicio
+    assert principal.chamadas == 2, f"{principal.chamadas} chamadas, esperava 2"
+    assert _contador("llm.hedge_venceu") == antes + 1, "a cópia não venceu"
+    assert decorrido < 0.35, f"levou {decorrido:.2f}s, a cópia devia responder antes da primeira"
+
+def _repeticao(m, LLMLocal):
+    _configurar(m)
+    principal = LLMLocal(falhas=[503, 503, None])
+    m.LLMResiliente(principal).invoke(MENSAGENS)
+    assert principal.chamadas == 3, f"{principal.chamadas} chamadas, esperava 3"
+
+def _sem_repeticao_4xx(m, LLMLocal):
+    from .llm_local import FalhaSimulada
+
+    _configurar(m)
+    principal = LLMLocal(falhas=[400, None])
+    try:
+        m.LLMResiliente(principal).invoke(MENSAGENS)
+    except FalhaSimulada as e:
+        assert e.status_code == 400, f"status {e.status_code}"
+    else:
+        raise AssertionError("400 não chegou a quem chamou")
+    assert principal.chamadas == 1, f"{principal.chamadas} chamadas, 4xx não deveria repetir"
+
+def _prazo(m, LLMLocal):
+    _configurar(m, LLM_HEDGE_S=0)
+    principal = LLMLocal(atrasos=[3.0])
+    inicio = time.monotonic()
+    try:
+        m.LLMResiliente(principal).invoke(MENSAGENS)
+    except HTTPException as e:
+        assert e.status_code == 504, f"status {e.status_code}"
+    else:
+        raise AssertionError("sem 504 com o provedor travado")
+    decorrido = time.monotonic() - inicio
+    assert decorrido < m.LLM_PRAZO_S + 0.3, f"levou {decorrido:.2f}s, prazo de {m.LLM_PRAZO_S}s"
+
+def _disjuntor(m, LLMLocal):
+    _configurar(m, LLM_TENTATIVAS=2)
+    principal = LLMLocal(falhas=[503])
+    reserva = LLMLocal(model_name="reserva")
+    llm = m.LLMResiliente(principal, reserva)
+    for _ in range(2):
+        llm.invoke(MENSAGENS)
+    assert llm.disjuntor.estado()["aberto"], f"disjuntor fechado: {llm.disjuntor.estado()}"
+    chamadas = principal.chamadas
+    resposta = llm.invoke(MENSAGENS)
+    assert principal.chamadas == chamadas, "com o disjuntor aberto o principal ainda foi chamado"
+    assert "[reserva]" in resposta.content, resposta.content
+
+def _abandonadas(m, LLMLocal):
+    _configurar(m, LLM_TENTATIVAS=1, LLM_TIMEOUT_S=0.3, LLM_PRAZO_S=0.4)
+    principal = LLMLocal(atrasos=[1.0])
+    llm = m.LLMResiliente(principal, LLMLocal(model_name="reserva"))
+    antes = _contador("llm.abandonadas")
+    llm.invoke(MENSAGENS)
+    # A chamada e a cópia ficaram rodando: as duas contam
+    assert _contador("llm.abandonadas") == antes + 2, "chamadas abandonadas não contadas"
+    estado = llm.disjuntor.estado()
+    assert estado["janela"] == 2 and estado["taxa_ruim"] == 1.0, f"disjuntor: {estado}"
+
+def _threads_ocupadas(m, LLMLocal):
+    _configurar(m, LLM_THREADS=3)
+    presas = [m._submeter(time.sleep, 1.0) for _ in range(2)]
+    principal = LLMLocal(atrasos=[0.3])
+    antes = _contador("llm.hedges_sem_thread")
+    m.LLMResiliente(principal).invoke(MENSAGENS)
+    assert principal.chamadas == 1, f"{principal.chamadas} chamadas, a cópia não devia sair"
+    assert _contador("llm.hedges_sem_thread") == antes + 1, "hedge sem thread não contado"
+    for futuro in presas:
+        futuro.result()
+    # O callback que libera a thread roda logo depois do resultado
+    limite = time.monotonic() + 1
+    while m._estado_executor()["ocupadas"] and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert m._estado_executor()["ocupadas"] == 0, m._estado_executor()
+
+CENARIOS = [
+    ("hedge", _hedge),
+    ("repeticao depois de 503", _repeticao),
+    ("sem repeticao em 400", _sem_repeticao_4xx),
+    ("prazo total", _prazo),
+    ("disjuntor e reserva", _disjuntor),
+    ("chamadas abandonadas no disjuntor", _abandonadas),
+    ("hedge sem threads livres", _threads_ocupadas),
+]
+
+def main():
+    from ..services import llm_resiliente
+    from .llm_local import LLMLocal
+
+    falhas = 0
+    for nome, cenario in CENARIOS:
+        try:
+            cenario(llm_resiliente, LLMLocal)
+            print(f"ok     {nome}")
+        except Exception as e:
+            falhas += 1
+            print(f"FALHA  {nome}: {e!r}")
+    print(f"{len(CENARIOS) - falhas}/{len(CENARIOS)} cenários ok")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,116 @@
 import os
-import shutil
-import logging
-from .config import CHROMA_DIR
+import threading
+from contextlib import contextmanager
 
-logger = logging.getLogger(__name__)
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+
+ARQUIVO_TRAVA = ".trava"
+ARQUIVO_PORTAO = ".trava_portao"
+ARQUIVO_TRAVA_LEITURA = ".trava_leitura"
+ARQUIVO_PROCESSO = ".trava_processo"
+
+_reservas = {}
+_trava_reservas = threading.Lock()
+
+@contextmanager
+def _flock(caminho: str, modo):
+    with open(caminho, "a") as arquivo:
+        fcntl.flock(arquivo, modo)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+@contextmanager
+def trava_arquivo(diretorio: str, exclusiva: bool = True, nome: str = ARQUIVO_TRAVA):
+    """
+    Trava entre processos (flock) sobre `<diretorio>/<nome>` (por padrão `.trava`).
+    Exclusiva para escritas; compartilhada para leituras que não podem ver uma escrita pela metade.
+    Um segundo arquivo serve de portão: o escritor o segura enquanto espera, então
+    leitores novos não conseguem deixá-lo esperando para sempre.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(diretorio, exist_ok=True)
+    trava = os.path.join(diretorio, nome)
+    portao = os.path.join(diretorio, ARQUIVO_PORTAO if nome == ARQUIVO_TRAVA else f"{nome}_portao")
+    if exclusiva:
+        with _flock(portao, fcntl.LOCK_EX), _flock(trava, fcntl.LOCK_EX):
+            yield
+        return
+    with _flock(portao, fcntl.LOCK_EX):
+        arquivo = open(trava, "a")
+        fcntl.flock(arquivo, fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(arquivo, fcntl.LOCK_UN)
+        arquivo.close()
+
+def reservar_diretorio(diretorio: str):
+    """
+    Trava exclusiva sem espera sobre `<diretorio>/.trava_processo`, segura até o
+    processo sair. Devolve None se este processo ficou com a pasta, ou o pid de
+    quem já a segura.
+    """
+    if fcntl is None:
+        return None
+    diretorio = os.path.abspath(diretorio)
+    with _trava_reservas:
+        if diretorio in _reservas:
+            return None
+        os.makedirs(diretorio, exist_ok=True)
+        arquivo = open(os.path.join(diretorio, ARQUIVO_PROCESSO), "a+")
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            arquivo.seek(0)
+            dono = arquivo.read().strip() or "desconhecido"
+            arquivo.close()
+            return dono
+        arquivo.truncate(0)
+        arquivo.write(str(os.getpid()))
+        arquivo.flush()
+        _reservas[diretorio] = arquivo
+        return None
+
+@contextmanager
+def tentar_trava(caminho: str):
+    """Trava exclusiva sem espera: devolve False se outro processo já a segura."""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "a") as arquivo:
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
 
 def get_vector_count(vector_store):
     """
     Retorna a contagem de documentos no Vector Store de forma segura.
     Tenta usar métodos internos mais rápidos, com fallback para métodos públicos.
     """
+    # Índice NumPy mantém o total no manifesto
+    contar = getattr(vector_store, "contar", None)
+    if contar is not None:
+        return contar()
     try:
         # Tenta usar a API interna do Chroma (mais rápida: O(1))
         return vector_store._collection.count()
     except Exception as e:
-        # Se for erro de dimensão, propaga para ser tratado e limpar o banco
+        # Se for erro de dimensão, propaga para ser tratado (reconstrução do índice)
         if "dimension" in str(e).lower():
             raise
         try:
@@ -23,21 +119,3 @@ def get_vector_count(vector_store):
             return len(vector_store.get()['ids'])
         except Exception:
             return 0
-
-def limpar_chroma_db():
-    """
-    Reseta o diretório do ChromaDB com segurança.
-    Remove toda a pasta e recria, garantindo um estado limpo.
-    """
-    if os.path.exists(CHROMA_DIR):
-        logger.warning(f"🧹 Resetando base vetorial: {CHROMA_DIR}")
-        try:
-            # Remove a árvore de diretórios recursivamente
-            shutil.rmtree(CHROMA_DIR)
-        except PermissionError:
-            logger.error("❌ Erro de permissão ao limpar ChromaDB. O arquivo pode estar em uso pelo sistema.")
-        except Exception as e:
-            logger.error(f"❌ Erro ao limpar ChromaDB: {e}")
-    
-    # Recria o diretório vazio
-    os.makedirs(CHROMA_DIR, exist_ok=True)
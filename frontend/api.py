@@ -1,12 +1,17 @@
+import threading
+from collections import OrderedDict
 import requests
 import streamlit as st
 from typing import Optional, Dict, Any, Tuple
-from .config import BACKEND_URL, TIMEOUT, Rotas
+from .config import BACKEND_URL, TIMEOUT, CACHE_LISTAS_MAX, Rotas
 
 class ClienteAPI:
     def __init__(self):
         self.session = requests.Session()
         self.base_url = BACKEND_URL
+        # (token, endpoint) -> {"etag", "itens"}; compartilhado entre as sessões do Streamlit
+        self._cache_listas = OrderedDict()
+        self._trava_cache = threading.Lock()
 
     def _obter_cabecalhos(self, token: Optional[str] = None) -> Dict[str, str]:
         headers = {}
@@ -53,6 +58,56 @@ class ClienteAPI:
         except requests.exceptions.RequestException as e:
             raise Exception(f"Falha de conexão com o backend: {str(e)}")
 
+    def _sincronizar_lista(self, endpoint: str, token: Optional[str] = None, recentes_primeiro: bool = False):
+        """
+        Lista que só cresce (conversas, mensagens): pede ao backend apenas os
+        itens depois do último id em cache, revalidando com If-None-Match.
+        Se a contagem do servidor não bater com cache + delta, baixa tudo de novo.
+        """
+        chave = (token or st.session_state.get("token"), endpoint)
+        with self._trava_cache:
+            cache = self._cache_listas.get(chave)
+        headers, params = {}, {}
+        if cache:
+            headers["If-None-Match"] = cache["etag"]
+            if cache["itens"]:
+                params["since_id"] = max(item["id"] for item in cache["itens"])
+
+        url = f"{self.base_url}{endpoint}"
+        try:
+            response = self.session.get(
+                url, headers={**self._obter_cabecalhos(token), **headers}, params=params, timeout=TIMEOUT
+            )
+            if response.status_code == 304 and cache:
+                return cache["itens"]
+            novos = self._tratar_resposta(response)
+            if isinstance(novos, dict):
+                return novos
+            itens = (cache["itens"] if cache else []) + novos
+            total = response.headers.get("X-Total-Count")
+            if params and total is not None and int(total) != len(itens):
+                response = self.session.get(url, headers=self._obter_cabecalhos(token), timeout=TIMEOUT)
+                itens = self._tratar_resposta(response)
+                if isinstance(itens, dict):
+                    return itens
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Falha de conexão com o backend: {str(e)}")
+
+        itens = sorted(itens, key=lambda item: (item["criado_em"], item["id"]), reverse=recentes_primeiro)
+        etag = response.headers.get("ETag")
+        with self._trava_cache:
+            if etag:
+                self._cache_listas[chave] = {"etag": etag, "itens": itens}
+                self._cache_listas.move_to_end(chave)
+                while len(self._cache_listas) > CACHE_LISTAS_MAX:
+                    self._cache_listas.popitem(last=False)
+        return itens
+
+    def limpar_cache(self, token: Optional[str] = None):
+        with self._trava_cache:
+            for chave in [chave for chave in self._cache_listas if chave[0] == token]:
+                del self._cache_listas[chave]
+
     def login(self, username, password) -> Tuple[Optional[str], Optional[str]]:
         try:
             data = self.requisitar("POST", Rotas.LOGIN, data={"username": username, "password": password})
@@ -79,10 +134,10 @@ class ClienteAPI:
         return self.requisitar("GET", Rotas.DOCUMENTOS, token=token)
 
     def obter_conversas(self, token):
-        return self.requisitar("GET", Rotas.CONVERSAS, token=token)
+        return self._sincronizar_lista(Rotas.CONVERSAS, token=token, recentes_primeiro=True)
 
     def obter_mensagens(self, conversa_id):
-        return self.requisitar("GET", f"/conversas/{conversa_id}/mensagens/")
+        return self._sincronizar_lista(f"/conversas/{conversa_id}/mensagens/")
 
     def enviar_documento(self, files):
         return self.requisitar("POST", Rotas.CARREGAR, files=files)
@@ -2,6 +2,8 @@ import os
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
 TIMEOUT = 300
+# Listas de conversas/mensagens guardadas pelo ClienteAPI para buscar só o que mudou
+CACHE_LISTAS_MAX = int(os.getenv("CACHE_LISTAS_MAX", "500"))
 
 class Rotas:
     LOGIN = "/token"
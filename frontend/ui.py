@@ -50,15 +50,12 @@ def renderizar_login_registro():
 def obter_documentos_cache(token):
     return api.obter_documentos(token)
 
-@st.cache_data(ttl=30)
-def obter_conversas_cache(token):
-    return api.obter_conversas(token)
-
 def renderizar_barra_lateral():
     with st.sidebar:
         st.title("📄 Painel")
         st.write(f"Logado como: **{st.session_state.user_name}**")
         if st.button("Sair"):
+            api.limpar_cache(st.session_state.token)
             resetar_estado_sessao()
             st.rerun()
         
@@ -108,7 +105,8 @@ def renderizar_barra_lateral():
             st.rerun()
 
         try:
-            conversas = obter_conversas_cache(st.session_state.token)
+            # A cada rerun só revalida (304) ou traz as conversas novas
+            conversas = api.obter_conversas(st.session_state.token)
             for conv in conversas:
                 label = f"{conv['titulo']} ({conv['criado_em'][:10]})"
                 if st.button(label, key=conv["id"]):